@@ -0,0 +1,58 @@
+# 打开大文件的耗时和内存: FileTokenStorage(整个json解析) 与 IndexedFileTokenStorage(mmap索引, 按需解析) 对比
+# 用法: python benchmarks/indexed_file_storage_bench.py
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import FileTokenStorage, IndexedFileTokenStorage, TokenData
+
+N_TOKENS = 200000
+LOOKUPS = 10000
+
+
+def measure(make):
+    tracemalloc.start()
+    start = time.perf_counter()
+    storage = make()
+    open_time = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    tokens = [f"token_{random.randrange(N_TOKENS)}" for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for token in tokens:
+        storage.get_token(token)
+    lookup_time = time.perf_counter() - start
+    storage.close()
+    return open_time, LOOKUPS / lookup_time, peak / 1024 / 1024
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        json_path = os.path.join(tmp, "tokens.json")
+        storage = FileTokenStorage(json_path)
+        storage.save_tokens([TokenData(token=f"token_{i}", quota=100) for i in range(N_TOKENS)])
+        storage.close()
+        # 打开json文件时自动转换为索引文件
+        idx_path = os.path.join(tmp, "tokens.idx")
+        shutil.copy(json_path, idx_path)
+        IndexedFileTokenStorage(idx_path).close()
+
+        print(f"{'storage':>24} {'open s':>8} {'lookups/s':>10} {'open MB':>8}")
+        for name, make in (
+            ("FileTokenStorage", lambda: FileTokenStorage(json_path)),
+            ("IndexedFileTokenStorage", lambda: IndexedFileTokenStorage(idx_path)),
+        ):
+            open_time, lookups, peak = measure(make)
+            print(f"{name:>24} {open_time:>8.3f} {lookups:>10,.0f} {peak:>8.1f}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# MemoryTokenStorage 多线程扣减quota的吞吐: 单分片(一把全局锁)与多分片对比
+# 用法: python benchmarks/memory_storage_bench.py
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import MemoryTokenStorage, TokenData
+
+OPS_PER_THREAD = 50000
+
+
+def run(shards: int, n_threads: int) -> float:
+    storage = MemoryTokenStorage(shards=shards)
+    # 每个线程操作各自的token
+    tokens = [f"token{i}" for i in range(n_threads)]
+    storage.save_tokens([TokenData(token=t, quota=OPS_PER_THREAD) for t in tokens])
+    barrier = threading.Barrier(n_threads + 1)
+
+    def worker(token):
+        barrier.wait()
+        consume = storage.consume_quota
+        for _ in range(OPS_PER_THREAD):
+            consume(token, 1)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in tokens]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert all(storage.get_token(t).r_quota == 0 for t in tokens)
+    return n_threads * OPS_PER_THREAD / elapsed
+
+
+def main():
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    print(f"{'threads':>7} {'1 shard ops/s':>14} {'16 shards ops/s':>16}")
+    for n_threads in (1, 2, 4, 8, 16):
+        print(f"{n_threads:>7} {run(1, n_threads):>14,.0f} {run(16, n_threads):>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# TokenData序列化吞吐: JSONTokenSerializer 与 BinaryTokenSerializer 对比
+# 用法: python benchmarks/serializer_bench.py
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import BinaryTokenSerializer, JSONTokenSerializer, TokenData
+
+N_TOKENS = 100000
+
+
+def make_tokens():
+    now = datetime.now()
+    tokens = []
+    for i in range(N_TOKENS):
+        tokens.append(TokenData(
+            token=f"token_{i:08d}",
+            token_type="api",
+            # 一半的token带ext和过期时间
+            ext={"user_id": i} if i % 2 else None,
+            expires_at=now + timedelta(days=1) if i % 2 else None,
+            quota=1000,
+        ))
+    return tokens
+
+
+def main():
+    tokens = make_tokens()
+    print(f"{'serializer':>20} {'size MB':>8} {'encode tokens/s':>16} {'decode tokens/s':>16}")
+    for name, serializer in (
+        ("json", JSONTokenSerializer()),
+        # 安装了msgpack时ext使用msgpack
+        (f"binary(ext={BinaryTokenSerializer().ext_codec})", BinaryTokenSerializer()),
+    ):
+        start = time.perf_counter()
+        data = serializer.dumps(tokens)
+        encode = N_TOKENS / (time.perf_counter() - start)
+        start = time.perf_counter()
+        serializer.loads(data)
+        decode = N_TOKENS / (time.perf_counter() - start)
+        print(f"{name:>20} {len(data) / 1024 / 1024:>8.1f} {encode:>16,.0f} {decode:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# SQLAlchemyTokenStorage 吞吐量: 改造前的ORM Session实现与预构造Core语句实现对比
+# 用法: python benchmarks/sqlalchemy_storage_bench.py [每项操作次数, 默认2000]
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from src.pytokenx import SQLAlchemyTokenStorage, TokenData
+from src.pytokenx.sqlalchemy_storage import TokenModel
+
+
+class LegacySQLAlchemyTokenStorage:
+    """改造前的实现: 每次操作新建Session并构造ORM查询"""
+
+    def __init__(self, engine):
+        self.Session = sessionmaker(bind=engine)
+
+    def get_token(self, token):
+        session = self.Session()
+        token_model = session.query(TokenModel).filter_by(token=token).first()
+        session.close()
+        return token_model.to_token_data() if token_model else None
+
+    def add_quota(self, token, quota_delta):
+        session = self.Session()
+        session.query(TokenModel).filter_by(token=token).update({TokenModel.r_quota: TokenModel.r_quota + quota_delta})
+        session.commit()
+        session.close()
+
+
+def make_engine(url):
+    if url == "sqlite://":
+        # 内存数据库需要一直使用同一个连接
+        return create_engine(url, poolclass=StaticPool)
+    return create_engine(url, pool_size=8)
+
+
+def ops_per_sec(func, tokens, threads):
+    start = time.perf_counter()
+    if threads == 1:
+        for token in tokens:
+            func(token)
+    else:
+        with ThreadPoolExecutor(threads) as pool:
+            list(pool.map(func, tokens))
+    return len(tokens) / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tmp_dir = tempfile.mkdtemp()
+    # 内存数据库只有一个共享连接, 不能并发使用, 只测单线程
+    targets = [
+        ("memory", "sqlite://", (1,)),
+        ("file", f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", (1, 8)),
+    ]
+    print(f"{'db':>6} {'threads':>7} {'op':>10} {'legacy ops/s':>13} {'core ops/s':>11}")
+    for name, url, thread_counts in targets:
+        engine = make_engine(url)
+        storage = SQLAlchemyTokenStorage(engine=engine)
+        legacy = LegacySQLAlchemyTokenStorage(engine)
+        tokens = [f"bench_token_{i}" for i in range(n)]
+        storage.save_tokens([TokenData(token=t, quota=10 ** 9, ext={"user_id": t}) for t in tokens])
+        for threads in thread_counts:
+            for op, legacy_func, new_func in (
+                ("get_token", legacy.get_token, storage.get_token),
+                ("add_quota", lambda t: legacy.add_quota(t, -1), lambda t: storage.add_quota(t, -1)),
+            ):
+                before = ops_per_sec(legacy_func, tokens, threads)
+                after = ops_per_sec(new_func, tokens, threads)
+                print(f"{name:>6} {threads:>7} {op:>10} {before:>13.0f} {after:>11.0f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
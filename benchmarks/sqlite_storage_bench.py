@@ -0,0 +1,56 @@
+# 带quota的validate_token吞吐: SQLAlchemyTokenStorage(sqlite, 默认回滚日志) 与 SQLiteTokenStorage(WAL) 对比
+# 用法: python benchmarks/sqlite_storage_bench.py
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import SQLAlchemyTokenStorage, SQLiteTokenStorage, TokenManager
+
+N_TOKENS = 100
+OPS = 2000
+
+
+def run(storage, n_threads: int) -> float:
+    manager = TokenManager(storage)
+    tokens = manager.generate_tokens(N_TOKENS, quota=10 ** 9)
+    ops_per_thread = OPS // n_threads
+
+    def worker(i):
+        for j in range(ops_per_thread):
+            manager.validate_token(tokens[(i + j) % N_TOKENS])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    storage.close()
+    return ops_per_thread * n_threads / elapsed
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        print(f"{'threads':>7} {'sqlalchemy ops/s':>17} {'sqlite3 NORMAL ops/s':>21} {'sqlite3 FULL ops/s':>19}")
+        for n_threads in (1, 4):
+            results = []
+            for i, make in enumerate((
+                lambda p: SQLAlchemyTokenStorage(f"sqlite:///{p}"),
+                lambda p: SQLiteTokenStorage(p),
+                lambda p: SQLiteTokenStorage(p, synchronous="FULL"),
+            )):
+                path = os.path.join(tmp, f"bench_{n_threads}_{i}.db")
+                results.append(run(make(path), n_threads))
+            print(f"{n_threads:>7} {results[0]:>17,.0f} {results[1]:>21,.0f} {results[2]:>19,.0f}")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
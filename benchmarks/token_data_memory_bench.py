@@ -0,0 +1,67 @@
+# TokenData 内存占用: 旧的 dataclass 表示与 __slots__ 表示对比
+# 用法: python benchmarks/token_data_memory_bench.py [token数量, 默认1000000]
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import TokenData
+from src.pytokenx.base import QUOTA_UNLIMITED
+
+
+@dataclass
+class LegacyTokenData:
+    """改造前的 TokenData: 普通dataclass, datetime对象, 每个实例一个ext dict"""
+    token: str
+    token_type: str = "default"
+    ext: Dict = field(default_factory=dict)
+    created_at: datetime = field(default_factory=datetime.now)
+    expires_at: Optional[datetime] = None
+    deleted_at: Optional[datetime] = None
+    quota: int = QUOTA_UNLIMITED
+    r_quota: int = 0
+
+
+def measure(factory, n: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    tokens = {}
+    for i in range(n):
+        token = f"{i:016d}"
+        tokens[token] = factory(token)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # 减去token字符串和dict本身的开销, 只统计TokenData
+    gc.collect()
+    tracemalloc.start()
+    keys = {f"{i:016d}": None for i in range(n)}
+    base, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tokens, keys
+    return (size - base) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    now = datetime.now()
+    expires_at = now + timedelta(days=1)
+
+    legacy = measure(
+        lambda t: LegacyTokenData(token=t, created_at=now + timedelta(microseconds=1), expires_at=expires_at + timedelta(microseconds=1), quota=100, r_quota=100),
+        n,
+    )
+    slotted = measure(
+        lambda t: TokenData(token=t, created_at=now + timedelta(microseconds=1), expires_at=expires_at + timedelta(microseconds=1), quota=100),
+        n,
+    )
+    print(f"tokens: {n}")
+    print(f"legacy dataclass: {legacy:8.1f} bytes/token  {legacy * n / 1024 / 1024:8.1f} MiB")
+    print(f"slotted:          {slotted:8.1f} bytes/token  {slotted * n / 1024 / 1024:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
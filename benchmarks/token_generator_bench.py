@@ -0,0 +1,39 @@
+# token生成: 原来逐字符 secrets.choice 与批量取随机数的生成器对比
+# 用法: python benchmarks/token_generator_bench.py
+import os
+import secrets
+import string
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import AlphabetTokenGenerator, Base64TokenGenerator
+
+ALPHABET = string.ascii_letters + string.digits
+
+
+def choice_token(length: int) -> str:
+    return "".join(secrets.choice(ALPHABET) for _ in range(length))
+
+
+def bench(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    base62 = AlphabetTokenGenerator()
+    pooled = AlphabetTokenGenerator(pool_size=1000)
+    b64 = Base64TokenGenerator()
+    print(f"{'length':>6} {'choice us':>10} {'base62 us':>10} {'pooled us':>10} {'base64 us':>10} {'bulk/1000 us':>13}")
+    for length in (16, 32, 64):
+        number = 20000
+        choice_us = bench(lambda: choice_token(length), number)
+        base62_us = bench(lambda: base62.generate(length), number)
+        pooled_us = bench(lambda: pooled.generate(length), number)
+        b64_us = bench(lambda: b64.generate(length), number)
+        bulk_us = bench(lambda: base62.generate_many(1000, length), 50) / 1000
+        print(f"{length:>6} {choice_us:>10.2f} {base62_us:>10.2f} {pooled_us:>10.2f} {b64_us:>10.2f} {bulk_us:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
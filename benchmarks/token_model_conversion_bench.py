@@ -0,0 +1,81 @@
+# TokenModel <-> TokenData 转换开销: 每次反射字段的旧实现与预计算映射对比, 以及Core结果行直接构造TokenData
+# 用法: python benchmarks/token_model_conversion_bench.py [行数, 默认10000]
+from datetime import datetime, timedelta
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.pytokenx import SQLAlchemyTokenStorage, TokenData
+from src.pytokenx.sqlalchemy_storage import TokenModel, token_statements
+
+
+def legacy_from_token_data(token_data):
+    """改造前: 每次转换都重新收集表的列名并逐个字段判断"""
+    model_fields = {c.name for c in TokenModel.__table__.columns}
+    init_data = {}
+    for field_name in TokenData.FIELDS:
+        if field_name in model_fields:
+            init_data[field_name] = getattr(token_data, field_name)
+    init_data["ext"] = token_data.ext
+    return TokenModel(**init_data)
+
+
+def legacy_to_token_data(model):
+    """改造前: 每次转换都逐个字段hasattr判断"""
+    init_data = {}
+    for field_name in TokenData.FIELDS:
+        if hasattr(model, field_name):
+            init_data[field_name] = getattr(model, field_name)
+        elif model.ext and field_name in model.ext:
+            init_data[field_name] = model.ext[field_name]
+    return TokenData(**init_data)
+
+
+def per_row_us(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    now = datetime.now()
+    token_data_list = [
+        TokenData(token=f"token_{i}", ext={"user_id": i}, created_at=now, expires_at=now + timedelta(days=1), quota=100)
+        for i in range(n)
+    ]
+    models = [TokenModel.from_token_data(t) for t in token_data_list]
+
+    print(f"rows: {n}")
+    print(f"{'conversion':<32} {'legacy us/row':>14} {'new us/row':>11}")
+    print(f"{'TokenData -> TokenModel':<32} {per_row_us(legacy_from_token_data, token_data_list):>14.2f} "
+          f"{per_row_us(TokenModel.from_token_data, token_data_list):>11.2f}")
+    print(f"{'TokenModel -> TokenData':<32} {per_row_us(legacy_to_token_data, models):>14.2f} "
+          f"{per_row_us(TokenModel.to_token_data, models):>11.2f}")
+
+    engine = create_engine("sqlite://")
+    storage = SQLAlchemyTokenStorage(engine=engine)
+    storage.save_tokens(token_data_list)
+    Session = sessionmaker(bind=engine)
+
+    start = time.perf_counter()
+    session = Session()
+    orm_result = [legacy_to_token_data(m) for m in session.query(TokenModel)]
+    session.close()
+    orm_us = (time.perf_counter() - start) / n * 1e6
+
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        core_result = [token_statements.to_token_data(row) for row in conn.execute(token_statements.select_all)]
+    core_us = (time.perf_counter() - start) / n * 1e6
+    assert len(orm_result) == len(core_result) == n
+    print(f"{'query + convert (ORM vs row)':<32} {orm_us:>14.2f} {core_us:>11.2f}")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
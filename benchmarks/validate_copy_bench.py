@@ -0,0 +1,55 @@
+# validate_token 中 token数据拷贝的开销: copy.deepcopy 与 TokenData.snapshot 对比
+# 用法: python benchmarks/validate_copy_bench.py
+import copy
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import TokenManager, TokenStorage
+
+
+class DictTokenStorage(TokenStorage):
+    def __init__(self):
+        self.tokens = {}
+
+    def save_token(self, token_data):
+        self.tokens[token_data.token] = token_data
+
+    def get_token(self, token):
+        return self.tokens.get(token)
+
+    def delete_token(self, token):
+        self.tokens.pop(token, None)
+
+    def update_token(self, token_data):
+        self.tokens[token_data.token] = token_data
+
+    def add_quota(self, token, quota_delta):
+        self.tokens[token].r_quota += quota_delta
+
+
+def make_ext(n: int) -> dict:
+    return {f"key{i}": {"id": i, "tags": ["a", "b", "c"], "name": f"value{i}"} for i in range(n)}
+
+
+def bench(stmt, number: int) -> float:
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    manager = TokenManager(DictTokenStorage())
+    print(f"{'ext keys':>8} {'ext bytes':>10} {'deepcopy us':>12} {'snapshot us':>12} {'validate us':>12}")
+    for n in (0, 10, 100, 1000):
+        token = manager.generate_token(**make_ext(n))
+        token_data = manager.get_token_data(token)
+        size = len(str(token_data.ext))
+        number = 20000 if n <= 10 else 2000 if n <= 100 else 200
+        deepcopy_us = bench(lambda: copy.deepcopy(token_data), number)
+        snapshot_us = bench(token_data.snapshot, number)
+        validate_us = bench(lambda: manager.validate_token(token), number)
+        print(f"{n:>8} {size:>10} {deepcopy_us:>12.2f} {snapshot_us:>12.2f} {validate_us:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
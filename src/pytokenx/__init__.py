@@ -5,20 +5,97 @@ from .base import (
     token_validator,
     flask_token_validator,
     TokenInvalidError,
+    TokenRateLimitError,
 )
 
+from .token_generator import TokenGenerator, AlphabetTokenGenerator, Base64TokenGenerator, ChecksumTokenGenerator
+
+from .reaper import TokenReaper
+
+from .rate_limit import RateLimit, RateLimiter, MemoryRateLimiter, RedisRateLimiter
+
+from .serializer import TokenSerializer, JSONTokenSerializer, BinaryTokenSerializer
+
+from .memory_storage import MemoryTokenStorage
+
 from .file_storage import FileTokenStorage
 
-from .sqlalchemy_storage import SQLAlchemyTokenStorage
+from .wal_storage import WALFileTokenStorage
+
+from .write_behind_storage import WriteBehindTokenStorage
+
+from .cache_storage import CachingTokenStorage
+
+from .bloom_storage import BloomFilterTokenStorage
+
+from .signed_token import TokenSigner
+
+from .sqlite_storage import SQLiteTokenStorage
+
+from .shm_storage import MmapTokenStorage
+
+from .indexed_file_storage import IndexedFileTokenStorage
+
+from .async_base import (
+    AsyncTokenManager,
+    AsyncTokenStorage,
+    SyncStorageAdapter,
+    async_token_validator,
+)
+
+# 依赖SQLAlchemy、redis的存储在第一次访问时才导入, import pytokenx 时不加载这些依赖
+_LAZY_IMPORTS = {
+    "SQLAlchemyTokenStorage": ".sqlalchemy_storage",
+    "RedisTokenStorage": ".redis_storage",
+    "AsyncSQLAlchemyTokenStorage": ".async_sqlalchemy_storage",
+}
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
 
 
 __all__ = [
     "TokenManager",
     "TokenData",
     "TokenStorage",
+    "MemoryTokenStorage",
     "FileTokenStorage",
+    "WALFileTokenStorage",
     "SQLAlchemyTokenStorage",
+    "RedisTokenStorage",
+    "SQLiteTokenStorage",
+    "MmapTokenStorage",
+    "IndexedFileTokenStorage",
+    "TokenSerializer",
+    "JSONTokenSerializer",
+    "BinaryTokenSerializer",
+    "WriteBehindTokenStorage",
+    "CachingTokenStorage",
+    "BloomFilterTokenStorage",
+    "TokenSigner",
+    "TokenReaper",
+    "TokenGenerator",
+    "AlphabetTokenGenerator",
+    "Base64TokenGenerator",
+    "ChecksumTokenGenerator",
+    "AsyncTokenManager",
+    "AsyncTokenStorage",
+    "SyncStorageAdapter",
+    "AsyncSQLAlchemyTokenStorage",
     "token_validator",
+    "async_token_validator",
     "flask_token_validator",
     "TokenInvalidError",
+    "TokenRateLimitError",
+    "RateLimit",
+    "RateLimiter",
+    "MemoryRateLimiter",
+    "RedisRateLimiter",
 ]
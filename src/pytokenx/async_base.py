@@ -0,0 +1,380 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from functools import partial, wraps
+from typing import Callable, Dict, List, Optional, Union
+import asyncio
+import time
+
+from .base import (
+    QUOTA_UNLIMITED,
+    BaseTokenManager,
+    TokenConflictError,
+    TokenData,
+    TokenInvalidError,
+    TokenRateLimitError,
+    TokenStorage,
+    default_extract_token_func,
+)
+from .rate_limit import RateLimit, RateLimiter
+from .token_generator import TokenGenerator
+
+
+class AsyncTokenStorage(ABC):
+    """
+    异步存储接口, 方法与 TokenStorage 一一对应
+    """
+
+    @abstractmethod
+    async def save_token(self, token_data: TokenData) -> None:
+        '''
+        自行处理token冲突处理逻辑
+
+        raise TokenConflictError
+        '''
+        pass
+
+    @abstractmethod
+    async def get_token(self, token: str) -> Optional[TokenData]:
+        pass
+
+    @abstractmethod
+    async def delete_token(self, token: str) -> None:
+        pass
+
+    @abstractmethod
+    async def update_token(self, token_data: TokenData) -> None:
+        pass
+
+    @abstractmethod
+    async def add_quota(self, token: str, quota_delta: int) -> None:
+        pass
+
+    async def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        '''
+        原子地检查并扣除quota, 语义同 TokenStorage.consume_quota
+        '''
+        return None
+
+    async def consume_quotas(self, costs: Dict[str, int]) -> Optional[Dict[str, bool]]:
+        '''
+        批量条件扣除quota, 语义同 TokenStorage.consume_quotas
+        '''
+        result = {}
+        for token, cost in costs.items():
+            consumed = await self.consume_quota(token, cost)
+            if consumed is None:
+                return None
+            result[token] = consumed
+        return result
+
+    async def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        '''
+        批量获取token, 只返回存在的token
+        '''
+        result = {}
+        for token in tokens:
+            token_data = await self.get_token(token)
+            if token_data:
+                result[token] = token_data
+        return result
+
+    async def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        '''
+        批量保存token
+        '''
+        for token_data in token_data_list:
+            await self.save_token(token_data)
+
+    async def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        '''
+        批量修改quota, token -> quota增量
+        '''
+        for token, quota_delta in quota_deltas.items():
+            await self.add_quota(token, quota_delta)
+
+    async def purge_expired(self, cutoff: float, limit: int) -> int:
+        '''
+        永久删除过期时间或删除时间不晚于cutoff(epoch秒)的token, 语义同 TokenStorage.purge_expired
+        '''
+        raise NotImplementedError("purge_expired is not supported by this storage")
+
+    async def close(self) -> None:
+        pass
+
+
+class SyncStorageAdapter(AsyncTokenStorage):
+    """
+    把同步的 TokenStorage 包装成 AsyncTokenStorage, 存储操作在线程池中执行, 不阻塞事件循环
+    """
+
+    def __init__(self, storage: TokenStorage, executor=None):
+        self.storage = storage
+        self.executor = executor
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
+
+    async def save_token(self, token_data: TokenData) -> None:
+        await self._run(self.storage.save_token, token_data)
+
+    async def get_token(self, token: str) -> Optional[TokenData]:
+        return await self._run(self.storage.get_token, token)
+
+    async def delete_token(self, token: str) -> None:
+        await self._run(self.storage.delete_token, token)
+
+    async def update_token(self, token_data: TokenData) -> None:
+        await self._run(self.storage.update_token, token_data)
+
+    async def add_quota(self, token: str, quota_delta: int) -> None:
+        await self._run(self.storage.add_quota, token, quota_delta)
+
+    async def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        return await self._run(self.storage.consume_quota, token, cost)
+
+    async def consume_quotas(self, costs: Dict[str, int]) -> Optional[Dict[str, bool]]:
+        return await self._run(self.storage.consume_quotas, costs)
+
+    async def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        return await self._run(self.storage.get_tokens, tokens)
+
+    async def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        await self._run(self.storage.save_tokens, token_data_list)
+
+    async def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        await self._run(self.storage.add_quotas, quota_deltas)
+
+    async def purge_expired(self, cutoff: float, limit: int) -> int:
+        return await self._run(self.storage.purge_expired, cutoff, limit)
+
+    async def close(self) -> None:
+        await self._run(self.storage.close)
+
+
+class AsyncTokenManager(BaseTokenManager):
+    """
+    TokenManager 的asyncio版本, 当前token保存在contextvars中, 每个task互相隔离
+    """
+
+    def __init__(
+        self,
+        storage: AsyncTokenStorage,
+        token_length: int = 16,
+        quota: int = QUOTA_UNLIMITED, # token使用额度管理。
+        default_expiry: Optional[timedelta] = None, # token过期时间
+        token_generator: Optional[TokenGenerator] = None, # token生成器, 默认base62
+        signer=None, # TokenSigner, 设置后签发签名token
+        revocation_ttl: Optional[float] = 60, # 签名token吊销状态的缓存时间(秒), None表示不检查吊销
+        rate_limits: Optional[Dict[str, RateLimit]] = None, # token_type -> 每个token的速率限制
+        rate_limiter: Optional[RateLimiter] = None, # 限速状态, 调用是同步的, RedisRateLimiter 会短暂阻塞事件循环
+    ):
+        super().__init__(
+            storage, token_length, quota, default_expiry, token_generator, signer, revocation_ttl,
+            rate_limits, rate_limiter,
+        )
+
+    async def generate_token(
+        self,
+        token_type: str = "default",  # token类型
+        expiry: Optional[timedelta] = None,  # 过期时间
+        quota: int = QUOTA_UNLIMITED, # 限额
+        quota_period: Optional[Union[int, timedelta]] = None, # quota重置周期, 如 timedelta(days=1)
+        **kwargs # 额外数据
+    ) -> str:
+        """
+        生成token， 可以限制token类型，过期时间，额外数据, quota
+        """
+        if self.signer is not None:
+            token_data = self._new_signed_token_data(token_type, expiry, quota, kwargs, quota_period=quota_period)
+            await self.storage.save_token(token_data)
+            return token_data.token
+        while True:
+            token = self._generate_token0(self.token_length, token_type)
+            if not await self.storage.get_token(token):
+                break
+        token_data = self._new_token_data(token, token_type, expiry, quota, kwargs, quota_period=quota_period)
+        try:
+            await self.storage.save_token(token_data)
+        except TokenConflictError:
+            return await self.generate_token(token_type, expiry, quota, quota_period, **kwargs)
+        return token
+
+    async def generate_tokens(
+        self,
+        n: int,
+        token_type: str = "default",  # token类型
+        expiry: Optional[timedelta] = None,  # 过期时间
+        quota: int = QUOTA_UNLIMITED, # 限额
+        quota_period: Optional[Union[int, timedelta]] = None, # quota重置周期, 如 timedelta(days=1)
+        **kwargs # 额外数据
+    ) -> List[str]:
+        """
+        批量生成n个token, 参数同generate_token
+        """
+        if self.signer is not None:
+            now = datetime.now()
+            token_data_list = [
+                self._new_signed_token_data(token_type, expiry, quota, dict(kwargs), now, quota_period) for _ in range(n)
+            ]
+            await self.storage.save_tokens(token_data_list)
+            return [token_data.token for token_data in token_data_list]
+        tokens = set()
+        while len(tokens) < n:
+            candidates = set(self._generate_tokens0(n - len(tokens), self.token_length, token_type))
+            candidates -= tokens
+            existing = await self.storage.get_tokens(list(candidates))
+            tokens.update(candidates.difference(existing))
+        tokens = list(tokens)
+
+        now = datetime.now()
+        await self.storage.save_tokens([
+            self._new_token_data(token, token_type, expiry, quota, dict(kwargs), now, quota_period)
+            for token in tokens
+        ])
+        return tokens
+
+    async def validate_token(self, token: str,
+                             token_type: str = "default",
+                             cost_quota: int = 1, # 消耗quota
+                             deduct_quota: bool = True # 是否在验证成功后扣除
+                             ) -> TokenData:
+        """
+        验证token
+        return token数据的快照, 其中ext(生成token时传入的额外数据)是只读的
+        raise TokenInvalidError
+        """
+        now = time.time()
+        if self.signer is not None:
+            # 不限额的签名token只校验签名和过期时间, 不查询存储
+            token_data = self._validate_signed(token, token_type, now)
+            if token_data is not None:
+                if self.revocation_ttl is not None and await self._revoked(token, now):
+                    raise TokenInvalidError("Invalid token")
+                self._check_rate(token_data, now)
+                self.set_current_token_data(token_data)
+                return token_data
+        else:
+            self._precheck(token, token_type)
+        stored = await self.storage.get_token(token)
+        token_data, cost = self._evaluate(stored, token_type, cost_quota, deduct_quota, now)
+        if cost:
+            consumed = await self.storage.consume_quota(token, cost)
+            if consumed is None:
+                if token_data.quota_window != stored.quota_window:
+                    # 进入了新的quota周期, 写入重置并扣减后的数据
+                    await self.storage.update_token(self._thawed(token_data))
+                else:
+                    await self.deduct_quota(token, cost)
+            elif not consumed:
+                raise TokenInvalidError("Token quota exceeded")
+        try:
+            self._check_rate(token_data, now)
+        except TokenRateLimitError:
+            # 被限速时退还已扣除的quota
+            if cost:
+                await self.deduct_quota(token, -cost)
+            raise
+
+        self.set_current_token_data(token_data)
+        return token_data
+
+    async def validate_tokens(self, tokens: List[str],
+                              token_type: str = "default",
+                              cost_quota: int = 1, # 每个token消耗的quota
+                              deduct_quota: bool = True # 是否在验证成功后扣除
+                              ) -> List[Union[TokenData, TokenInvalidError]]:
+        """
+        批量验证token, 返回与tokens一一对应的列表, 验证通过为token数据的快照, 失败为TokenInvalidError
+        """
+        found = await self.storage.get_tokens(self._lookup_tokens(tokens, token_type))
+        results, deltas, refilled = self._evaluate_batch(tokens, found, token_type, cost_quota, deduct_quota)
+        if deltas:
+            consumed = await self.storage.consume_quotas({token: -delta for token, delta in deltas.items()})
+            if consumed is not None:
+                self._reject_unconsumed(tokens, results, consumed)
+            else:
+                for token_data in refilled:
+                    await self.storage.update_token(self._thawed(token_data))
+                    del deltas[token_data.token]
+                if deltas:
+                    await self.storage.add_quotas(deltas)
+        refunds = self._check_rates(results, cost_quota, deduct_quota)
+        if refunds:
+            await self.storage.add_quotas(refunds)
+        return results
+
+    async def _revoked(self, token: str, now: float) -> bool:
+        revoked = self._cached_revocation(token)
+        if revoked is None:
+            revoked = self._is_revoked(await self.storage.get_token(token), now)
+            self._cache_revocation(token, revoked)
+        return revoked
+
+    async def get_token_data(self, token: str) -> Optional[TokenData]:
+        """
+        获取token数据
+        """
+        return await self.storage.get_token(token)
+
+    async def deduct_quota(self, token: str, quota_delta: int = 1):
+        """
+        操作token额度， 可以用于校验之后手动扣减，或者一些场景（执行失败）手动增加
+        """
+        await self.storage.add_quota(token, -quota_delta)
+
+    async def update_token(self, token_data: TokenData) -> None:
+        """
+        更新token中数据
+        """
+        await self.storage.update_token(token_data)
+
+    async def delete_token(self, token: str) -> None:
+        """
+        删除token
+        """
+        await self.storage.delete_token(token)
+        if self.signer is not None:
+            self._cache_revocation(token, True)
+
+    async def purge_expired(self, grace: timedelta = timedelta(0), batch_size: int = 1000) -> int:
+        """
+        分批永久删除过期或删除超过grace的token
+        return 删除的数量
+        """
+        cutoff = time.time() - grace.total_seconds()
+        total = 0
+        while True:
+            purged = await self.storage.purge_expired(cutoff, batch_size)
+            total += purged
+            if purged < batch_size:
+                return total
+
+    async def close(self) -> None:
+        """
+        关闭存储
+        """
+        await self.storage.close()
+
+
+# 通用token验证 装饰器, 用于async函数
+def async_token_validator(
+    token_manager: AsyncTokenManager,
+    token_type: str = "default",
+    cost_quota: int = 1,
+    deduct_quota: bool = True,
+    extract_token_func: Callable = default_extract_token_func,
+):
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(*args, **kwargs):
+            token = extract_token_func(*args, **kwargs)
+            if not token:
+                raise TokenInvalidError("No token provided")
+
+            await token_manager.validate_token(token, token_type, cost_quota, deduct_quota)
+            return await f(*args, **kwargs)
+
+        return decorated_function
+
+    return decorator
@@ -0,0 +1,131 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+import asyncio
+import time
+from .async_base import AsyncTokenStorage
+from .base import TokenData
+from .sqlalchemy_storage import sqlalchemy_installed
+
+async_sqlalchemy_installed = sqlalchemy_installed
+# 可选依赖
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from .sqlalchemy_storage import create_tables, token_statements
+except ImportError:
+    async_sqlalchemy_installed = False
+
+
+class AsyncSQLAlchemyTokenStorage(AsyncTokenStorage):
+    """
+    基于 create_async_engine 的异步存储, 例如 sqlite+aiosqlite:///tokens.db
+    表结构与 SQLAlchemyTokenStorage 相同, 首次访问时自动建表
+    """
+    BATCH_SIZE = 500 # 批量查询时每条SQL的最大token数
+
+    def __init__(self, connection_string: Optional[str] = None, engine=None, **engine_kwargs):
+        if not async_sqlalchemy_installed:
+            raise ImportError("SQLAlchemy asyncio extension is not installed")
+        if engine is None:
+            if connection_string is None:
+                raise ValueError("connection_string or engine is required")
+            self.engine = create_async_engine(connection_string, **engine_kwargs)
+            self._owns_engine = True
+        else:
+            self.engine = engine
+            self._owns_engine = False
+        self._stmts = token_statements
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
+
+    async def _ensure_tables(self) -> None:
+        if self._initialized:
+            return
+        async with self._init_lock:
+            if not self._initialized:
+                async with self.engine.begin() as conn:
+                    await conn.run_sync(create_tables)
+                self._initialized = True
+
+    async def _write(self, stmt, params):
+        await self._ensure_tables()
+        async with self.engine.begin() as conn:
+            return await conn.execute(stmt, params)
+
+    async def close(self) -> None:
+        if self._owns_engine:
+            await self.engine.dispose()
+
+    async def save_token(self, token_data: TokenData) -> None:
+        await self._write(self._stmts.insert, self._stmts.row_params(token_data))
+
+    async def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        if not token_data_list:
+            return
+        await self._write(self._stmts.insert, [self._stmts.row_params(t) for t in token_data_list])
+
+    async def get_token(self, token: str) -> Optional[TokenData]:
+        await self._ensure_tables()
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(self._stmts.select_one, {"_token": token})).first()
+        if row:
+            return self._stmts.to_token_data(row)
+        return None
+
+    async def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        await self._ensure_tables()
+        found = {}
+        async with self.engine.connect() as conn:
+            for i in range(0, len(tokens), self.BATCH_SIZE):
+                chunk = tokens[i:i + self.BATCH_SIZE]
+                for row in await conn.execute(self._stmts.select_many, {"_tokens": chunk}):
+                    token_data = self._stmts.to_token_data(row)
+                    found[token_data.token] = token_data
+        return found
+
+    async def delete_token(self, token: str) -> None:
+        await self._write(self._stmts.delete, {"_token": token, "_now": datetime.now()})
+
+    async def update_token(self, token_data: TokenData) -> None:
+        await self._write(self._stmts.update, self._stmts.update_params(token_data))
+
+    async def add_quota(self, token: str, quota_delta: int) -> None:
+        await self._write(self._stmts.add_quota, {"_token": token, "_delta": quota_delta, "_now_ts": int(time.time())})
+
+    async def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        now = time.time()
+        result = await self._write(
+            self._stmts.consume_quota,
+            {"_token": token, "_cost": cost, "_now": datetime.fromtimestamp(now), "_now_ts": int(now)},
+        )
+        return result.rowcount == 1
+
+    async def consume_quotas(self, costs: Dict[str, int]) -> Optional[Dict[str, bool]]:
+        await self._ensure_tables()
+        now = time.time()
+        params = {"_now": datetime.fromtimestamp(now), "_now_ts": int(now)}
+        result = {}
+        async with self.engine.begin() as conn:
+            for token, cost in costs.items():
+                rows = await conn.execute(self._stmts.consume_quota, {"_token": token, "_cost": cost, **params})
+                result[token] = rows.rowcount == 1
+        return result
+
+    async def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        if not quota_deltas:
+            return
+        now_ts = int(time.time())
+        await self._write(
+            self._stmts.add_quota,
+            [{"_token": token, "_delta": delta, "_now_ts": now_ts} for token, delta in quota_deltas.items()],
+        )
+
+    async def purge_expired(self, cutoff: float, limit: int) -> int:
+        await self._ensure_tables()
+        async with self.engine.begin() as conn:
+            ids = (await conn.execute(
+                self._stmts.purge_select,
+                {"_cutoff": datetime.fromtimestamp(cutoff), "_limit": limit},
+            )).scalars().all()
+            if ids:
+                await conn.execute(self._stmts.purge_delete, {"_ids": ids})
+        return len(ids)
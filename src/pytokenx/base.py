@@ -1,43 +1,168 @@
-from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-import secrets
-import string
 from abc import ABC, abstractmethod
-from typing import Callable, Optional, Dict
+from typing import Callable, Optional, Dict, Iterator, List, Tuple, Union
+from contextvars import ContextVar
 from functools import wraps
-import threading
 import copy
+import math
+import time
+
+from .rate_limit import MemoryRateLimiter, RateLimit, RateLimiter
+from .token_generator import AlphabetTokenGenerator, TokenGenerator
 
 QUOTA_UNLIMITED : int = float("-inf")
 
 
-@dataclass
+def _frozen_error(*args, **kwargs):
+    raise TypeError("ext is read-only, assign a new dict to token_data.ext instead")
+
+
+def _freeze(value):
+    if isinstance(value, (FrozenDict, FrozenList)):
+        return value
+    if isinstance(value, dict):
+        # 绕过 __init__, 标量值不调用函数, 减少快照的开销
+        frozen = dict.__new__(FrozenDict)
+        dict.update(frozen, {
+            k: _freeze(v) if isinstance(v, (dict, list)) else v for k, v in dict.items(value)
+        })
+        return frozen
+    if isinstance(value, list):
+        frozen = list.__new__(FrozenList)
+        list.extend(frozen, [_freeze(v) if isinstance(v, (dict, list)) else v for v in list.__iter__(value)])
+        return frozen
+    return value
+
+
+def _thaw(value):
+    """
+    还原为普通的可修改dict/list, 嵌套的容器都是新对象
+    """
+    if isinstance(value, dict):
+        return {k: _thaw(v) for k, v in dict.items(value)}
+    if isinstance(value, list):
+        return [_thaw(v) for v in list.__iter__(value)]
+    return value
+
+
+class FrozenDict(dict):
+    """
+    只读dict, 创建时嵌套的dict/list也包装成只读(只拷贝容器, 不拷贝其中的值)
+    dict(ext)、{**ext} 得到的浅拷贝中嵌套的容器仍然只读, 不会修改到存储中的数据;
+    需要修改时使用 ext.copy() 或 ext | {...}, 得到完全独立的普通dict
+    仍然是dict的子类, 可以直接json序列化
+    """
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _frozen_error
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, {k: _freeze(v) for k, v in dict(*args, **kwargs).items()})
+
+    def copy(self) -> Dict:
+        return _thaw(self)
+
+    def __or__(self, other):
+        result = _thaw(self)
+        result.update(other)
+        return result
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        # 深拷贝得到普通的可修改dict
+        return copy.deepcopy(_thaw(self), memo)
+
+
+class FrozenList(list):
+    """
+    只读list, 创建时嵌套的dict/list也包装成只读
+    """
+    __setitem__ = __delitem__ = append = extend = insert = pop = remove = clear = sort = reverse = _frozen_error
+    __iadd__ = __imul__ = _frozen_error
+
+    def __init__(self, iterable=()):
+        list.__init__(self, [_freeze(v) for v in iterable])
+
+    def __getitem__(self, index):
+        value = list.__getitem__(self, index)
+        if isinstance(index, slice):
+            return FrozenList(value)
+        return value
+
+    def copy(self) -> list:
+        return _thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(_thaw(self), memo)
+
+
+# 没有额外数据的token共享的空ext
+EMPTY_EXT = FrozenDict()
+
+
+def _to_ts(value: Optional[datetime]) -> Optional[float]:
+    return value.timestamp() if value is not None else None
+
+
+def _from_ts(ts: Optional[float], tz) -> Optional[datetime]:
+    return datetime.fromtimestamp(ts, tz) if ts is not None else None
+
+
+def quota_window_start(now: float, period: int) -> int:
+    """
+    now 所在quota周期的开始时间(epoch秒), 周期按UTC从1970-01-01起对齐, 例如按天的周期在UTC 0点开始
+    """
+    now = int(now)
+    return now - now % period
+
+
 class TokenData:
-    """Token data structure"""
-    token: str
-    token_type: str = "default"
-    ext: Dict = field(default_factory=dict)
-    created_at: datetime = field(default_factory=datetime.now)
-    expires_at: Optional[datetime] = None
-    deleted_at: Optional[datetime] = None
-    quota: int = QUOTA_UNLIMITED
-    r_quota: int = 0
-    
+    """
+    Token data structure
+
+    使用 __slots__, 时间字段在内部保存为epoch秒(float), 访问时再转换为datetime;
+    没有额外数据的token共享同一个只读的空ext。
+
+    quota_period 设置后quota按周期重置(秒, 例如86400为每天): quota_window 是 r_quota 所属周期的开始时间,
+    进入新的周期后, 第一次校验或扣减时 r_quota 恢复为 quota, 不需要定时任务。
+    """
+    FIELDS = (
+        "token", "token_type", "ext", "created_at", "expires_at", "deleted_at", "quota", "r_quota",
+        "quota_period", "quota_window",
+    )
+
+    __slots__ = (
+        "token", "token_type", "ext", "_created_at", "_expires_at", "_deleted_at", "quota", "r_quota", "_tz",
+        "quota_period", "quota_window",
+    )
+
     def __init__(
         self,
         token: str,
         token_type: str = "default",
-        ext: Dict = {},
-        created_at: datetime = datetime.now(),
+        ext: Optional[Dict] = None,
+        created_at: Optional[datetime] = None,
         expires_at: Optional[datetime] = None,
         deleted_at: Optional[datetime] = None,
         quota: int = QUOTA_UNLIMITED,
         r_quota: Optional[int] = None,
+        quota_period: Optional[Union[int, timedelta]] = None, # quota重置周期
+        quota_window: Optional[int] = None, # 当前quota周期的开始时间(epoch秒), 默认为创建时间所在的周期
     ):
         self.token = token
         self.token_type = token_type
-        self.ext = ext
-        self.created_at = created_at
+        self.ext = ext if ext else EMPTY_EXT
+        self._tz = None
+        self.created_at = created_at if created_at is not None else datetime.now()
         self.expires_at = expires_at  # 过期时间
         self.deleted_at = deleted_at  # 删除时间
         self.quota = quota # 总quota
@@ -45,6 +170,59 @@ class TokenData:
             self.r_quota = quota
         else:
             self.r_quota = r_quota # 剩余quota
+        if isinstance(quota_period, timedelta):
+            quota_period = int(quota_period.total_seconds())
+        if quota_period is not None and quota_period <= 0:
+            raise ValueError("quota_period must be positive")
+        self.quota_period = quota_period
+        if quota_period is not None and quota_window is None:
+            quota_window = quota_window_start(self._created_at, quota_period)
+        self.quota_window = quota_window
+
+    def _set_time(self, name: str, value: Optional[datetime]) -> None:
+        # 带时区的datetime按时区还原, 不带时区的按本地时间还原
+        if value is not None and value.tzinfo is not None:
+            self._tz = value.tzinfo
+        setattr(self, name, _to_ts(value))
+
+    @property
+    def created_at(self) -> datetime:
+        return _from_ts(self._created_at, self._tz)
+
+    @created_at.setter
+    def created_at(self, value: datetime) -> None:
+        self._set_time("_created_at", value)
+
+    @property
+    def expires_at(self) -> Optional[datetime]:
+        return _from_ts(self._expires_at, self._tz)
+
+    @expires_at.setter
+    def expires_at(self, value: Optional[datetime]) -> None:
+        self._set_time("_expires_at", value)
+
+    @property
+    def deleted_at(self) -> Optional[datetime]:
+        return _from_ts(self._deleted_at, self._tz)
+
+    @deleted_at.setter
+    def deleted_at(self, value: Optional[datetime]) -> None:
+        self._set_time("_deleted_at", value)
+
+    @property
+    def created_ts(self) -> float:
+        """创建时间, epoch秒"""
+        return self._created_at
+
+    @property
+    def expires_ts(self) -> Optional[float]:
+        """过期时间, epoch秒"""
+        return self._expires_at
+
+    @property
+    def deleted_ts(self) -> Optional[float]:
+        """删除时间, epoch秒"""
+        return self._deleted_at
 
     def to_dict(self) -> Dict:
         return {
@@ -52,10 +230,12 @@ class TokenData:
             "token_type": self.token_type,
             "ext": self.ext,
             "created_at": self.created_at.isoformat(),
-            "expires_at": self.expires_at.isoformat() if self.expires_at else None,
-            "deleted_at": self.deleted_at.isoformat() if self.deleted_at else None,
+            "expires_at": self.expires_at.isoformat() if self._expires_at is not None else None,
+            "deleted_at": self.deleted_at.isoformat() if self._deleted_at is not None else None,
             "quota": self.quota,
             "r_quota": self.r_quota,
+            "quota_period": self.quota_period,
+            "quota_window": self.quota_window,
         }
 
     @classmethod
@@ -77,14 +257,115 @@ class TokenData:
             ),
             quota=data["quota"],
             r_quota=data["r_quota"],
+            quota_period=data.get("quota_period"),
+            quota_window=data.get("quota_window"),
         )
-    
+
+    @classmethod
+    def from_ts(
+        cls,
+        token: str,
+        token_type: str,
+        ext: Optional[Dict],
+        created_ts: float,
+        expires_ts: Optional[float],
+        deleted_ts: Optional[float],
+        quota: int,
+        r_quota: int,
+        tz=None,
+        quota_period: Optional[int] = None,
+        quota_window: Optional[int] = None,
+    ) -> "TokenData":
+        """
+        由epoch秒直接构造, 不经过datetime转换, 用于反序列化
+        """
+        token_data = cls.__new__(cls)
+        token_data.token = token
+        token_data.token_type = token_type
+        token_data.ext = ext if ext else EMPTY_EXT
+        token_data._created_at = created_ts
+        token_data._expires_at = expires_ts
+        token_data._deleted_at = deleted_ts
+        token_data.quota = quota
+        token_data.r_quota = r_quota
+        token_data._tz = tz
+        token_data.quota_period = quota_period
+        token_data.quota_window = quota_window
+        return token_data
+
     def __getitem__(self, key):
         try:
             return getattr(self, key)
         except AttributeError:
             raise KeyError(f"'{key}' not found")
 
+    def _astuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return "TokenData(" + ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS) + ")"
+
+    def __copy__(self) -> "TokenData":
+        token_data = TokenData.__new__(TokenData)
+        token_data.token = self.token
+        token_data.token_type = self.token_type
+        token_data.ext = self.ext
+        token_data._created_at = self._created_at
+        token_data._expires_at = self._expires_at
+        token_data._deleted_at = self._deleted_at
+        token_data.quota = self.quota
+        token_data.r_quota = self.r_quota
+        token_data._tz = self._tz
+        token_data.quota_period = self.quota_period
+        token_data.quota_window = self.quota_window
+        return token_data
+
+    def __getstate__(self) -> tuple:
+        return self._astuple()
+
+    def __setstate__(self, state: tuple) -> None:
+        # 兼容没有quota周期字段的旧数据
+        self.quota_period = self.quota_window = None
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def is_active(self, now: Optional[float] = None) -> bool:
+        """
+        未删除且未过期
+        """
+        now = time.time() if now is None else now
+        if self._deleted_at is not None and now >= self._deleted_at:
+            return False
+        return self._expires_at is None or now < self._expires_at
+
+    def refill(self, now: Optional[float] = None) -> bool:
+        """
+        设置了quota周期且已进入新的周期时, r_quota 恢复为 quota, 返回是否重置
+        """
+        if self.quota_period is None:
+            return False
+        now = time.time() if now is None else now
+        if self.quota_window is not None and now < self.quota_window + self.quota_period:
+            return False
+        self.r_quota = self.quota
+        self.quota_window = quota_window_start(now, self.quota_period)
+        return True
+
+    def snapshot(self) -> "TokenData":
+        """
+        浅拷贝, ext替换为只读的 FrozenDict(嵌套的容器也只读), 修改快照不会影响存储中的数据
+        """
+        token_data = self.__copy__()
+        token_data.ext = _freeze(self.ext if self.ext is not None else {})
+        return token_data
+
 
 class TokenStorage(ABC):
 
@@ -113,79 +394,434 @@ class TokenStorage(ABC):
     def add_quota(self, token: str, quota_delta: int) -> None:
         pass
 
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        '''
+        原子地检查并扣除quota: 仅当token未删除、未过期且 r_quota >= cost 时扣除
+        return True 扣除成功, False 不满足条件未扣除, None 存储不支持(TokenManager会改用add_quota)
+        '''
+        return None
+
+    def consume_quotas(self, costs: Dict[str, int]) -> Optional[Dict[str, bool]]:
+        '''
+        批量条件扣除quota, token -> 消耗, 每个token的语义同 consume_quota
+        return token -> 是否扣除成功, None 存储不支持
+        默认逐个调用consume_quota, 存储可以覆盖为一次批量写入
+        '''
+        result = {}
+        for token, cost in costs.items():
+            consumed = self.consume_quota(token, cost)
+            if consumed is None:
+                return None
+            result[token] = consumed
+        return result
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        '''
+        批量获取token, 只返回存在的token
+        默认逐个调用get_token, 存储可以覆盖为一次批量查询
+        '''
+        result = {}
+        for token in tokens:
+            token_data = self.get_token(token)
+            if token_data:
+                result[token] = token_data
+        return result
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        '''
+        批量保存token
+        默认逐个调用save_token, 存储可以覆盖为一次批量写入
+        '''
+        for token_data in token_data_list:
+            self.save_token(token_data)
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        '''
+        批量修改quota, token -> quota增量
+        默认逐个调用add_quota, 存储可以覆盖为一次批量写入
+        '''
+        for token, quota_delta in quota_deltas.items():
+            self.add_quota(token, quota_delta)
+
+    def iter_tokens(self) -> Iterator[str]:
+        '''
+        遍历存储中的全部token(包括已过期和已删除的), 用于构建索引
+        '''
+        raise NotImplementedError("iter_tokens is not supported by this storage")
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        '''
+        永久删除过期时间或删除时间不晚于cutoff(epoch秒)的token, 最多limit个
+        return 删除的数量, 小于limit表示已经没有需要清理的token
+        '''
+        raise NotImplementedError("purge_expired is not supported by this storage")
+
     def close(self) -> None:
         pass
 
 
-class TokenManager:
-    _thread_local = threading.local()
+# 当前token数据, 基于contextvars: 线程之间、asyncio task之间互相隔离
+_current_token_data: ContextVar[Optional[TokenData]] = ContextVar("pytokenx_current_token_data", default=None)
+
+
+class BaseTokenManager:
+    """
+    TokenManager 和 AsyncTokenManager 共用的配置、token生成和校验逻辑, 不涉及存储访问
+    """
+    REVOCATION_CACHE_SIZE = 100000 # 吊销状态缓存的最大数量, 超出时清空
+    RATE_LIMIT_KEY = "rate_limit" # 额外数据中单个token的速率限制
 
     def __init__(
         self,
-        storage: TokenStorage,
+        storage,
         token_length: int = 16,
         quota: int = QUOTA_UNLIMITED, # token使用额度管理。
         default_expiry: Optional[timedelta] = None, # token过期时间
+        token_generator: Optional[TokenGenerator] = None, # token生成器, 默认base62
+        signer=None, # TokenSigner, 设置后签发签名token
+        revocation_ttl: Optional[float] = 60, # 签名token吊销状态的缓存时间(秒), None表示不检查吊销
+        rate_limits: Optional[Dict[str, RateLimit]] = None, # token_type -> 每个token的速率限制
+        rate_limiter: Optional[RateLimiter] = None, # 限速状态, 默认进程内, 多进程共享使用 RedisRateLimiter
     ):
         self.storage = storage
         self.token_length = token_length
         self.default_expiry = default_expiry
         self.quota = quota
+        self.token_generator = token_generator or AlphabetTokenGenerator()
+        self.signer = signer
+        self.revocation_ttl = revocation_ttl
+        self.rate_limits = rate_limits or {}
+        self.rate_limiter = rate_limiter if rate_limiter is not None else MemoryRateLimiter()
+        # token -> (过期时间(monotonic), 是否已吊销)
+        self._revocations: Dict[str, Tuple[float, bool]] = {}
 
-    def _generate_token0(self, token_length: int) -> str:
+    def _generate_token0(self, token_length: int, token_type: str = "default") -> str:
         # Generate random token
-        alphabet = string.ascii_letters + string.digits
-        return "".join(secrets.choice(alphabet) for _ in range(token_length))
+        return self.token_generator.generate(token_length, token_type)
+
+    def _generate_tokens0(self, n: int, token_length: int, token_type: str = "default") -> List[str]:
+        return self.token_generator.generate_many(n, token_length, token_type)
+
+    def _well_formed(self, token: str, token_type: str) -> bool:
+        if self.signer is not None:
+            claims = self.signer.verify(token)
+            return claims is not None and claims.get("t") == token_type
+        return self.token_generator.check(token, token_type)
+
+    def _precheck(self, token: str, token_type: str) -> None:
+        """
+        查询存储之前按token格式检查, 例如 ChecksumTokenGenerator 的前缀和校验码、签名token的签名
+        raise TokenInvalidError
+        """
+        if not self._well_formed(token, token_type):
+            raise TokenInvalidError("Invalid token")
+
+    def _lookup_tokens(self, tokens: List[str], token_type: str) -> List[str]:
+        """
+        批量校验时需要查询存储的token, 去重并去掉格式检查不通过的
+        """
+        return [token for token in dict.fromkeys(tokens) if self._well_formed(token, token_type)]
+
+    def _new_signed_token_data(
+        self,
+        token_type: str,
+        expiry: Optional[timedelta],
+        quota: int,
+        ext: Dict,
+        now: Optional[datetime] = None,
+        quota_period: Optional[Union[int, timedelta]] = None,
+    ) -> TokenData:
+        token_data = self._new_token_data("", token_type, expiry, quota, ext, now, quota_period)
+        token_data.token = self.signer.sign(token_data, self._generate_token0(self.token_length, token_type))
+        return token_data
+
+    def _validate_signed(self, token: str, token_type: str, now: float) -> Optional[TokenData]:
+        """
+        只根据签名token本身校验, 不限额的token返回token数据的快照, 限额的token返回None, 需要继续查询存储
+        raise TokenInvalidError
+        """
+        claims = self.signer.verify(token)
+        if claims is None or claims.get("t") != token_type:
+            raise TokenInvalidError("Invalid token")
+        if claims.get("e") is not None and now >= claims["e"]:
+            raise TokenInvalidError("Token expired")
+        if claims.get("q"):
+            return None
+        return self.signer.to_token_data(token, claims).snapshot()
+
+    def _check_rate(self, token_data: TokenData, now: float) -> None:
+        """
+        按token或token_type配置的速率限制检查, 没有配置时不检查
+        raise TokenRateLimitError
+        """
+        value = token_data.ext.get(self.RATE_LIMIT_KEY)
+        limit = RateLimit.from_value(value) if value is not None else self.rate_limits.get(token_data.token_type)
+        if limit is None:
+            return
+        wait = self.rate_limiter.acquire(token_data.token, limit, now)
+        if wait:
+            raise TokenRateLimitError("Token rate limit exceeded", wait)
+
+    def _cached_revocation(self, token: str) -> Optional[bool]:
+        entry = self._revocations.get(token)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _cache_revocation(self, token: str, revoked: bool) -> None:
+        if len(self._revocations) >= self.REVOCATION_CACHE_SIZE:
+            self._revocations.clear()
+        self._revocations[token] = (time.monotonic() + (self.revocation_ttl or 0), revoked)
+
+    @staticmethod
+    def _is_revoked(token_data: Optional[TokenData], now: float) -> bool:
+        # 存储中已经不存在(被清理)的签名token也视为吊销
+        return token_data is None or (token_data.deleted_ts is not None and now >= token_data.deleted_ts)
 
     def get_current_token_data(self) -> Optional[TokenData]:
         """
-        从当前线程中获取当前token数据
+        从当前线程(或asyncio task)中获取当前token数据
         """
-        return getattr(self._thread_local, "token_data", None)
+        return _current_token_data.get()
 
     def get_current_token(self) -> Optional[str]:
         """
-        从当前线程中获取当前token
+        从当前线程(或asyncio task)中获取当前token
         """
-        return getattr(self._thread_local, "token", None)
+        token_data = _current_token_data.get()
+        return token_data.token if token_data else None
 
     def set_current_token_data(self, token_data: TokenData) -> None:
-        setattr(self._thread_local, "token_data", token_data)
-        setattr(self._thread_local, "token", token_data.token)
+        _current_token_data.set(token_data)
+
+    def _new_token_data(
+        self,
+        token: str,
+        token_type: str,
+        expiry: Optional[timedelta],
+        quota: int,
+        ext: Dict,
+        now: Optional[datetime] = None,
+        quota_period: Optional[Union[int, timedelta]] = None,
+    ) -> TokenData:
+        now = now or datetime.now()
+        expiry = expiry or self.default_expiry
+        if isinstance(ext.get(self.RATE_LIMIT_KEY), RateLimit):
+            ext[self.RATE_LIMIT_KEY] = ext[self.RATE_LIMIT_KEY].to_dict()
+        return TokenData(
+            token=token,
+            token_type=token_type,
+            ext=ext,
+            created_at=now,
+            expires_at=now + expiry if expiry else None,
+            quota=quota,
+            quota_period=quota_period,
+        )
+
+    def _check_token(self, token_data: Optional[TokenData], token_type: str, now: float) -> None:
+        """
+        检查token类型、删除和过期状态, 不检查quota
+        raise TokenInvalidError
+        """
+        if not token_data or token_data.token_type != token_type:
+            raise TokenInvalidError("Invalid token")
+
+        if token_data.deleted_ts is not None and now >= token_data.deleted_ts:
+            raise TokenInvalidError("Invalid token")
+
+        if token_data.expires_ts is not None and now >= token_data.expires_ts:
+            raise TokenInvalidError("Token expired")
+
+    def _evaluate(
+        self,
+        token_data: Optional[TokenData],
+        token_type: str,
+        cost_quota: int,
+        deduct_quota: bool,
+        now: float,
+    ) -> Tuple[TokenData, int]:
+        """
+        校验token, 返回 (token数据的快照, 需要扣除的quota)
+        不检查速率限制, 调用方在扣除quota成功之后再计入, 被限速时退还quota
+        raise TokenInvalidError
+        """
+        self._check_token(token_data, token_type, now)
+        token_data = token_data.snapshot()
+        token_data.refill(now)
+
+        cost = 0
+        if token_data.quota != QUOTA_UNLIMITED:
+            r_quota = token_data.r_quota - cost_quota
+            if r_quota < 0:
+                raise TokenInvalidError("Token quota exceeded")
+            if deduct_quota:
+                token_data.r_quota = r_quota
+                cost = cost_quota
+        return token_data, cost
+
+    def _evaluate_batch(
+        self,
+        tokens: List[str],
+        found: Dict[str, TokenData],
+        token_type: str,
+        cost_quota: int,
+        deduct_quota: bool,
+    ) -> Tuple[List[Union[TokenData, "TokenInvalidError"]], Dict[str, int], List[TokenData]]:
+        """
+        批量校验, 返回 (与tokens一一对应的结果, token -> quota增量, 进入新quota周期的token)
+        同一个token出现多次时按累计消耗计算quota
+        存储不支持consume_quota时, 进入新quota周期的token需要写入重置并扣减后的数据, 不能只加增量
+        """
+        now = time.time()
+        results = []
+        deducted: Dict[str, TokenData] = {}
+        deltas: Dict[str, int] = {}
+        for token in tokens:
+            try:
+                token_data, cost = self._evaluate(
+                    deducted.get(token) or found.get(token), token_type, cost_quota, deduct_quota, now
+                )
+            except TokenInvalidError as e:
+                results.append(e)
+                continue
+            if cost:
+                deducted[token] = token_data
+                deltas[token] = deltas.get(token, 0) - cost
+            results.append(token_data)
+        refilled = [
+            token_data for token, token_data in deducted.items()
+            if token_data.quota_window != found[token].quota_window
+        ]
+        return results, deltas, refilled
+
+    def _check_rates(
+        self,
+        results: List[Union[TokenData, "TokenInvalidError"]],
+        cost_quota: int,
+        deduct_quota: bool,
+    ) -> Dict[str, int]:
+        """
+        扣除quota之后对校验通过的结果计入速率限制, 被限速的改为TokenRateLimitError
+        return token -> 需要退还的quota
+        """
+        now = time.time()
+        refunds: Dict[str, int] = {}
+        for i, token_data in enumerate(results):
+            if not isinstance(token_data, TokenData):
+                continue
+            try:
+                self._check_rate(token_data, now)
+            except TokenRateLimitError as e:
+                results[i] = e
+                if deduct_quota and cost_quota and token_data.quota != QUOTA_UNLIMITED:
+                    refunds[token_data.token] = refunds.get(token_data.token, 0) + cost_quota
+        return refunds
+
+    @staticmethod
+    def _thawed(token_data: TokenData) -> TokenData:
+        """
+        快照写回存储前换回可修改的ext, 存储中不保存只读的 FrozenDict/FrozenList
+        """
+        token_data = token_data.__copy__()
+        token_data.ext = _thaw(token_data.ext) if token_data.ext else EMPTY_EXT
+        return token_data
+
+    @staticmethod
+    def _reject_unconsumed(
+        tokens: List[str],
+        results: List[Union[TokenData, "TokenInvalidError"]],
+        consumed: Dict[str, bool],
+    ) -> None:
+        """
+        条件扣除失败(并发时quota已被用完)的token改为失败, 同一个token出现多次时全部失败
+        """
+        for i, token in enumerate(tokens):
+            if consumed.get(token) is False and isinstance(results[i], TokenData):
+                results[i] = TokenInvalidError("Token quota exceeded")
+
+
+class TokenManager(BaseTokenManager):
+
+    def __init__(
+        self,
+        storage: TokenStorage,
+        token_length: int = 16,
+        quota: int = QUOTA_UNLIMITED, # token使用额度管理。
+        default_expiry: Optional[timedelta] = None, # token过期时间
+        token_generator: Optional[TokenGenerator] = None, # token生成器, 默认base62
+        signer=None, # TokenSigner, 设置后签发签名token
+        revocation_ttl: Optional[float] = 60, # 签名token吊销状态的缓存时间(秒), None表示不检查吊销
+        rate_limits: Optional[Dict[str, RateLimit]] = None, # token_type -> 每个token的速率限制
+        rate_limiter: Optional[RateLimiter] = None, # 限速状态, 默认进程内, 多进程共享使用 RedisRateLimiter
+    ):
+        super().__init__(
+            storage, token_length, quota, default_expiry, token_generator, signer, revocation_ttl,
+            rate_limits, rate_limiter,
+        )
 
     def generate_token(
         self,
         token_type: str = "default",  # token类型
         expiry: Optional[timedelta] = None,  # 过期时间
         quota: int = QUOTA_UNLIMITED, # 限额
+        quota_period: Optional[Union[int, timedelta]] = None, # quota重置周期, 如 timedelta(days=1)
         **kwargs # 额外数据
     ) -> str:
         """
         生成token， 可以限制token类型，过期时间，额外数据, quota
         """
+        if self.signer is not None:
+            # 签名token包含随机id和签名, 不需要冲突检查
+            token_data = self._new_signed_token_data(token_type, expiry, quota, kwargs, quota_period=quota_period)
+            self.storage.save_token(token_data)
+            return token_data.token
         while True:
-            token = self._generate_token0(self.token_length)
+            token = self._generate_token0(self.token_length, token_type)
             if not self.storage.get_token(token):
                 break
         # Create token data
-        token_data = TokenData(
-            token=token,
-            token_type=token_type,
-            ext=kwargs,
-            created_at=datetime.now(),
-            expires_at=(
-                (datetime.now() + (expiry or self.default_expiry))
-                if (expiry or self.default_expiry)
-                else None
-            ),
-            quota=quota
-        )
+        token_data = self._new_token_data(token, token_type, expiry, quota, kwargs, quota_period=quota_period)
         try:
             self.storage.save_token(token_data)
         except TokenConflictError:
-            return self.generate_token(token_type, expiry, quota, **kwargs)
+            return self.generate_token(token_type, expiry, quota, quota_period, **kwargs)
         return token
 
+    def generate_tokens(
+        self,
+        n: int,
+        token_type: str = "default",  # token类型
+        expiry: Optional[timedelta] = None,  # 过期时间
+        quota: int = QUOTA_UNLIMITED, # 限额
+        quota_period: Optional[Union[int, timedelta]] = None, # quota重置周期, 如 timedelta(days=1)
+        **kwargs # 额外数据
+    ) -> List[str]:
+        """
+        批量生成n个token, 参数同generate_token
+        冲突检查使用一次批量查询, 保存使用一次批量写入
+        """
+        if self.signer is not None:
+            now = datetime.now()
+            token_data_list = [
+                self._new_signed_token_data(token_type, expiry, quota, dict(kwargs), now, quota_period) for _ in range(n)
+            ]
+            self.storage.save_tokens(token_data_list)
+            return [token_data.token for token_data in token_data_list]
+        tokens = set()
+        while len(tokens) < n:
+            candidates = set(self._generate_tokens0(n - len(tokens), self.token_length, token_type))
+            candidates -= tokens
+            existing = self.storage.get_tokens(list(candidates))
+            tokens.update(candidates.difference(existing))
+        tokens = list(tokens)
+
+        now = datetime.now()
+        self.storage.save_tokens([
+            self._new_token_data(token, token_type, expiry, quota, dict(kwargs), now, quota_period)
+            for token in tokens
+        ])
+        return tokens
+
     def validate_token(self, token: str, 
                        token_type: str = "default", 
                        cost_quota: int = 1, # 消耗quota
@@ -193,32 +829,81 @@ class TokenManager:
                         ) -> TokenData:
         """
         验证token
-        return ext  生成token时传入的额外数据
+        return token数据的快照, 其中ext(生成token时传入的额外数据)是只读的
         raise TokenInvalidError
         """
+        now = time.time()
+        if self.signer is not None:
+            # 不限额的签名token只校验签名和过期时间, 不查询存储
+            token_data = self._validate_signed(token, token_type, now)
+            if token_data is not None:
+                if self.revocation_ttl is not None and self._revoked(token, now):
+                    raise TokenInvalidError("Invalid token")
+                self._check_rate(token_data, now)
+                self.set_current_token_data(token_data)
+                return token_data
+        else:
+            self._precheck(token, token_type)
         # Get token data
-        token_data = self.storage.get_token(token)
-        token_data = copy.deepcopy(token_data)
-        if not token_data or token_data.token_type != token_type:
-            raise TokenInvalidError("Invalid token")
-
-        if token_data.deleted_at and datetime.now() >= token_data.deleted_at:
-            raise TokenInvalidError("Invalid token")
-
-        if token_data.expires_at and datetime.now() >= token_data.expires_at:
-            raise TokenInvalidError("Token expired")
-        
-        if token_data.quota != QUOTA_UNLIMITED:
-            r_quota = token_data.r_quota - cost_quota
-            if r_quota < 0:
+        stored = self.storage.get_token(token)
+        token_data, cost = self._evaluate(stored, token_type, cost_quota, deduct_quota, now)
+        if cost:
+            # 存储支持时使用原子的条件扣减, 避免并发时扣成负数
+            consumed = self.storage.consume_quota(token, cost)
+            if consumed is None:
+                if token_data.quota_window != stored.quota_window:
+                    # 进入了新的quota周期, 写入重置并扣减后的数据
+                    self.storage.update_token(self._thawed(token_data))
+                else:
+                    self.deduct_quota(token, cost)
+            elif not consumed:
                 raise TokenInvalidError("Token quota exceeded")
-            if deduct_quota:
-                token_data.r_quota = r_quota
-                self.deduct_quota(token, -cost_quota)
+        try:
+            self._check_rate(token_data, now)
+        except TokenRateLimitError:
+            # 被限速时退还已扣除的quota
+            if cost:
+                self.deduct_quota(token, -cost)
+            raise
 
         self.set_current_token_data(token_data)
         return token_data
+
+    def validate_tokens(self, tokens: List[str],
+                        token_type: str = "default",
+                        cost_quota: int = 1, # 每个token消耗的quota
+                        deduct_quota: bool = True # 是否在验证成功后扣除
+                        ) -> List[Union[TokenData, "TokenInvalidError"]]:
+        """
+        批量验证token, 一次批量查询, 所有quota扣减合并为一次批量写入
+        return 与tokens一一对应的列表, 验证通过为token数据的快照, 失败为TokenInvalidError, 不会抛出异常
+        同一个token出现多次时按累计消耗计算quota
+        存储支持时使用条件扣除(consume_quotas), 并发时quota不足的token返回TokenInvalidError
+        """
+        found = self.storage.get_tokens(self._lookup_tokens(tokens, token_type))
+        results, deltas, refilled = self._evaluate_batch(tokens, found, token_type, cost_quota, deduct_quota)
+        if deltas:
+            consumed = self.storage.consume_quotas({token: -delta for token, delta in deltas.items()})
+            if consumed is not None:
+                self._reject_unconsumed(tokens, results, consumed)
+            else:
+                for token_data in refilled:
+                    self.storage.update_token(self._thawed(token_data))
+                    del deltas[token_data.token]
+                if deltas:
+                    self.storage.add_quotas(deltas)
+        refunds = self._check_rates(results, cost_quota, deduct_quota)
+        if refunds:
+            self.storage.add_quotas(refunds)
+        return results
     
+    def _revoked(self, token: str, now: float) -> bool:
+        revoked = self._cached_revocation(token)
+        if revoked is None:
+            revoked = self._is_revoked(self.storage.get_token(token), now)
+            self._cache_revocation(token, revoked)
+        return revoked
+
     def get_token_data(self, token: str) -> Optional[TokenData]:
         """
         获取token数据
@@ -242,6 +927,27 @@ class TokenManager:
         删除token
         """
         self.storage.delete_token(token)
+        if self.signer is not None:
+            self._cache_revocation(token, True)
+
+    def purge_expired(self, grace: timedelta = timedelta(0), batch_size: int = 1000) -> int:
+        """
+        分批永久删除过期或删除超过grace的token
+        return 删除的数量
+        """
+        cutoff = time.time() - grace.total_seconds()
+        total = 0
+        while True:
+            purged = self.storage.purge_expired(cutoff, batch_size)
+            total += purged
+            if purged < batch_size:
+                return total
+
+    def close(self) -> None:
+        """
+        关闭存储, 写回缓冲中尚未写入的数据会在这里写入
+        """
+        self.storage.close()
 
 
 def default_extract_token_func(*args, **kwargs) -> str:
@@ -250,6 +956,14 @@ def default_extract_token_func(*args, **kwargs) -> str:
 class TokenInvalidError(Exception):
     pass
 
+class TokenRateLimitError(TokenInvalidError):
+    """
+    超过速率限制, retry_after 为需要等待的秒数
+    """
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 class TokenConflictError(Exception):
     pass
 
@@ -306,6 +1020,8 @@ def flask_token_validator(token_manager: TokenManager,
                 )(f)
                 # 执行装饰后的函数
                 return decorated_func(*args, **kwargs)
+            except TokenRateLimitError as e:
+                return {"error": str(e)}, 429, {"Retry-After": str(math.ceil(e.retry_after))}
             except TokenInvalidError as e:
                 # 在这里处理TokenInvalidError异常
                 return {"error": str(e)}, 401 
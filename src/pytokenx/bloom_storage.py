@@ -0,0 +1,183 @@
+from typing import Dict, Iterator, List, Optional
+import hashlib
+import math
+import os
+import struct
+import threading
+
+from .base import TokenData, TokenStorage
+
+
+class BloomFilter:
+    """
+    布隆过滤器, 按容量和误判率计算位数与哈希函数个数
+
+    contains 返回False时一定不存在, 返回True时可能存在(误判率约为 error_rate)
+    """
+    _HEADER = struct.Struct("!4sQIQd")
+    _MAGIC = b"BLM1"
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be >= 1 and 0 < error_rate < 1")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str) -> List[int]:
+        # 双重哈希: 一次blake2b得到两个64位值, 第i个位置为 h1 + i * h2
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, key: str) -> None:
+        bits = self._bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self._bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def to_bytes(self) -> bytes:
+        header = self._HEADER.pack(self._MAGIC, self.capacity, self.num_hashes, self.count, self.error_rate)
+        return header + bytes(self._bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "BloomFilter":
+        magic, capacity, num_hashes, count, error_rate = cls._HEADER.unpack_from(data)
+        if magic != cls._MAGIC:
+            raise ValueError("Not a bloom filter file")
+        bloom = cls(capacity, error_rate)
+        bits = data[cls._HEADER.size:]
+        if len(bits) != len(bloom._bits) or num_hashes != bloom.num_hashes:
+            raise ValueError("Corrupted bloom filter file")
+        bloom._bits = bytearray(bits)
+        bloom.count = count
+        return bloom
+
+
+class BloomFilterTokenStorage(TokenStorage):
+    """
+    布隆过滤器索引, 包装任意 TokenStorage
+
+    启动时通过 storage.iter_tokens() 构建过滤器, save_token/save_tokens 时加入;
+    过滤器判断不存在的token直接返回None, 不查询底层存储。generate_token 的冲突检查同样受益。
+
+    - capacity/error_rate: 预期token数量和误判率, 实际数量超过 capacity 时按两倍容量重建
+    - path: 过滤器文件, 例如 FileTokenStorage 的文件名加 ".bloom"; 启动时存在则加载并删除, close() 时写入。
+      没有正常close(崩溃、被kill)时文件不存在, 下次启动重新构建, 不会漏掉之后保存的token。
+      文件只在通过本对象修改存储时保持准确, 其他进程写入同一存储时不要使用path, 也不要使用本包装。
+
+    已删除、已清理的token仍在过滤器中, 只会增加误判, 不影响正确性, 可以调用 rebuild() 重建。
+    """
+
+    def __init__(
+        self,
+        storage: TokenStorage,
+        capacity: int = 1_000_000,
+        error_rate: float = 0.001,
+        path: Optional[str] = None,
+    ):
+        self.storage = storage
+        self.error_rate = error_rate
+        self.path = path
+        self._lock = threading.Lock()
+        self.bloom: Optional[BloomFilter] = None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                try:
+                    self.bloom = BloomFilter.from_bytes(f.read())
+                except (ValueError, struct.error):
+                    self.bloom = None
+            # 加载后立即删除, 只有正常close时才写回
+            os.remove(path)
+        if self.bloom is None:
+            self.rebuild(capacity)
+
+    def rebuild(self, capacity: Optional[int] = None) -> None:
+        """
+        从底层存储重新构建过滤器
+        """
+        with self._lock:
+            self._rebuild(capacity or self.bloom.capacity)
+
+    def _rebuild(self, capacity: int) -> None:
+        bloom = BloomFilter(capacity, self.error_rate)
+        for token in self.storage.iter_tokens():
+            bloom.add(token)
+        self.bloom = bloom
+
+    def _add(self, tokens: List[str]) -> None:
+        with self._lock:
+            if self.bloom.count + len(tokens) > self.bloom.capacity:
+                self._rebuild(max(self.bloom.capacity, self.bloom.count + len(tokens)) * 2)
+            for token in tokens:
+                self.bloom.add(token)
+
+    def save(self) -> None:
+        """
+        把过滤器写入path, 先写临时文件再替换
+        """
+        if not self.path:
+            return
+        with self._lock:
+            data = self.bloom.to_bytes()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def save_token(self, token_data: TokenData) -> None:
+        # 先加入过滤器再写存储, 写入后立即可以查到
+        self._add([token_data.token])
+        self.storage.save_token(token_data)
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        self._add([token_data.token for token_data in token_data_list])
+        self.storage.save_tokens(token_data_list)
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        if token not in self.bloom:
+            return None
+        return self.storage.get_token(token)
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        bloom = self.bloom
+        candidates = [token for token in tokens if token in bloom]
+        if not candidates:
+            return {}
+        return self.storage.get_tokens(candidates)
+
+    def delete_token(self, token: str) -> None:
+        self.storage.delete_token(token)
+
+    def update_token(self, token_data: TokenData) -> None:
+        self.storage.update_token(token_data)
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        self.storage.add_quota(token, quota_delta)
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        if token not in self.bloom:
+            return False
+        return self.storage.consume_quota(token, cost)
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        self.storage.add_quotas(quota_deltas)
+
+    def iter_tokens(self) -> Iterator[str]:
+        return self.storage.iter_tokens()
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        return self.storage.purge_expired(cutoff, limit)
+
+    def close(self) -> None:
+        self.save()
+        self.storage.close()
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from .base import TokenData, TokenStorage
+import copy
+import threading
+import time
+
+
+class CachingTokenStorage(TokenStorage):
+    """
+    读缓存, 包装任意 TokenStorage
+
+    - 最多缓存 max_size 个token, 超出时淘汰最久未使用的
+    - 每个缓存项最多保留 ttl 秒, 且不会超过token的 expires_at
+    - 不存在的token也会缓存 negative_ttl 秒, 0表示不缓存
+    - 通过本对象调用 save_token/update_token/delete_token 时使缓存失效, add_quota 同步修改缓存中的 r_quota
+    多个进程共享同一存储时, 其他进程的修改最多延迟 ttl 秒可见。
+    """
+
+    def __init__(
+        self,
+        storage: TokenStorage,
+        max_size: int = 10000,
+        ttl: float = 60,
+        negative_ttl: float = 5,
+    ):
+        self.storage = storage
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        # token -> (过期时间(monotonic), TokenData 或 None)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry_ttl(self, token_data: Optional[TokenData]) -> float:
+        if token_data is None:
+            return self.negative_ttl
+        ttl = self.ttl
+        if token_data.expires_at:
+            remaining = (token_data.expires_at - datetime.now()).total_seconds()
+            # 已经过期的token状态不会再变化, 按正常ttl缓存
+            if remaining > 0:
+                ttl = min(ttl, remaining)
+        return ttl
+
+    def _put(self, token: str, token_data: Optional[TokenData]) -> None:
+        ttl = self._entry_ttl(token_data)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._cache[token] = (time.monotonic() + ttl, token_data)
+            self._cache.move_to_end(token)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._cache.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def save_token(self, token_data: TokenData) -> None:
+        self.storage.save_token(token_data)
+        self.invalidate(token_data.token)
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        self.storage.save_tokens(token_data_list)
+        for token_data in token_data_list:
+            self.invalidate(token_data.token)
+
+    def _lookup(self, token: str, now: float):
+        """
+        在缓存中查找, 命中返回 (True, TokenData 或 None), 未命中返回 (False, None), 需持有锁
+        """
+        entry = self._cache.get(token)
+        if entry is not None:
+            if entry[0] > now:
+                self._cache.move_to_end(token)
+                self.hits += 1
+                return True, entry[1]
+            del self._cache[token]
+        self.misses += 1
+        return False, None
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        with self._lock:
+            hit, token_data = self._lookup(token, time.monotonic())
+        if hit:
+            return token_data
+        token_data = self.storage.get_token(token)
+        # 缓存副本, add_quota 修改缓存时不影响底层存储返回的对象
+        self._put(token, copy.copy(token_data))
+        return token_data
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        result = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for token in tokens:
+                hit, token_data = self._lookup(token, now)
+                if not hit:
+                    missing.append(token)
+                elif token_data is not None:
+                    result[token] = token_data
+        if missing:
+            fetched = self.storage.get_tokens(missing)
+            for token in missing:
+                token_data = fetched.get(token)
+                self._put(token, copy.copy(token_data))
+                if token_data is not None:
+                    result[token] = token_data
+        return result
+
+    def delete_token(self, token: str) -> None:
+        self.storage.delete_token(token)
+        self.invalidate(token)
+
+    def update_token(self, token_data: TokenData) -> None:
+        self.storage.update_token(token_data)
+        self.invalidate(token_data.token)
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        self.storage.add_quota(token, quota_delta)
+        with self._lock:
+            entry = self._cache.get(token)
+            if entry is not None and entry[1] is not None:
+                entry[1].refill()
+                entry[1].r_quota += quota_delta
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        consumed = self.storage.consume_quota(token, cost)
+        if consumed:
+            with self._lock:
+                entry = self._cache.get(token)
+                if entry is not None and entry[1] is not None:
+                    entry[1].refill()
+                    entry[1].r_quota -= cost
+        elif consumed is not None:
+            # 缓存中的数据已经过时
+            self.invalidate(token)
+        return consumed
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        self.storage.add_quotas(quota_deltas)
+        with self._lock:
+            for token, quota_delta in quota_deltas.items():
+                entry = self._cache.get(token)
+                if entry is not None and entry[1] is not None:
+                    entry[1].refill()
+                    entry[1].r_quota += quota_delta
+
+    def iter_tokens(self) -> Iterator[str]:
+        return self.storage.iter_tokens()
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        return self.storage.purge_expired(cutoff, limit)
+
+    def close(self) -> None:
+        self.clear()
+        self.storage.close()
@@ -1,17 +1,50 @@
-from typing import Dict, Optional
+from typing import Dict, Iterator, List, Optional
 from .base import TokenData, TokenStorage
-import json
+from .reaper import ExpiryHeap
+from .serializer import JSONTokenSerializer, TokenSerializer, detect_serializer
 import os
+import threading
 from datetime import datetime
 from threading import RLock
 
 
 class FileTokenStorage(TokenStorage):
     """
-    直接使用json文件存储
+    整个文件保存全部token, 默认json格式
+
+    durability 写入方式:
+        "none"   直接覆盖写原文件, 写到一半崩溃会损坏文件
+        "atomic" 先写临时文件再rename替换, 崩溃时文件要么是旧内容要么是新内容
+        "fsync"  在 atomic 的基础上fsync文件和目录, 掉电也不丢失已提交的数据
+    组提交: flush_interval(秒) 或 flush_batch(次数) 任一条件满足时, 把这段时间内的修改合并成一次写入,
+    未写入的修改在进程崩溃时会丢失。
+
+    serializer 文件格式, 默认沿用已有文件的格式(新文件为json);
+    指定的格式与已有文件不同时, 打开时按原格式读取并立即转换为新格式。
     """
-    def __init__(self, file_path: str):
+    DURABILITY_NONE = "none"
+    DURABILITY_ATOMIC = "atomic"
+    DURABILITY_FSYNC = "fsync"
+
+    def __init__(
+        self,
+        file_path: str,
+        durability: str = DURABILITY_ATOMIC,
+        flush_interval: float = 0, # 组提交的时间窗口, 0表示每次修改立即写入
+        flush_batch: int = 1, # 累计多少次修改后立即写入
+        serializer: Optional[TokenSerializer] = None, # 如 BinaryTokenSerializer()
+    ):
+        if durability not in (self.DURABILITY_NONE, self.DURABILITY_ATOMIC, self.DURABILITY_FSYNC):
+            raise ValueError(f"Unknown durability: {durability}")
         self.file_path = file_path
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.flush_batch = max(flush_batch, 1)
+        self.serializer = serializer
+        self._lock = RLock()
+        self._pending = 0
+        self._timer: Optional[threading.Timer] = None
+        self._expiry = ExpiryHeap()
         # 判断是否包含路径
         if not os.path.isabs(file_path):
             file_path = os.path.abspath(file_path)
@@ -23,37 +56,144 @@ class FileTokenStorage(TokenStorage):
 
         if not os.path.exists(file_path):
             print("创建文件:", file_path)
-            with open(file_path, 'w') as f:
-                json.dump({}, f)
+            with open(file_path, 'wb') as f:
+                f.write((self.serializer or JSONTokenSerializer()).dumps([]))
         self._read_tokens()
     
     def _read_tokens(self) -> Dict:
-        with open(self.file_path, 'r') as f:
-            data = json.load(f)
-            self.tokens = {k: TokenData.from_dict(v) for k, v in data.items()}
-            return self.tokens
+        with open(self.file_path, 'rb') as f:
+            data = f.read()
+        file_serializer = detect_serializer(data)
+        self.tokens = file_serializer.loads(data)
+        self._expiry.build(self.tokens)
+        if self.serializer is None:
+            self.serializer = file_serializer
+        elif self.serializer.name != file_serializer.name:
+            # 转换为指定的格式
+            self._write_tokens(self.tokens)
+        return self.tokens
     
     def _write_tokens(self, tokens: Dict[str, TokenData]) -> None:
-        with open(self.file_path, 'w') as f:
-            json.dump({k: v.to_dict() for k, v in tokens.items()}, f)
+        data = self.serializer.dumps(tokens.values())
+        if self.durability == self.DURABILITY_NONE:
+            with open(self.file_path, 'wb') as f:
+                f.write(data)
+            return
+
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if self.durability == self.DURABILITY_FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+        if self.durability == self.DURABILITY_FSYNC:
+            self._fsync_dir()
+
+    def _fsync_dir(self) -> None:
+        # rename 之后fsync目录才能保证目录项落盘, windows不支持打开目录
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.file_path)), os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _commit(self) -> None:
+        """
+        记录一次修改, 根据组提交配置决定立即写入还是延迟写入
+        """
+        self._pending += 1
+        if self._pending >= self.flush_batch or self.flush_interval <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """
+        把尚未写入的修改写入文件
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending:
+                self._pending = 0
+                self._write_tokens(self.tokens)
     
     def save_token(self, token_data: TokenData) -> None:
-        self.tokens[token_data.token] = token_data
-        self._write_tokens(self.tokens)
+        with self._lock:
+            self.tokens[token_data.token] = token_data
+            self._expiry.push(token_data)
+            self._commit()
     
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        with self._lock:
+            for token_data in token_data_list:
+                self.tokens[token_data.token] = token_data
+                self._expiry.push(token_data)
+            self._commit()
+
     def get_token(self, token: str) -> Optional[TokenData]:
         return self.tokens.get(token)
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        return {token: self.tokens[token] for token in tokens if token in self.tokens}
     
     def delete_token(self, token: str) -> None:
-        if token in self.tokens:
-            self.tokens[token].deleted_at = datetime.utcnow()
-            self.tokens[token].is_active = False
-            self._write_tokens(self.tokens)
+        with self._lock:
+            if token in self.tokens:
+                self.tokens[token].deleted_at = datetime.now()
+                self._expiry.push(self.tokens[token])
+                self._commit()
     
     def update_token(self, token_data):
         return self.save_token(token_data)
     
     def add_quota(self, token, quota_delta):
-        if token in self.tokens:
-            self.tokens[token].r_quota += quota_delta
-            self._write_tokens(self.tokens)
\ No newline at end of file
+        with self._lock:
+            if token in self.tokens:
+                self.tokens[token].refill()
+                self.tokens[token].r_quota += quota_delta
+                self._commit()
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        with self._lock:
+            token_data = self.tokens.get(token)
+            if not token_data or not token_data.is_active():
+                return False
+            token_data.refill()
+            if token_data.r_quota < cost:
+                return False
+            token_data.r_quota -= cost
+            self._commit()
+            return True
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        with self._lock:
+            for token, quota_delta in quota_deltas.items():
+                if token in self.tokens:
+                    self.tokens[token].refill()
+                    self.tokens[token].r_quota += quota_delta
+            self._commit()
+
+    def iter_tokens(self) -> Iterator[str]:
+        with self._lock:
+            tokens = list(self.tokens)
+        return iter(tokens)
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        with self._lock:
+            due = self._expiry.pop_due(self.tokens, cutoff, limit)
+            for token in due:
+                del self.tokens[token]
+            if due:
+                self._commit()
+            return len(due)
+
+    def close(self) -> None:
+        self.flush()
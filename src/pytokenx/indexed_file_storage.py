@@ -0,0 +1,471 @@
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+
+from .base import TokenData, TokenStorage
+from .serializer import detect_serializer
+
+_MAGIC = b"PTXI"
+_VERSION = 2
+# 文件头: magic, 版本, token数量, key区偏移, 索引区偏移, 日志代数; 版本1没有日志代数
+_HEADER = struct.Struct("<4sIQQQQ")
+_HEADER_V1 = struct.Struct("<4sIQQQ")
+# 索引项: key偏移, key长度, 记录偏移, 记录长度, 过期时间, 删除时间(NaN表示没有)
+_ENTRY = struct.Struct("<QIQIdd")
+_NAN = float("nan")
+
+
+def _ts_or_nan(ts: Optional[float]) -> float:
+    return ts if ts is not None else _NAN
+
+
+def _due(expires: float, deleted: float, cutoff: float) -> bool:
+    return (not math.isnan(expires) and expires <= cutoff) or (not math.isnan(deleted) and deleted <= cutoff)
+
+
+def _encode(token_data: TokenData) -> bytes:
+    return json.dumps(token_data.to_dict(), separators=(",", ":")).encode()
+
+
+class _BaseFile:
+    """
+    只读的索引文件: 记录区 + 按token排序的key区 + 定长索引项, 通过mmap访问, 打开时不读取内容
+    """
+
+    def __init__(self, path: str):
+        self.count = 0
+        self.generation = 0 # 与该文件配套的日志代数
+        self._mm = None
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from("<4sI", self._mm, 0)
+        if magic != _MAGIC or version not in (1, _VERSION):
+            self._mm.close()
+            raise ValueError(f"Not an indexed token file: {path}")
+        if version == 1:
+            _, _, self.count, self._keys_offset, self._index_offset = _HEADER_V1.unpack_from(self._mm, 0)
+        else:
+            _, _, self.count, self._keys_offset, self._index_offset, self.generation = _HEADER.unpack_from(self._mm, 0)
+
+    @staticmethod
+    def is_indexed(path: str) -> bool:
+        with open(path, "rb") as f:
+            return f.read(len(_MAGIC)) == _MAGIC
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def entry(self, i: int) -> tuple:
+        return _ENTRY.unpack_from(self._mm, self._index_offset + i * _ENTRY.size)
+
+    def key(self, entry: tuple) -> bytes:
+        return self._mm[entry[0]:entry[0] + entry[1]]
+
+    def record(self, entry: tuple) -> bytes:
+        return self._mm[entry[2]:entry[2] + entry[3]]
+
+    def find(self, key: bytes) -> Optional[tuple]:
+        # 二分查找
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self.entry(mid)
+            mid_key = self.key(entry)
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return entry
+        return None
+
+    def entries(self) -> Iterator[tuple]:
+        if self.count:
+            yield from _ENTRY.iter_unpack(self._mm[self._index_offset:self._index_offset + self.count * _ENTRY.size])
+
+    @staticmethod
+    def write(path: str, items: Iterator[Tuple[bytes, bytes, float, float]], generation: int = 0) -> None:
+        """
+        写入新文件, items 为按key排序的 (key, 记录, 过期时间, 删除时间), 先写临时文件再替换
+        """
+        tmp_path = path + ".tmp"
+        keys = []
+        entries = []
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            offset = _HEADER.size
+            for key, record, expires, deleted in items:
+                f.write(record)
+                keys.append(key)
+                entries.append((offset, len(record), expires, deleted))
+                offset += len(record)
+            keys_offset = offset
+            key_offsets = []
+            for key in keys:
+                f.write(key)
+                key_offsets.append(offset)
+                offset += len(key)
+            index_offset = offset
+            for key, key_offset, (rec_offset, rec_len, expires, deleted) in zip(keys, key_offsets, entries):
+                f.write(_ENTRY.pack(key_offset, len(key), rec_offset, rec_len, expires, deleted))
+            f.seek(0)
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(keys), keys_offset, index_offset, generation))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class IndexedFileTokenStorage(TokenStorage):
+    """
+    按需加载的索引文件存储, 适合token数量很大的场景
+
+    文件布局:
+        <file_path>      索引文件, 记录区 + 排序的key区 + 定长索引项(含过期/删除时间), 通过mmap只读访问
+        <file_path>.log  修改日志, 每行一条json记录
+    启动时只映射索引文件并重放日志, 不解析全部记录; 查询时二分查找索引, 首次访问才解析该token的记录。
+    修改只追加到日志并保存在内存中, 日志超过 compact_threshold 字节后合并成新的索引文件。
+    日志第一行记录代数, 与索引文件头中的代数不同时说明日志已经合并过(合并后清空日志前崩溃), 不再重放。
+
+    - cache_size: 最多缓存多少个已解析但未修改的token, 超出时清空缓存
+    - 打开 FileTokenStorage 的文件(json或二进制格式)时会自动转换为索引文件
+    """
+
+    # 日志记录类型
+    OP_SAVE = "s"
+    OP_DELETE = "d"
+    OP_QUOTA = "q"
+    OP_PURGE = "p"
+    OP_REFILL = "r"
+    OP_GENERATION = "g"
+
+    def __init__(
+        self,
+        file_path: str,
+        compact_threshold: int = 16 * 1024 * 1024, # 日志超过该字节数后合并
+        cache_size: int = 100000,
+    ):
+        self.file_path = os.path.abspath(file_path)
+        self.log_path = self.file_path + ".log"
+        self.compact_threshold = compact_threshold
+        self.cache_size = cache_size
+        self._lock = threading.RLock()
+        # 已解析且未修改的token
+        self._cache: Dict[str, TokenData] = {}
+        # 上次合并之后修改过的token, None表示已清理
+        self._dirty: Dict[str, Optional[TokenData]] = {}
+        # (过期或删除时间, token) 的最小堆, 第一次清理时由索引项构建; 弹出时再按当前数据确认
+        self._expiry: Optional[List[Tuple[float, str]]] = None
+
+        dir_path = os.path.dirname(self.file_path)
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        if os.path.exists(self.file_path) and os.path.getsize(self.file_path) and not _BaseFile.is_indexed(self.file_path):
+            self._migrate()
+        self._base = _BaseFile(self.file_path)
+        self._open_log(self._replay())
+
+    # ---------- 文件 ----------
+
+    def _migrate(self) -> None:
+        with open(self.file_path, "rb") as f:
+            data = f.read()
+        tokens = list(detect_serializer(data).loads(data).values())
+        tokens.sort(key=lambda t: t.token.encode())
+        _BaseFile.write(self.file_path, (
+            (t.token.encode(), _encode(t), _ts_or_nan(t.expires_ts), _ts_or_nan(t.deleted_ts)) for t in tokens
+        ))
+
+    def _replay(self) -> int:
+        """
+        重放日志, 返回完整记录的字节数; 日志不属于当前索引文件时返回0
+        """
+        if not os.path.exists(self.log_path):
+            return 0
+        size = 0
+        generation = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 崩溃时最后一行可能只写了一半, 丢弃
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if record[0] == self.OP_GENERATION:
+                    generation = record[1]
+                elif generation != self._base.generation:
+                    return 0
+                else:
+                    self._apply(record)
+                size += len(line)
+        return size
+
+    def _open_log(self, size: int) -> None:
+        """
+        打开日志继续追加, size为0时清空日志并写入当前代数
+        """
+        if size:
+            # 截掉写了一半的记录, 否则之后的记录会接在坏行后面
+            os.truncate(self.log_path, size)
+            self._log = open(self.log_path, "a")
+        else:
+            self._log = open(self.log_path, "w")
+            self._log.write(json.dumps([self.OP_GENERATION, self._base.generation]) + "\n")
+            self._log.flush()
+        self._log_size = self._log.tell()
+
+    def _apply(self, record: list) -> None:
+        op = record[0]
+        if op == self.OP_SAVE:
+            self._dirty[record[1]["token"]] = TokenData.from_dict(record[1])
+            self._cache.pop(record[1]["token"], None)
+        elif op == self.OP_DELETE:
+            token_data = self._modify(record[1])
+            if token_data:
+                token_data.deleted_at = datetime.fromisoformat(record[2])
+        elif op == self.OP_QUOTA:
+            token_data = self._modify(record[1])
+            if token_data:
+                token_data.r_quota += record[2]
+        elif op == self.OP_PURGE:
+            for token in record[1]:
+                self._dirty[token] = None
+                self._cache.pop(token, None)
+        elif op == self.OP_REFILL:
+            token_data = self._modify(record[1])
+            if token_data:
+                token_data.r_quota = token_data.quota
+                token_data.quota_window = record[2]
+
+    def _append(self, *records: list) -> None:
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        self._log.write(data)
+        self._log.flush()
+        self._log_size += len(data)
+        if self._log_size >= self.compact_threshold:
+            self.compact()
+
+    def _merged(self) -> Iterator[Tuple[bytes, bytes, float, float]]:
+        """
+        按key顺序合并索引文件和修改过的token
+        """
+        dirty = sorted((token.encode(), token_data) for token, token_data in self._dirty.items())
+        i = 0
+        for entry in self._base.entries():
+            key = self._base.key(entry)
+            while i < len(dirty) and dirty[i][0] < key:
+                yield from self._dirty_item(dirty[i])
+                i += 1
+            if i < len(dirty) and dirty[i][0] == key:
+                yield from self._dirty_item(dirty[i])
+                i += 1
+                continue
+            yield key, self._base.record(entry), entry[4], entry[5]
+        for item in dirty[i:]:
+            yield from self._dirty_item(item)
+
+    @staticmethod
+    def _dirty_item(item: Tuple[bytes, Optional[TokenData]]):
+        key, token_data = item
+        if token_data is not None:
+            yield key, _encode(token_data), _ts_or_nan(token_data.expires_ts), _ts_or_nan(token_data.deleted_ts)
+
+    def compact(self) -> None:
+        """
+        把日志合并到新的索引文件, 未修改的记录直接复制, 不需要解析
+        """
+        with self._lock:
+            _BaseFile.write(self.file_path, self._merged(), self._base.generation + 1)
+            self._base.close()
+            self._base = _BaseFile(self.file_path)
+            for token, token_data in self._dirty.items():
+                if token_data is not None:
+                    self._cache[token] = token_data
+            self._dirty.clear()
+            self._expiry = None
+            self._log.close()
+            self._open_log(0)
+
+    # ---------- 读取 ----------
+
+    def _load(self, token: str) -> Optional[TokenData]:
+        if token in self._dirty:
+            return self._dirty[token]
+        token_data = self._cache.get(token)
+        if token_data is None:
+            entry = self._base.find(token.encode())
+            if entry is None:
+                return None
+            token_data = TokenData.from_dict(json.loads(self._base.record(entry)))
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[token] = token_data
+        return token_data
+
+    def _modify(self, token: str) -> Optional[TokenData]:
+        """
+        取出token准备修改, 移入 _dirty
+        """
+        token_data = self._load(token)
+        if token_data is not None and token not in self._dirty:
+            self._cache.pop(token, None)
+            self._dirty[token] = token_data
+        return token_data
+
+    def _push_expiry(self, token_data: TokenData) -> None:
+        if self._expiry is None:
+            return
+        for ts in (token_data.expires_ts, token_data.deleted_ts):
+            if ts is not None:
+                heapq.heappush(self._expiry, (ts, token_data.token))
+
+    def _build_expiry(self) -> List[Tuple[float, str]]:
+        heap = []
+        for entry in self._base.entries():
+            for ts in (entry[4], entry[5]):
+                if not math.isnan(ts):
+                    heap.append((ts, self._base.key(entry).decode()))
+        for token_data in self._dirty.values():
+            if token_data is not None:
+                for ts in (token_data.expires_ts, token_data.deleted_ts):
+                    if ts is not None:
+                        heap.append((ts, token_data.token))
+        heapq.heapify(heap)
+        return heap
+
+    def _is_due(self, token: str, cutoff: float) -> bool:
+        # 修改过的token按内存中的数据判断; 其余token的堆项都来自当前索引文件(合并后重建堆), 时间不会变
+        if token in self._dirty:
+            token_data = self._dirty[token]
+            return token_data is not None and _due(
+                _ts_or_nan(token_data.expires_ts), _ts_or_nan(token_data.deleted_ts), cutoff
+            )
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._log.closed:
+                self._log.close()
+                self._base.close()
+
+    def save_token(self, token_data: TokenData) -> None:
+        with self._lock:
+            self._dirty[token_data.token] = token_data
+            self._cache.pop(token_data.token, None)
+            self._push_expiry(token_data)
+            self._append([self.OP_SAVE, token_data.to_dict()])
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        with self._lock:
+            for token_data in token_data_list:
+                self._dirty[token_data.token] = token_data
+                self._cache.pop(token_data.token, None)
+                self._push_expiry(token_data)
+            self._append(*[[self.OP_SAVE, token_data.to_dict()] for token_data in token_data_list])
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        with self._lock:
+            return self._load(token)
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        result = {}
+        with self._lock:
+            for token in tokens:
+                token_data = self._load(token)
+                if token_data is not None:
+                    result[token] = token_data
+        return result
+
+    def delete_token(self, token: str) -> None:
+        with self._lock:
+            token_data = self._modify(token)
+            if token_data:
+                token_data.deleted_at = datetime.now()
+                self._push_expiry(token_data)
+                self._append([self.OP_DELETE, token, token_data.deleted_at.isoformat()])
+
+    def update_token(self, token_data: TokenData) -> None:
+        return self.save_token(token_data)
+
+    def _refill(self, token: str, token_data: TokenData) -> List[list]:
+        # 进入新的quota周期时记录重置, 重放日志时不依赖当前时间
+        if token_data.refill():
+            return [[self.OP_REFILL, token, token_data.quota_window]]
+        return []
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        with self._lock:
+            token_data = self._modify(token)
+            if token_data:
+                records = self._refill(token, token_data)
+                token_data.r_quota += quota_delta
+                self._append(*records, [self.OP_QUOTA, token, quota_delta])
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        with self._lock:
+            token_data = self._load(token)
+            if not token_data or not token_data.is_active():
+                return False
+            if token_data.quota_period is None and token_data.r_quota < cost:
+                return False
+            token_data = self._modify(token)
+            records = self._refill(token, token_data)
+            if token_data.r_quota < cost:
+                if records:
+                    self._append(*records)
+                return False
+            token_data.r_quota -= cost
+            self._append(*records, [self.OP_QUOTA, token, -cost])
+            return True
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        with self._lock:
+            records = []
+            for token, quota_delta in quota_deltas.items():
+                token_data = self._modify(token)
+                if token_data:
+                    records += self._refill(token, token_data)
+                    token_data.r_quota += quota_delta
+                    records.append([self.OP_QUOTA, token, quota_delta])
+            if records:
+                self._append(*records)
+
+    def iter_tokens(self) -> Iterator[str]:
+        with self._lock:
+            dirty = dict(self._dirty)
+            tokens = [
+                token for token in (self._base.key(entry).decode() for entry in self._base.entries())
+                if dirty.get(token, True) is not None
+            ]
+        base = set(tokens)
+        tokens += [token for token, token_data in dirty.items() if token_data is not None and token not in base]
+        return iter(tokens)
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        with self._lock:
+            if self._expiry is None or len(self._expiry) > 2 * (self._base.count + len(self._dirty)) + 1024:
+                # 修改过的token会在堆中留下旧项, 太多时重建
+                self._expiry = self._build_expiry()
+            heap = self._expiry
+            due = []
+            seen = set()
+            while heap and heap[0][0] <= cutoff and len(due) < limit:
+                _, token = heapq.heappop(heap)
+                if token not in seen and self._is_due(token, cutoff):
+                    seen.add(token)
+                    due.append(token)
+            if due:
+                self._apply([self.OP_PURGE, due])
+                self._append([self.OP_PURGE, due])
+            return len(due)
@@ -0,0 +1,156 @@
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Iterator, List, Optional
+import zlib
+
+from .base import TokenData, TokenStorage
+from .reaper import ExpiryHeap
+
+
+class _Shard:
+    __slots__ = ("tokens", "lock", "expiry")
+
+    def __init__(self):
+        self.tokens: Dict[str, TokenData] = {}
+        self.lock = Lock()
+        self.expiry = ExpiryHeap()
+
+
+class MemoryTokenStorage(TokenStorage):
+    """
+    纯内存存储, token按哈希分散到 shards 个分片, 每个分片一把锁,
+    不同分片上的token修改quota时互不阻塞。
+
+    进程退出后数据丢失, 需要持久化时用 snapshot()/restore() 自行保存和恢复。
+    """
+
+    def __init__(self, shards: int = 16):
+        if shards < 1:
+            raise ValueError("shards must be >= 1")
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _shard(self, token: str) -> _Shard:
+        # crc32 在进程间稳定, 不受 PYTHONHASHSEED 影响
+        return self._shards[zlib.crc32(token.encode()) % len(self._shards)]
+
+    def _group(self, tokens) -> Dict[int, List]:
+        groups: Dict[int, List] = {}
+        for item in tokens:
+            token = item if isinstance(item, str) else item.token
+            groups.setdefault(zlib.crc32(token.encode()) % len(self._shards), []).append(item)
+        return groups
+
+    def __len__(self) -> int:
+        return sum(len(shard.tokens) for shard in self._shards)
+
+    def save_token(self, token_data: TokenData) -> None:
+        shard = self._shard(token_data.token)
+        with shard.lock:
+            shard.tokens[token_data.token] = token_data
+            shard.expiry.push(token_data)
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        for i, group in self._group(token_data_list).items():
+            shard = self._shards[i]
+            with shard.lock:
+                for token_data in group:
+                    shard.tokens[token_data.token] = token_data
+                    shard.expiry.push(token_data)
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        return self._shard(token).tokens.get(token)
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        result = {}
+        for token in tokens:
+            token_data = self._shard(token).tokens.get(token)
+            if token_data is not None:
+                result[token] = token_data
+        return result
+
+    def delete_token(self, token: str) -> None:
+        shard = self._shard(token)
+        with shard.lock:
+            token_data = shard.tokens.get(token)
+            if token_data:
+                token_data.deleted_at = datetime.now()
+                shard.expiry.push(token_data)
+
+    def update_token(self, token_data: TokenData) -> None:
+        return self.save_token(token_data)
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        shard = self._shard(token)
+        with shard.lock:
+            token_data = shard.tokens.get(token)
+            if token_data:
+                token_data.refill()
+                token_data.r_quota += quota_delta
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        shard = self._shard(token)
+        with shard.lock:
+            token_data = shard.tokens.get(token)
+            if not token_data or not token_data.is_active():
+                return False
+            token_data.refill()
+            if token_data.r_quota < cost:
+                return False
+            token_data.r_quota -= cost
+            return True
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        for i, group in self._group(quota_deltas).items():
+            shard = self._shards[i]
+            with shard.lock:
+                for token in group:
+                    token_data = shard.tokens.get(token)
+                    if token_data:
+                        token_data.refill()
+                        token_data.r_quota += quota_deltas[token]
+
+    def iter_tokens(self) -> Iterator[str]:
+        for shard in self._shards:
+            with shard.lock:
+                tokens = list(shard.tokens)
+            yield from tokens
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        purged = 0
+        for shard in self._shards:
+            if purged >= limit:
+                break
+            with shard.lock:
+                due = shard.expiry.pop_due(shard.tokens, cutoff, limit - purged)
+                for token in due:
+                    del shard.tokens[token]
+            purged += len(due)
+        return purged
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        导出全部token, 返回 token -> TokenData.to_dict(), 可以直接json序列化
+        导出时持有所有分片的锁, 得到的是一致的快照
+        """
+        for shard in self._shards:
+            shard.lock.acquire()
+        try:
+            return {
+                token: token_data.to_dict()
+                for shard in self._shards
+                for token, token_data in shard.tokens.items()
+            }
+        finally:
+            for shard in reversed(self._shards):
+                shard.lock.release()
+
+    def restore(self, data: Dict[str, Dict]) -> None:
+        """
+        从 snapshot() 的结果恢复, 会清空当前数据
+        """
+        shards = [_Shard() for _ in self._shards]
+        for token, value in data.items():
+            shards[zlib.crc32(token.encode()) % len(shards)].tokens[token] = TokenData.from_dict(value)
+        for shard in shards:
+            shard.expiry.build(shard.tokens)
+        self._shards = shards
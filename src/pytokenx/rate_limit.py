@@ -0,0 +1,158 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Union
+import threading
+import time
+
+# 比较时间时允许的浮点误差(秒)
+_EPSILON = 1e-6
+
+
+class RateLimit:
+    """
+    速率限制: 每 period 秒最多 rate 次, 允许一次性突发 burst 次(默认等于rate)
+
+    可以按token_type配置(TokenManager的rate_limits参数), 也可以在生成token时通过额外数据
+    rate_limit=RateLimit(...) 为单个token配置, 单个token的配置优先。
+    """
+    __slots__ = ("rate", "period", "burst")
+
+    def __init__(self, rate: float, period: float = 1.0, burst: Optional[int] = None):
+        if rate <= 0 or period <= 0:
+            raise ValueError("rate and period must be positive")
+        self.rate = rate
+        self.period = period
+        self.burst = burst if burst is not None else max(int(rate), 1)
+        if self.burst < 1:
+            raise ValueError("burst must be >= 1")
+
+    @property
+    def interval(self) -> float:
+        """两次请求之间的平均间隔(秒)"""
+        return self.period / self.rate
+
+    def to_dict(self) -> Dict:
+        return {"rate": self.rate, "period": self.period, "burst": self.burst}
+
+    @classmethod
+    def from_value(cls, value: Union["RateLimit", Dict]) -> "RateLimit":
+        if isinstance(value, RateLimit):
+            return value
+        return cls(value["rate"], value.get("period", 1.0), value.get("burst"))
+
+    def __eq__(self, other):
+        if not isinstance(other, RateLimit):
+            return NotImplemented
+        return (self.rate, self.period, self.burst) == (other.rate, other.period, other.burst)
+
+    def __repr__(self) -> str:
+        return f"RateLimit(rate={self.rate!r}, period={self.period!r}, burst={self.burst!r})"
+
+
+class RateLimiter(ABC):
+    """
+    GCRA(generic cell rate algorithm)限速器, 与令牌桶等价, 每个key只需要保存一个时间(理论到达时间TAT)
+
+    TAT不晚于当前时间的key与从未出现过的key等价, 可以直接丢弃, 所以空闲的key会自动过期。
+    """
+
+    @abstractmethod
+    def acquire(self, key: str, limit: RateLimit, now: Optional[float] = None) -> float:
+        """
+        尝试通过一次请求, 通过返回0, 否则返回需要等待的秒数
+        """
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    进程内限速器, key -> TAT(epoch秒), 每隔 sweep_interval 秒清理一次空闲的key
+    """
+
+    def __init__(self, sweep_interval: float = 60):
+        self.sweep_interval = sweep_interval
+        self._tats: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def _sweep(self, now: float) -> None:
+        self._tats = {key: tat for key, tat in self._tats.items() if tat > now}
+        self._next_sweep = now + self.sweep_interval
+
+    def acquire(self, key: str, limit: RateLimit, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        interval = limit.interval
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            tat = max(self._tats.get(key, now), now) + interval
+            allow_at = tat - interval * limit.burst
+            if allow_at - now > _EPSILON:
+                return allow_at - now
+            self._tats[key] = tat
+            return 0.0
+
+
+# ARGV: now, interval, burst, 浮点误差; 通过返回'0', 否则返回需要等待的秒数
+_GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+if tat < now then
+    tat = now
+end
+tat = tat + interval
+local allow_at = tat - interval * tonumber(ARGV[3])
+if allow_at - now > tonumber(ARGV[4]) then
+    return string.format('%.6f', allow_at - now)
+end
+redis.call('SET', KEYS[1], string.format('%.6f', tat))
+redis.call('PEXPIREAT', KEYS[1], math.ceil(tat * 1000))
+return '0'
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Redis限速器, 多个进程、多台机器共享限速状态
+
+    每个key保存TAT, 检查和更新在一个Lua脚本中完成; TAT之后key由Redis自动删除。
+    时间使用调用方的系统时间, 各机器需要对时。
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        client=None,
+        key_prefix: str = "pytokenx:rate:",
+        **redis_kwargs,
+    ):
+        # 可选依赖, 用到时才导入, 使用默认限速器时不增加 import pytokenx 的开销
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("redis is not installed")
+        if client is None:
+            if url is None:
+                raise ValueError("url or client is required")
+            self.client = redis.Redis.from_url(url, **redis_kwargs)
+            self._owns_client = True
+        else:
+            self.client = client
+            self._owns_client = False
+        self.key_prefix = key_prefix
+        self._gcra = self.client.register_script(_GCRA_SCRIPT)
+
+    def acquire(self, key: str, limit: RateLimit, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        wait = self._gcra(keys=[self.key_prefix + key], args=[repr(now), repr(limit.interval), limit.burst, _EPSILON])
+        return float(wait)
+
+    def close(self) -> None:
+        if self._owns_client:
+            self.client.close()
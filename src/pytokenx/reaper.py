@@ -0,0 +1,113 @@
+from datetime import timedelta
+from typing import Dict, List, Optional
+import heapq
+import logging
+import threading
+
+from .base import TokenData
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryHeap:
+    """
+    按时间排序的小顶堆, 元素为 (过期或删除时间, token), 供内存型存储清理过期token
+
+    清理时只弹出时间早于截止时间的元素, 不需要遍历全部token。
+    token的时间被修改后旧元素不会立即移除, 弹出时按token当前的数据重新判断。
+    """
+
+    def __init__(self):
+        self._heap: List = []
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def build(self, tokens: Dict[str, TokenData]) -> None:
+        self._heap = [
+            (ts, token)
+            for token, token_data in tokens.items()
+            for ts in (token_data.expires_ts, token_data.deleted_ts)
+            if ts is not None
+        ]
+        heapq.heapify(self._heap)
+
+    def push(self, token_data: TokenData) -> None:
+        for ts in (token_data.expires_ts, token_data.deleted_ts):
+            if ts is not None:
+                heapq.heappush(self._heap, (ts, token_data.token))
+
+    def pop_due(self, tokens: Dict[str, TokenData], cutoff: float, limit: int) -> List[str]:
+        """
+        弹出过期时间或删除时间不晚于cutoff的token, 最多limit个, 不会从tokens中删除
+        """
+        due = []
+        seen = set()
+        heap = self._heap
+        while heap and heap[0][0] <= cutoff and len(due) < limit:
+            _, token = heapq.heappop(heap)
+            token_data = tokens.get(token)
+            if token_data is None or token in seen or not is_due(token_data, cutoff):
+                continue
+            seen.add(token)
+            due.append(token)
+        # 失效元素太多时重建
+        if len(heap) > 2 * len(tokens) + 1024:
+            self.build(tokens)
+        return due
+
+
+def is_due(token_data: TokenData, cutoff: float) -> bool:
+    """
+    过期时间或删除时间不晚于cutoff
+    """
+    return (
+        (token_data.expires_ts is not None and token_data.expires_ts <= cutoff)
+        or (token_data.deleted_ts is not None and token_data.deleted_ts <= cutoff)
+    )
+
+
+class TokenReaper:
+    """
+    后台清理线程, 每隔interval秒调用一次 token_manager.purge_expired
+
+    start() 时检查存储是否支持 purge_expired, 不支持时抛出 NotImplementedError;
+    运行中清理失败时记录日志, 下个周期重试。
+    """
+
+    def __init__(
+        self,
+        token_manager,
+        interval: float = 60, # 清理间隔(秒)
+        grace: timedelta = timedelta(0), # 过期或删除超过该时间后才清理
+        batch_size: int = 1000, # 每批清理的数量
+    ):
+        self.token_manager = token_manager
+        self.interval = interval
+        self.grace = grace
+        self.batch_size = batch_size
+        self.purged = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "TokenReaper":
+        # limit为0时不删除任何token, 只检查存储是否支持
+        self.token_manager.storage.purge_expired(0.0, 0)
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.purged += self.token_manager.purge_expired(self.grace, self.batch_size)
+            except Exception:
+                # 清理失败不影响服务, 下个周期重试
+                logger.exception("Failed to purge expired tokens")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,272 @@
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import json
+import time
+
+from .base import QUOTA_UNLIMITED, TokenConflictError, TokenData, TokenStorage
+
+redis_installed = True
+# 可选依赖
+try:
+    import redis
+except ImportError:
+    redis_installed = False
+
+
+# 不存在时写入, 存在时返回0
+_SAVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+if ARGV[1] ~= '' then
+    redis.call('PEXPIREAT', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+# 进入新的quota周期时把 r_quota 恢复为 quota, 返回当前的 r_quota; 旧数据没有周期字段
+_REFILL = """
+local function refill(key, now_ts)
+    local v = redis.call('HMGET', key, 'r_quota', 'quota', 'quota_period', 'quota_window')
+    if v[3] and v[3] ~= '' then
+        local period = tonumber(v[3])
+        if tonumber(v[4]) + period <= now_ts then
+            redis.call('HSET', key, 'r_quota', v[2], 'quota_window', now_ts - now_ts % period)
+            return v[2]
+        end
+    end
+    return v[1]
+end
+"""
+
+# 未删除、未过期且剩余quota足够时扣减, ARGV: cost, now, now_ts(整数秒)
+_CONSUME_SCRIPT = _REFILL + """
+local v = redis.call('HMGET', KEYS[1], 'r_quota', 'deleted_at', 'expires_at')
+if not v[1] then
+    return 0
+end
+local now = tonumber(ARGV[2])
+if v[2] ~= '' and now >= tonumber(v[2]) then
+    return 0
+end
+if v[3] ~= '' and now >= tonumber(v[3]) then
+    return 0
+end
+local r_quota = refill(KEYS[1], tonumber(ARGV[3]))
+if r_quota == '-inf' then
+    return 1
+end
+local cost = tonumber(ARGV[1])
+if tonumber(r_quota) < cost then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], 'r_quota', -cost)
+return 1
+"""
+
+# token存在且限额时修改剩余quota, ARGV: delta, now_ts
+_ADD_QUOTA_SCRIPT = _REFILL + """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local r_quota = refill(KEYS[1], tonumber(ARGV[2]))
+if r_quota ~= '-inf' then
+    redis.call('HINCRBY', KEYS[1], 'r_quota', ARGV[1])
+end
+return 0
+"""
+
+# 标记删除, 在删除时间和过期时间中较早的一个加上保留时间后过期, ARGV: now, 保留时间(秒)
+_DELETE_SCRIPT = """
+local expires_at = redis.call('HGET', KEYS[1], 'expires_at')
+if not expires_at then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'deleted_at', ARGV[1])
+local t = tonumber(ARGV[1])
+if expires_at ~= '' and tonumber(expires_at) < t then
+    t = tonumber(expires_at)
+end
+redis.call('PEXPIREAT', KEYS[1], math.floor((t + tonumber(ARGV[2])) * 1000))
+return 1
+"""
+
+
+def _ts_field(ts: Optional[float]) -> str:
+    return repr(ts) if ts is not None else ""
+
+
+def _quota_field(quota) -> str:
+    return "-inf" if quota == QUOTA_UNLIMITED else str(int(quota))
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisTokenStorage(TokenStorage):
+    """
+    Redis存储, 多个进程、多台机器可以共享
+
+    - 每个token一个hash, key为 key_prefix + token, 时间字段保存为epoch秒
+    - 设置了 expires_at 的token使用Redis原生过期, 在 expires_at + expire_grace 秒后由Redis删除,
+      已删除的token在 deleted_at + expire_grace 秒后删除, 因此不需要 purge_expired
+    - consume_quota 在一个Lua脚本中完成检查和扣减, 多个实例并发时也不会超额
+    - 批量操作使用pipeline, 一次往返
+
+    可以传入已有的 redis.Redis 客户端(此时close不会关闭客户端), 也可以传入url。
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        client=None,
+        key_prefix: str = "pytokenx:token:",
+        expire_grace: float = 0, # 过期或删除后在Redis中保留的秒数
+        **redis_kwargs,
+    ):
+        if not redis_installed:
+            raise ImportError("redis is not installed")
+        if client is None:
+            if url is None:
+                raise ValueError("url or client is required")
+            self.client = redis.Redis.from_url(url, **redis_kwargs)
+            self._owns_client = True
+        else:
+            self.client = client
+            self._owns_client = False
+        self.key_prefix = key_prefix
+        self.expire_grace = expire_grace
+        self._save = self.client.register_script(_SAVE_SCRIPT)
+        self._consume = self.client.register_script(_CONSUME_SCRIPT)
+        self._add_quota = self.client.register_script(_ADD_QUOTA_SCRIPT)
+        self._delete = self.client.register_script(_DELETE_SCRIPT)
+
+    def _key(self, token: str) -> str:
+        return self.key_prefix + token
+
+    def _expire_at_ms(self, ts: Optional[float]) -> str:
+        return str(int((ts + self.expire_grace) * 1000)) if ts is not None else ""
+
+    def _fields(self, token_data: TokenData) -> Dict[str, str]:
+        return {
+            "token_type": token_data.token_type,
+            "ext": json.dumps(token_data.ext),
+            "created_at": _ts_field(token_data.created_ts),
+            "expires_at": _ts_field(token_data.expires_ts),
+            "deleted_at": _ts_field(token_data.deleted_ts),
+            "quota": _quota_field(token_data.quota),
+            "r_quota": _quota_field(token_data.r_quota),
+            "quota_period": str(token_data.quota_period) if token_data.quota_period is not None else "",
+            "quota_window": str(token_data.quota_window) if token_data.quota_window is not None else "",
+        }
+
+    def _expire_ts(self, token_data: TokenData) -> Optional[float]:
+        # 过期时间和删除时间中较早的一个
+        times = [ts for ts in (token_data.expires_ts, token_data.deleted_ts) if ts is not None]
+        return min(times) if times else None
+
+    def _save_args(self, token_data: TokenData) -> List[str]:
+        args = [self._expire_at_ms(self._expire_ts(token_data))]
+        for field, value in self._fields(token_data).items():
+            args += [field, value]
+        return args
+
+    def _to_token_data(self, token: str, fields: Dict) -> Optional[TokenData]:
+        if not fields:
+            return None
+        fields = {_decode(k): _decode(v) for k, v in fields.items()}
+
+        def ts(name):
+            return datetime.fromtimestamp(float(fields[name])) if fields.get(name) else None
+
+        def quota(name):
+            return QUOTA_UNLIMITED if fields[name] == "-inf" else int(fields[name])
+
+        def integer(name):
+            return int(fields[name]) if fields.get(name) else None
+
+        return TokenData(
+            token=token,
+            token_type=fields["token_type"],
+            ext=json.loads(fields["ext"]),
+            created_at=ts("created_at"),
+            expires_at=ts("expires_at"),
+            deleted_at=ts("deleted_at"),
+            quota=quota("quota"),
+            r_quota=quota("r_quota"),
+            quota_period=integer("quota_period"),
+            quota_window=integer("quota_window"),
+        )
+
+    def close(self) -> None:
+        if self._owns_client:
+            self.client.close()
+
+    def save_token(self, token_data: TokenData) -> None:
+        if not self._save(keys=[self._key(token_data.token)], args=self._save_args(token_data)):
+            raise TokenConflictError(f"Token already exists: {token_data.token}")
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        if not token_data_list:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for token_data in token_data_list:
+            self._save(keys=[self._key(token_data.token)], args=self._save_args(token_data), client=pipe)
+        conflicts = [t.token for t, saved in zip(token_data_list, pipe.execute()) if not saved]
+        if conflicts:
+            raise TokenConflictError(f"Tokens already exist: {conflicts}")
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        return self._to_token_data(token, self.client.hgetall(self._key(token)))
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        pipe = self.client.pipeline(transaction=False)
+        for token in tokens:
+            pipe.hgetall(self._key(token))
+        result = {}
+        for token, fields in zip(tokens, pipe.execute()):
+            token_data = self._to_token_data(token, fields)
+            if token_data is not None:
+                result[token] = token_data
+        return result
+
+    def delete_token(self, token: str) -> None:
+        self._delete(keys=[self._key(token)], args=[repr(time.time()), self.expire_grace])
+
+    def update_token(self, token_data: TokenData) -> None:
+        key = self._key(token_data.token)
+        expire_at = self._expire_at_ms(self._expire_ts(token_data))
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(key, mapping=self._fields(token_data))
+        if expire_at:
+            pipe.pexpireat(key, int(expire_at))
+        else:
+            pipe.persist(key)
+        pipe.execute()
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        self._add_quota(keys=[self._key(token)], args=[quota_delta, int(time.time())])
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        if not quota_deltas:
+            return
+        now_ts = int(time.time())
+        pipe = self.client.pipeline(transaction=False)
+        for token, quota_delta in quota_deltas.items():
+            self._add_quota(keys=[self._key(token)], args=[quota_delta, now_ts], client=pipe)
+        pipe.execute()
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        now = time.time()
+        return self._consume(keys=[self._key(token)], args=[cost, repr(now), int(now)]) == 1
+
+    def iter_tokens(self) -> Iterator[str]:
+        prefix_len = len(self.key_prefix)
+        for key in self.client.scan_iter(match=self.key_prefix + "*", count=1000):
+            yield _decode(key)[prefix_len:]
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        # 过期和已删除的token由Redis按TTL自动删除
+        return 0
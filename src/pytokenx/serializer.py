@@ -0,0 +1,172 @@
+from abc import ABC, abstractmethod
+from datetime import timedelta, timezone
+from typing import Dict, Iterable, Optional, Tuple
+import json
+import struct
+
+from .base import QUOTA_UNLIMITED, TokenData
+
+msgpack_installed = True
+# 可选依赖, 用于序列化ext
+try:
+    import msgpack
+except ImportError:
+    msgpack_installed = False
+
+
+class TokenSerializer(ABC):
+    """
+    把一组token序列化为文件内容
+    """
+    name: str
+
+    @abstractmethod
+    def dumps(self, tokens: Iterable[TokenData]) -> bytes:
+        pass
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Dict[str, TokenData]:
+        pass
+
+
+class JSONTokenSerializer(TokenSerializer):
+    """
+    json格式 {token: TokenData.to_dict()}, 时间为ISO字符串, 与之前的文件格式相同
+    """
+    name = "json"
+
+    def dumps(self, tokens: Iterable[TokenData]) -> bytes:
+        return json.dumps({t.token: t.to_dict() for t in tokens}).encode()
+
+    def loads(self, data: bytes) -> Dict[str, TokenData]:
+        return {k: TokenData.from_dict(v) for k, v in json.loads(data).items()}
+
+
+_MAGIC = b"PTXB"
+_VERSION = 2
+# 文件头: magic, 版本, ext编码
+_HEADER = struct.Struct("<4sBc")
+# 记录: token长度, token_type长度, ext长度, 创建/过期/删除时间(NaN表示没有), quota, r_quota, UTC偏移秒数,
+# quota周期(0表示没有), 周期起点; 版本1没有最后两个字段
+_RECORD = struct.Struct("<HHIdddqqiqq")
+_RECORD_V1 = struct.Struct("<HHIdddqqi")
+_EXT_JSON = b"j"
+_EXT_MSGPACK = b"m"
+_INT64_MIN = -(2 ** 63)
+_NAIVE = -(2 ** 31)
+_NAN = float("nan")
+
+
+def _pack_quota(quota) -> int:
+    return _INT64_MIN if quota == QUOTA_UNLIMITED else int(quota)
+
+
+def _tz_offset(tz) -> int:
+    if tz is None:
+        return _NAIVE
+    offset = tz.utcoffset(None)
+    # 只保留固定的UTC偏移, 按地区的时区按本地时间还原
+    return int(offset.total_seconds()) if offset is not None else _NAIVE
+
+
+def _quota_window(window) -> Tuple[Optional[int], Optional[int]]:
+    # window: 版本2为[周期, 起点], 版本1为空
+    if window and window[0]:
+        return window[0], window[1]
+    return None, None
+
+
+class BinaryTokenSerializer(TokenSerializer):
+    """
+    紧凑的二进制格式: 文件头 + 连续的记录, 每条记录是定长的字段(struct打包) + token、token_type、ext
+
+    时间保存为epoch秒, 反序列化时不需要解析ISO字符串; 空ext不占空间。
+    ext 默认使用msgpack编码(已安装时), 否则使用json, 编码方式记录在文件头中。
+    """
+    name = "binary"
+
+    def __init__(self, ext_codec: Optional[str] = None): # "msgpack" / "json", 默认msgpack可用时用msgpack
+        if ext_codec is None:
+            ext_codec = "msgpack" if msgpack_installed else "json"
+        if ext_codec not in ("msgpack", "json"):
+            raise ValueError(f"Unknown ext_codec: {ext_codec}")
+        if ext_codec == "msgpack" and not msgpack_installed:
+            raise ImportError("msgpack is not installed")
+        self.ext_codec = ext_codec
+
+    @staticmethod
+    def matches(data: bytes) -> bool:
+        return data[:len(_MAGIC)] == _MAGIC
+
+    def dumps(self, tokens: Iterable[TokenData]) -> bytes:
+        if self.ext_codec == "msgpack":
+            codec, encode_ext = _EXT_MSGPACK, msgpack.packb
+        else:
+            codec, encode_ext = _EXT_JSON, lambda ext: json.dumps(ext, separators=(",", ":")).encode()
+        pack = _RECORD.pack
+        parts = [_HEADER.pack(_MAGIC, _VERSION, codec)]
+        for t in tokens:
+            token = t.token.encode()
+            token_type = t.token_type.encode()
+            ext = encode_ext(t.ext) if t.ext else b""
+            parts.append(pack(
+                len(token), len(token_type), len(ext),
+                t.created_ts,
+                t.expires_ts if t.expires_ts is not None else _NAN,
+                t.deleted_ts if t.deleted_ts is not None else _NAN,
+                _pack_quota(t.quota), _pack_quota(t.r_quota),
+                _tz_offset(t._tz),
+                t.quota_period or 0,
+                t.quota_window or 0,
+            ))
+            parts += (token, token_type, ext)
+        return b"".join(parts)
+
+    def loads(self, data: bytes) -> Dict[str, TokenData]:
+        magic, version, codec = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version not in (1, _VERSION):
+            raise ValueError("Not a binary token file")
+        if codec == _EXT_MSGPACK:
+            if not msgpack_installed:
+                raise ImportError("msgpack is not installed")
+            decode_ext = msgpack.unpackb
+        else:
+            decode_ext = json.loads
+        record = _RECORD if version == _VERSION else _RECORD_V1
+        unpack = record.unpack_from
+        size = record.size
+        from_ts = TokenData.from_ts
+        zones = {_NAIVE: None}
+        tokens = {}
+        pos, end = _HEADER.size, len(data)
+        while pos < end:
+            token_len, type_len, ext_len, created, expires, deleted, quota, r_quota, offset, *window = unpack(data, pos)
+            pos += size
+            token = data[pos:pos + token_len].decode()
+            pos += token_len
+            token_type = data[pos:pos + type_len].decode()
+            pos += type_len
+            ext = decode_ext(data[pos:pos + ext_len]) if ext_len else None
+            pos += ext_len
+            tz = zones.get(offset)
+            if tz is None and offset != _NAIVE:
+                tz = zones[offset] = timezone(timedelta(seconds=offset))
+            tokens[token] = from_ts(
+                token, token_type, ext, created,
+                expires if expires == expires else None,
+                deleted if deleted == deleted else None,
+                QUOTA_UNLIMITED if quota == _INT64_MIN else quota,
+                QUOTA_UNLIMITED if r_quota == _INT64_MIN else r_quota,
+                tz,
+                *_quota_window(window),
+            )
+        return tokens
+
+
+def detect_serializer(data: bytes) -> TokenSerializer:
+    """
+    按文件内容判断格式
+    """
+    if BinaryTokenSerializer.matches(data):
+        return BinaryTokenSerializer()
+    return JSONTokenSerializer()
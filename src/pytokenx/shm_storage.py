@@ -0,0 +1,421 @@
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .base import QUOTA_UNLIMITED, TokenConflictError, TokenData, TokenStorage, quota_window_start
+
+fcntl_installed = True
+# fcntl 只在类unix系统上可用
+try:
+    import fcntl
+except ImportError:
+    fcntl_installed = False
+
+
+_HEADER = struct.Struct("<4sIIIII")
+_HEADER_SIZE = 64
+_MAGIC = b"PTXM"
+_VERSION = 2
+# 槽位头: 状态, token长度, token_type长度, ext长度, 创建/过期/删除时间, quota, r_quota, quota周期(0表示没有), 周期起点
+_SLOT = struct.Struct("<BBHH2xdddqqqq")
+_QUOTA = 32 # quota 在槽位中的偏移, 其后依次是 r_quota、quota周期、周期起点
+_R_QUOTA = _QUOTA + 8
+_EMPTY, _USED, _REMOVED = 0, 1, 2
+_INT64_MIN = -(2 ** 63)
+
+
+def _ts(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def _pack_quota(quota) -> int:
+    return _INT64_MIN if quota == QUOTA_UNLIMITED else int(quota)
+
+
+def _unpack_quota(value: int):
+    return QUOTA_UNLIMITED if value == _INT64_MIN else value
+
+
+class MmapTokenStorage(TokenStorage):
+    """
+    多进程共享的内存映射存储, 适合gunicorn等pre-fork部署, 同一台机器上的所有worker映射同一个文件
+
+    文件是定长槽位的哈希表(开放寻址), 每个槽位保存token、类型、ext(json)、时间和quota计数。
+    数据只有一份, 由操作系统页缓存共享, 内存占用不随worker数量增加。
+
+    - 修改单个token(quota扣减、删除、更新)时对该槽位加fcntl记录锁, 不同token之间互不阻塞
+    - 插入和清理时锁住文件头, 保证同一个token只占一个槽位
+    - 清理后重新插入同一探测链上的记录, 不留下删除标记, 未命中的查询不会扫描整个表;
+      记录可能因此移动, 查询未命中时在文件头的共享锁下再确认一次
+    - 容量在创建文件时确定, token数、token_type和ext的长度都有上限
+
+    同一进程内的线程之间用一把锁串行化(fcntl记录锁不能区分同一进程的线程)。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: int = 100000, # 槽位数量, 建议为预期token数的1.5倍以上
+        key_size: int = 64, # token最大字节数
+        type_size: int = 32, # token_type最大字节数
+        ext_size: int = 256, # ext序列化为json后的最大字节数
+    ):
+        if not fcntl_installed:
+            raise ImportError("MmapTokenStorage requires fcntl")
+        if type_size > 255:
+            raise ValueError("type_size must be <= 255")
+        self.path = path
+        self._lock = threading.RLock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            with self._file_lock(0, _HEADER_SIZE):
+                if os.fstat(self._fd).st_size == 0:
+                    header = _HEADER.pack(_MAGIC, _VERSION, capacity, key_size, type_size, ext_size)
+                    os.write(self._fd, header.ljust(_HEADER_SIZE, b"\0"))
+                    slot_size = _SLOT.size + key_size + type_size + ext_size
+                    os.ftruncate(self._fd, _HEADER_SIZE + capacity * slot_size)
+                magic, version, capacity, key_size, type_size, ext_size = _HEADER.unpack(
+                    os.pread(self._fd, _HEADER.size, 0)
+                )
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"Not a token store file: {path}")
+        except BaseException:
+            os.close(self._fd)
+            raise
+        # 已有文件以文件头中的参数为准
+        self.capacity = capacity
+        self.key_size = key_size
+        self.type_size = type_size
+        self.ext_size = ext_size
+        self.slot_size = _SLOT.size + key_size + type_size + ext_size
+        self._mm = mmap.mmap(self._fd, _HEADER_SIZE + capacity * self.slot_size)
+        self._purge_cursor = 0 # 下次清理开始扫描的槽位
+
+    @contextmanager
+    def _file_lock(self, start: int, length: int, shared: bool = False):
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, start)
+
+    def _offset(self, index: int) -> int:
+        return _HEADER_SIZE + index * self.slot_size
+
+    def _record_lock(self, index: int, shared: bool = False):
+        return self._file_lock(self._offset(index), self.slot_size, shared)
+
+    def _table_lock(self, shared: bool = False):
+        return self._file_lock(0, _HEADER_SIZE, shared)
+
+    def _find_index(self, key: bytes) -> Optional[int]:
+        """
+        查询token所在槽位, 不需要持有表锁
+        """
+        index, _ = self._find(key)
+        if index is None:
+            # 清理时记录可能正在移动, 未找到时在表锁下再确认一次
+            with self._table_lock(shared=True):
+                index, _ = self._find(key)
+        return index
+
+    def _probe(self, key: bytes) -> Iterator[int]:
+        start = int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") % self.capacity
+        for i in range(self.capacity):
+            yield (start + i) % self.capacity
+
+    def _find(self, key: bytes) -> Tuple[Optional[int], Optional[int]]:
+        """
+        返回 (token所在槽位, 第一个可用槽位), 不存在时前者为None
+        """
+        mm = self._mm
+        free = None
+        for index in self._probe(key):
+            state = mm[self._offset(index)]
+            if state == _EMPTY:
+                return None, free if free is not None else index
+            if state == _REMOVED:
+                if free is None:
+                    free = index
+                continue
+            if self._matches(index, key):
+                return index, free
+        return None, free
+
+    def _matches(self, index: int, key: bytes) -> bool:
+        mm = self._mm
+        offset = self._offset(index)
+        key_len = int.from_bytes(mm[offset + 2:offset + 4], "little")
+        start = offset + _SLOT.size
+        return mm[offset] == _USED and key_len == len(key) and mm[start:start + key_len] == key
+
+    def _encode(self, token_data: TokenData) -> Tuple[bytes, bytes, bytes]:
+        key = token_data.token.encode()
+        token_type = token_data.token_type.encode()
+        ext = json.dumps(token_data.ext, separators=(",", ":")).encode()
+        if len(key) > self.key_size or len(token_type) > self.type_size or len(ext) > self.ext_size:
+            raise ValueError(f"Token data too large for this store: {token_data.token}")
+        return key, token_type, ext
+
+    def _write(self, index: int, token_data: TokenData) -> None:
+        key, token_type, ext = self._encode(token_data)
+        offset = self._offset(index)
+        body = offset + _SLOT.size
+        mm = self._mm
+        mm[body:body + len(key)] = key
+        body += self.key_size
+        mm[body:body + len(token_type)] = token_type
+        body += self.type_size
+        mm[body:body + len(ext)] = ext
+        nan = float("nan")
+        # 状态最后写入, 其他进程不会读到写了一半的新记录; 更新已有记录时状态保持不变
+        _SLOT.pack_into(
+            mm, offset, mm[offset], len(token_type), len(key), len(ext),
+            token_data.created_ts,
+            token_data.expires_ts if token_data.expires_ts is not None else nan,
+            token_data.deleted_ts if token_data.deleted_ts is not None else nan,
+            _pack_quota(token_data.quota),
+            _pack_quota(token_data.r_quota),
+            token_data.quota_period or 0,
+            token_data.quota_window or 0,
+        )
+        mm[offset] = _USED
+
+    def _read(self, index: int) -> TokenData:
+        offset = self._offset(index)
+        mm = self._mm
+        _, type_len, key_len, ext_len, created, expires, deleted, quota, r_quota, period, window = _SLOT.unpack_from(mm, offset)
+        body = offset + _SLOT.size
+        token = mm[body:body + key_len].decode()
+        body += self.key_size
+        token_type = mm[body:body + type_len].decode()
+        body += self.type_size
+        ext = json.loads(mm[body:body + ext_len])
+        expires, deleted = _ts(expires), _ts(deleted)
+        return TokenData(
+            token=token,
+            token_type=token_type,
+            ext=ext,
+            created_at=datetime.fromtimestamp(created),
+            expires_at=datetime.fromtimestamp(expires) if expires is not None else None,
+            deleted_at=datetime.fromtimestamp(deleted) if deleted is not None else None,
+            quota=_unpack_quota(quota),
+            r_quota=_unpack_quota(r_quota),
+            quota_period=period or None,
+            quota_window=window if period else None,
+        )
+
+    def _insert(self, token_data: TokenData) -> None:
+        # 需持有表锁
+        index, free = self._find(token_data.token.encode())
+        if index is not None:
+            raise TokenConflictError(f"Token already exists: {token_data.token}")
+        if free is None:
+            raise RuntimeError("Token store is full")
+        with self._record_lock(free):
+            self._write(free, token_data)
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._mm.closed:
+                self._mm.flush()
+                self._mm.close()
+                os.close(self._fd)
+
+    def save_token(self, token_data: TokenData) -> None:
+        with self._table_lock():
+            self._insert(token_data)
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        with self._table_lock():
+            for token_data in token_data_list:
+                self._insert(token_data)
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        key = token.encode()
+        while True:
+            index = self._find_index(key)
+            if index is None:
+                return None
+            with self._record_lock(index, shared=True):
+                # 加锁前槽位可能已被清理并复用
+                if self._matches(index, key):
+                    return self._read(index)
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        result = {}
+        for token in tokens:
+            token_data = self.get_token(token)
+            if token_data is not None:
+                result[token] = token_data
+        return result
+
+    @contextmanager
+    def _locked_slot(self, token: str):
+        """
+        对token所在槽位加排他锁, token不存在时得到None
+        """
+        key = token.encode()
+        while True:
+            index = self._find_index(key)
+            if index is None:
+                yield None
+                return
+            with self._record_lock(index):
+                # 加锁前槽位可能已被清理并复用
+                if self._matches(index, key):
+                    yield self._offset(index)
+                    return
+
+    def delete_token(self, token: str) -> None:
+        with self._locked_slot(token) as offset:
+            if offset is not None:
+                struct.pack_into("<d", self._mm, offset + 24, time.time())
+
+    def update_token(self, token_data: TokenData) -> None:
+        with self._table_lock():
+            index, _ = self._find(token_data.token.encode())
+            if index is None:
+                self._insert(token_data)
+                return
+            with self._record_lock(index):
+                self._write(index, token_data)
+
+    def _refill(self, offset: int) -> int:
+        """
+        进入新的quota周期时恢复r_quota, 返回当前的r_quota; 需持有槽位锁
+        """
+        quota, r_quota, period, window = struct.unpack_from("<qqqq", self._mm, offset + _QUOTA)
+        if period:
+            now = int(time.time())
+            if now >= window + period:
+                r_quota = quota
+                struct.pack_into("<q", self._mm, offset + _R_QUOTA, r_quota)
+                struct.pack_into("<q", self._mm, offset + _QUOTA + 24, quota_window_start(now, period))
+        return r_quota
+
+    def _add(self, offset: int, quota_delta: int) -> None:
+        r_quota = self._refill(offset)
+        if r_quota != _INT64_MIN:
+            struct.pack_into("<q", self._mm, offset + _R_QUOTA, r_quota + quota_delta)
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        with self._locked_slot(token) as offset:
+            if offset is not None:
+                self._add(offset, quota_delta)
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        for token, quota_delta in quota_deltas.items():
+            self.add_quota(token, quota_delta)
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        with self._locked_slot(token) as offset:
+            if offset is None:
+                return False
+            expires, deleted = struct.unpack_from("<dd", self._mm, offset + 16)
+            now = time.time()
+            if (not math.isnan(deleted) and now >= deleted) or (not math.isnan(expires) and now >= expires):
+                return False
+            r_quota = self._refill(offset)
+            if r_quota == _INT64_MIN:
+                return True
+            if r_quota < cost:
+                return False
+            struct.pack_into("<q", self._mm, offset + _R_QUOTA, r_quota - cost)
+            return True
+
+    def iter_tokens(self) -> Iterator[str]:
+        mm = self._mm
+        for index in range(self.capacity):
+            offset = self._offset(index)
+            if mm[offset] == _USED:
+                key_len = int.from_bytes(mm[offset + 2:offset + 4], "little")
+                yield mm[offset + _SLOT.size:offset + _SLOT.size + key_len].decode()
+
+    def _rehash_run(self, run: List[int]) -> None:
+        """
+        清空一段连续的非空槽位(探测链), 再重新插入其中的记录, 去掉删除标记; 需持有表锁
+        记录的起始槽位都在这段之内, 重新插入后不会落到这段之外
+        """
+        mm = self._mm
+        size = self.slot_size
+        with ExitStack() as stack:
+            for index in run:
+                stack.enter_context(self._record_lock(index))
+            records = []
+            for index in run:
+                offset = self._offset(index)
+                if mm[offset] == _USED:
+                    records.append(bytes(mm[offset:offset + size]))
+                mm[offset] = _EMPTY
+            for record in records:
+                key_len = int.from_bytes(record[2:4], "little")
+                key = record[_SLOT.size:_SLOT.size + key_len]
+                _, free = self._find(key)
+                offset = self._offset(free)
+                # 状态最后写入
+                mm[offset + 1:offset + size] = record[1:]
+                mm[offset] = _USED
+
+    def _remove_tombstones(self, removed: List[int]) -> None:
+        """
+        重新插入含删除标记的探测链, removed 为刚标记删除的槽位; 需持有表锁
+        """
+        mm = self._mm
+        capacity = self.capacity
+        done = set()
+        for index in removed:
+            if index in done:
+                continue
+            # 向前找到所在探测链的起点
+            start = index
+            for _ in range(capacity):
+                prev = (start - 1) % capacity
+                if mm[self._offset(prev)] == _EMPTY:
+                    break
+                start = prev
+            else:
+                # 没有空槽位时整个表是一条探测链
+                self._rehash_run(list(range(capacity)))
+                return
+            run = []
+            while mm[self._offset(start)] != _EMPTY:
+                run.append(start)
+                start = (start + 1) % capacity
+            done.update(run)
+            self._rehash_run(run)
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        # 从上次停下的槽位继续扫描, 分批清理时整个表只扫描一遍;
+        # 清理的槽位先标记为已删除, 最后重新插入受影响的探测链
+        if limit <= 0:
+            return 0
+        removed = []
+        mm = self._mm
+        capacity = self.capacity
+        with self._table_lock():
+            for i in range(capacity):
+                index = (self._purge_cursor + i) % capacity
+                offset = self._offset(index)
+                if mm[offset] != _USED:
+                    continue
+                expires, deleted = struct.unpack_from("<dd", mm, offset + 16)
+                if (not math.isnan(deleted) and deleted <= cutoff) or (not math.isnan(expires) and expires <= cutoff):
+                    with self._record_lock(index):
+                        mm[offset] = _REMOVED
+                    removed.append(index)
+                    if len(removed) >= limit:
+                        self._purge_cursor = (index + 1) % capacity
+                        break
+            if removed:
+                self._remove_tombstones(removed)
+        return len(removed)
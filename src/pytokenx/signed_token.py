@@ -0,0 +1,118 @@
+from datetime import datetime
+from typing import Dict, Optional
+import base64
+import hashlib
+import hmac
+import json
+
+from .base import QUOTA_UNLIMITED, TokenData
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class TokenSigner:
+    """
+    签名token: <kid>.<payload>.<签名>, payload为base64url编码的json, 签名为HMAC-SHA256
+
+    payload包含 j(随机id) t(token_type) c(创建时间) e(过期时间) x(ext) q(是否限额),
+    验证时不需要查询存储就能得到token类型、过期时间和ext。
+
+    密钥轮换: rotate(kid, key) 之后新token使用新密钥签名, 旧密钥签名的token仍然有效,
+    直到调用 retire(kid) 移除旧密钥。
+
+    签名token也会保存到存储中(用于吊销和quota), ext较大时注意存储的token字段长度,
+    SQLAlchemyTokenStorage 默认为512个字符。
+    """
+
+    def __init__(self, keys: Dict[str, bytes], current_kid: Optional[str] = None):
+        if not keys:
+            raise ValueError("at least one key is required")
+        self.keys: Dict[str, bytes] = {}
+        for kid, key in keys.items():
+            self._check_kid(kid)
+            self.keys[kid] = key
+        self.current_kid = current_kid or list(keys)[-1]
+        if self.current_kid not in self.keys:
+            raise ValueError(f"Unknown kid: {self.current_kid!r}")
+
+    @staticmethod
+    def _check_kid(kid: str) -> None:
+        if not kid or "." in kid:
+            raise ValueError(f"Invalid kid: {kid!r}")
+
+    def rotate(self, kid: str, key: bytes) -> None:
+        """
+        添加新密钥并用于之后签发的token
+        """
+        self._check_kid(kid)
+        self.keys[kid] = key
+        self.current_kid = kid
+
+    def retire(self, kid: str) -> None:
+        """
+        移除旧密钥, 用它签名的token不再有效
+        """
+        if kid == self.current_kid:
+            raise ValueError("Cannot retire the current key")
+        self.keys.pop(kid, None)
+
+    @staticmethod
+    def _signature(key: bytes, signing_input: str) -> str:
+        return _b64encode(hmac.new(key, signing_input.encode("ascii"), hashlib.sha256).digest())
+
+    def sign(self, token_data: TokenData, jti: str) -> str:
+        """
+        按token数据签发token, jti为随机id, 保证相同数据的token也不重复
+        """
+        claims = {"j": jti, "t": token_data.token_type, "c": token_data.created_ts}
+        if token_data.expires_ts is not None:
+            claims["e"] = token_data.expires_ts
+        if token_data.ext:
+            claims["x"] = token_data.ext
+        if token_data.quota != QUOTA_UNLIMITED:
+            claims["q"] = 1
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        signing_input = self.current_kid + "." + payload
+        return signing_input + "." + self._signature(self.keys[self.current_kid], signing_input)
+
+    def verify(self, token: str) -> Optional[Dict]:
+        """
+        校验签名, 通过时返回payload, 否则返回None; 不检查过期时间
+        """
+        if not token.isascii():
+            # 签名token只含ASCII字符, 编码和 compare_digest 都不接受非ASCII字符串
+            return None
+        parts = token.split(".")
+        if len(parts) != 3:
+            return None
+        key = self.keys.get(parts[0])
+        if key is None:
+            return None
+        signing_input = parts[0] + "." + parts[1]
+        if not hmac.compare_digest(self._signature(key, signing_input), parts[2]):
+            return None
+        try:
+            claims = json.loads(_b64decode(parts[1]))
+        except ValueError:
+            return None
+        return claims if isinstance(claims, dict) else None
+
+    @staticmethod
+    def to_token_data(token: str, claims: Dict) -> TokenData:
+        """
+        由payload构造TokenData, 只用于不限额的token, quota固定为不限
+        """
+        expires_ts = claims.get("e")
+        return TokenData(
+            token=token,
+            token_type=claims.get("t", "default"),
+            ext=claims.get("x"),
+            created_at=datetime.fromtimestamp(claims["c"]) if "c" in claims else None,
+            expires_at=datetime.fromtimestamp(expires_ts) if expires_ts is not None else None,
+        )
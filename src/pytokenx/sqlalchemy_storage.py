@@ -1,146 +1,325 @@
-from dataclasses import MISSING, fields
 from datetime import datetime
-import json
-from typing import Optional, Dict
+from operator import attrgetter
+from typing import Optional, Dict, Iterator, List
 from .base import TokenStorage, TokenData
+import time
 
 sqlalchemy_installed = True
 # 可选依赖
 try:
-    from sqlalchemy import create_engine, Column, String, Integer, DateTime, JSON, Boolean
-    from sqlalchemy.orm import sessionmaker, declarative_base
+    from sqlalchemy import create_engine, Column, String, Integer, DateTime, JSON, bindparam, and_, or_, select
+    from sqlalchemy import BigInteger, case, inspect, text
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import declarative_base
     Base = declarative_base()
 
+
+    class TokenFieldMapping:
+        """
+        TokenData字段与表列的对应关系, 每个表结构只计算一次, 转换时不再反射字段或试探序列化
+
+        表中不存在的TokenData字段存入ext
+        """
+
+        def __init__(self, table):
+            columns = {c.name for c in table.columns}
+            self.column_fields = tuple(name for name in TokenData.FIELDS if name in columns)
+            self.ext_fields = tuple(name for name in TokenData.FIELDS if name not in columns)
+            # 按 column_fields 的顺序一次取出所有字段值
+            self.get_values = attrgetter(*self.column_fields)
+            # 列与TokenData构造参数顺序完全一致时可以直接按位置构造
+            self.positional = self.column_fields == TokenData.FIELDS
+
+        def to_row(self, token_data: TokenData) -> Dict:
+            row = dict(zip(self.column_fields, self.get_values(token_data)))
+            if self.ext_fields:
+                ext = dict(token_data.ext or {})
+                for name in self.ext_fields:
+                    ext[name] = _ext_value(getattr(token_data, name))
+                row["ext"] = ext
+            return row
+
+        def from_values(self, values) -> TokenData:
+            """
+            values 与 column_fields 顺序一致, 可以是ORM实例的字段值, 也可以是Core查询结果的一行
+            """
+            if self.positional:
+                return TokenData(*values)
+            init_data = dict(zip(self.column_fields, values))
+            ext = init_data.get("ext")
+            if ext:
+                for name in self.ext_fields:
+                    if name in ext:
+                        value = ext[name]
+                        if name in _TIME_FIELDS and isinstance(value, str):
+                            value = datetime.fromisoformat(value)
+                        init_data[name] = value
+            return TokenData(**init_data)
+
+
+    _TIME_FIELDS = ("created_at", "expires_at", "deleted_at")
+
+
+    def _ext_value(value):
+        # 存入ext的值需要能JSON序列化
+        if value is None or isinstance(value, (str, int, float, bool, dict, list)):
+            return value
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
+
+
+    _field_mappings: Dict = {}
+
+
+    def field_mapping(table) -> TokenFieldMapping:
+        mapping = _field_mappings.get(table)
+        if mapping is None:
+            mapping = _field_mappings[table] = TokenFieldMapping(table)
+        return mapping
+
+
     class TokenModel(Base):
         """Token data structure for database storage"""
         __tablename__ = 'tokens'
 
         id = Column(Integer, primary_key=True, autoincrement=True)
-        token = Column(String(100), unique=True, nullable=False, index=True)
+        # 签名token较长(最短约155个字符), MySQL utf8mb4 唯一索引最多768个字符
+        token = Column(String(512), unique=True, nullable=False, index=True)
         token_type = Column(String(20), nullable=False, default="default")
         ext = Column(JSON, nullable=True, default={})
         created_at = Column(DateTime, nullable=False, default=datetime.now)
-        expires_at = Column(DateTime, nullable=True)
-        deleted_at = Column(DateTime, nullable=True)
+        expires_at = Column(DateTime, nullable=True, index=True)
+        deleted_at = Column(DateTime, nullable=True, index=True)
         quota = Column(Integer, nullable=False, default=-1)
         r_quota = Column(Integer, nullable=False, default=-1)
+        quota_period = Column(Integer, nullable=True) # quota重置周期(秒)
+        quota_window = Column(BigInteger, nullable=True) # 当前quota周期的开始时间(epoch秒)
 
         @classmethod
         def from_token_data(cls, token_data: TokenData) -> 'TokenModel':
             """Convert TokenData to TokenModel"""
-            # 获取数据库模型中定义的字段
-            model_fields = {c.name for c in cls.__table__.columns}
-            
-            # 创建模型实例的初始化数据
-            init_data = {}
-            
-            # 处理基本字段
-            for field in fields(token_data):
-                field_name = field.name
-                if field_name in model_fields:
-                    # 如果字段在数据库模型中存在，直接使用
-                    init_data[field_name] = getattr(token_data, field_name)
-                else:
-                    # 如果字段不在数据库模型中，存入ext
-                    if token_data.ext is None:
-                        token_data.ext = {}
-                    value = getattr(token_data, field_name)
-                    # 确保值是JSON可序列化的
-                    try:
-                        json.dumps(value)
-                        token_data.ext[field_name] = value
-                    except (TypeError, OverflowError):
-                        # 如果值不可序列化（如datetime对象），存储其字符串表示
-                        if isinstance(value, datetime):
-                            token_data.ext[field_name] = value.isoformat()
-                        else:
-                            token_data.ext[field_name] = str(value)
-            
-            init_data['ext'] = token_data.ext
-            return cls(**init_data)
+            return cls(**field_mapping(cls.__table__).to_row(token_data))
 
         def to_token_data(self) -> TokenData:
             """Convert TokenModel to TokenData"""
-            # 获取TokenData的字段信息
-            token_data_fields = {f.name: f for f in fields(TokenData)}
-            
-            # 准备初始化数据
-            init_data = {}
-            
-            # 处理基本字段
-            for field_name, field in token_data_fields.items():
-                if hasattr(self, field_name):
-                    init_data[field_name] = getattr(self, field_name)
-                elif self.ext and field_name in self.ext:
-                    # 从ext中获取额外字段
-                    init_data[field_name] = self.ext[field_name]
-                elif field.default is not MISSING:
-                    # 使用默认值
-                    init_data[field_name] = field.default
-                elif field.default_factory is not MISSING:
-                    # 使用默认工厂函数
-                    init_data[field_name] = field.default_factory()
-                else:
-                    # 对于没有默认值的字段，设置为None
-                    init_data[field_name] = None
-            
-            return TokenData(**init_data)
+            mapping = field_mapping(self.__table__)
+            return mapping.from_values(mapping.get_values(self))
+
+    class TokenStatements:
+        """
+        预先构造的Core语句, 参数都通过bindparam传入, 语句对象只构造一次,
+        SQLAlchemy按语句结构缓存编译结果, 热路径上不再重复构造ORM查询。同步和异步存储共用。
+        """
+
+        def __init__(self, table):
+            c = table.c
+            self.mapping = field_mapping(table)
+            token = bindparam("_token")
+            now = bindparam("_now")
+            cost = bindparam("_cost")
+            # 查询列的顺序与 mapping.column_fields 一致
+            self.columns = [c[name] for name in self.mapping.column_fields]
+            self.select_one = select(*self.columns).where(c.token == token)
+            self.select_many = select(*self.columns).where(c.token.in_(bindparam("_tokens", expanding=True)))
+            self.select_all = select(*self.columns)
+            self.select_tokens = select(c.token)
+            self.insert = table.insert()
+            self.update = table.update().where(c.token == token).values(
+                {name: bindparam("_" + name) for name in self.mapping.column_fields if name != "token"}
+            )
+            self.delete = table.update().where(c.token == token).values(deleted_at=now)
+            # 进入新的quota周期时先把 r_quota 恢复为 quota, 在同一条UPDATE中完成
+            now_ts = bindparam("_now_ts", type_=BigInteger)
+            expired = and_(c.quota_period.isnot(None), c.quota_window + c.quota_period <= now_ts)
+            r_quota = case((expired, c.quota), else_=c.r_quota)
+            quota_window = case((expired, now_ts - now_ts % c.quota_period), else_=c.quota_window)
+            self.add_quota = table.update().where(c.token == token).values(
+                r_quota=r_quota + bindparam("_delta"), quota_window=quota_window
+            )
+            # 条件扣减quota, 未删除、未过期且剩余quota足够时才扣减
+            self.consume_quota = table.update().where(and_(
+                c.token == token,
+                r_quota >= cost,
+                or_(c.deleted_at.is_(None), c.deleted_at > now),
+                or_(c.expires_at.is_(None), c.expires_at > now),
+            )).values(r_quota=r_quota - cost, quota_window=quota_window)
+            # 清理过期/已删除token, 先按索引取出一批id再删除
+            cutoff = bindparam("_cutoff")
+            self.purge_select = select(c.id).where(
+                or_(c.expires_at <= cutoff, c.deleted_at <= cutoff)
+            ).limit(bindparam("_limit"))
+            self.purge_delete = table.delete().where(c.id.in_(bindparam("_ids", expanding=True)))
+
+        def row_params(self, token_data: TokenData) -> Dict:
+            return self.mapping.to_row(token_data)
+
+        def update_params(self, token_data: TokenData) -> Dict:
+            # 参数名加前缀, 避免与UPDATE中的列名冲突; token列对应where中的 _token
+            return {"_" + name: value for name, value in self.mapping.to_row(token_data).items()}
+
+        def to_token_data(self, row) -> TokenData:
+            """
+            直接从Core查询结果的一行构造TokenData, 不创建ORM实例
+            """
+            return self.mapping.from_values(row)
+
+    token_statements = TokenStatements(TokenModel.__table__)
+
+    def _add_missing_columns(conn) -> None:
+        # 旧版本创建的表没有新增的列, 新增的列都允许为空
+        table = TokenModel.__table__
+        existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+    def create_tables(bind) -> None:
+        Base.metadata.create_all(bind)
+        if isinstance(bind, Engine):
+            with bind.begin() as conn:
+                _add_missing_columns(conn)
+        else:
+            _add_missing_columns(bind)
+        # create_all 不会给已存在的表补建索引
+        for index in TokenModel.__table__.indexes:
+            index.create(bind, checkfirst=True)
 except ImportError:
     sqlalchemy_installed = False
 
 
 
 class SQLAlchemyTokenStorage(TokenStorage):
-    def __init__(self, connection_string: str):
+    """
+    SQLAlchemy存储
+
+    可以传入连接字符串, 也可以传入已有的Engine(此时close不会dispose该Engine)。
+    pool_size/max_overflow/pool_pre_ping/pool_recycle 以及其他 engine_kwargs 直接传给 create_engine,
+    为None的参数使用SQLAlchemy的默认值。
+    """
+    BATCH_SIZE = 500 # 批量查询时每条SQL的最大token数
+
+    def __init__(
+        self,
+        connection_string: Optional[str] = None,
+        engine=None,
+        pool_size: Optional[int] = None, # 连接池大小
+        max_overflow: Optional[int] = None, # 连接池满时允许额外创建的连接数
+        pool_pre_ping: Optional[bool] = None, # 使用连接前先检测连接是否可用
+        pool_recycle: Optional[int] = None, # 连接超过该秒数后重建
+        **engine_kwargs,
+    ):
         if not sqlalchemy_installed:
             raise ImportError("SQLAlchemy is not installed")
-        self.engine = create_engine(connection_string)
-        Base.metadata.create_all(self.engine)
-        self.Session = sessionmaker(bind=self.engine)
+        if engine is None:
+            if connection_string is None:
+                raise ValueError("connection_string or engine is required")
+            pool_options = {
+                "pool_size": pool_size,
+                "max_overflow": max_overflow,
+                "pool_pre_ping": pool_pre_ping,
+                "pool_recycle": pool_recycle,
+            }
+            engine_kwargs.update({k: v for k, v in pool_options.items() if v is not None})
+            self.engine = create_engine(connection_string, **engine_kwargs)
+            self._owns_engine = True
+        else:
+            self.engine = engine
+            self._owns_engine = False
+        create_tables(self.engine)
+        self._stmts = token_statements
     
     def close(self):
-        if self.Session:
-            self.Session.close_all()
-        if self.engine:
+        if self._owns_engine:
             self.engine.dispose()
 
     def save_token(self, token_data: TokenData) -> None:
-        session = self.Session()
-        token_model = TokenModel.from_token_data(token_data)
-        session.add(token_model)
-        session.commit()
-        session.close()
+        with self.engine.begin() as conn:
+            conn.execute(self._stmts.insert, self._stmts.row_params(token_data))
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        if not token_data_list:
+            return
+        # 一条多行INSERT
+        with self.engine.begin() as conn:
+            conn.execute(self._stmts.insert, [self._stmts.row_params(t) for t in token_data_list])
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        result = {}
+        with self.engine.connect() as conn:
+            # 分批查询, 避免超过数据库绑定参数数量的限制
+            for i in range(0, len(tokens), self.BATCH_SIZE):
+                chunk = tokens[i:i + self.BATCH_SIZE]
+                for row in conn.execute(self._stmts.select_many, {"_tokens": chunk}):
+                    token_data = self._stmts.to_token_data(row)
+                    result[token_data.token] = token_data
+        return result
 
     def get_token(self, token: str) -> Optional[TokenData]:
-        session = self.Session()
-        token_model = (
-            session.query(TokenModel).filter_by(token=token).first()
-        )
-        session.close()
-
-        if token_model:
-            return token_model.to_token_data()
+        with self.engine.connect() as conn:
+            row = conn.execute(self._stmts.select_one, {"_token": token}).first()
+        if row:
+            return self._stmts.to_token_data(row)
         return None
 
     def delete_token(self, token: str) -> None:
-        session = self.Session()
-        token_model = session.query(TokenModel).filter_by(token=token).first()
-        if token_model:
-            token_model.deleted_at = datetime.now()
-            session.commit()
-        session.close()
+        with self.engine.begin() as conn:
+            conn.execute(self._stmts.delete, {"_token": token, "_now": datetime.now()})
     
     def update_token(self, token_data: TokenData) -> None:
-        session = self.Session()
-        token_model = session.query(TokenModel).filter_by(token=token_data.token).first()
-        if token_model:
-            token_model.from_token_data(token_data)
-            session.commit()
-        session.close()
+        with self.engine.begin() as conn:
+            conn.execute(self._stmts.update, self._stmts.update_params(token_data))
 
     def add_quota(self, token: str, quota_delta: int) -> None:
-        session = self.Session()
-        session.query(TokenModel).filter_by(token=token).update({TokenModel.r_quota: TokenModel.r_quota + quota_delta})
-        session.commit()
-        session.close()
-    
\ No newline at end of file
+        with self.engine.begin() as conn:
+            conn.execute(self._stmts.add_quota, {"_token": token, "_delta": quota_delta, "_now_ts": int(time.time())})
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        if not quota_deltas:
+            return
+        # 一次executemany
+        now_ts = int(time.time())
+        with self.engine.begin() as conn:
+            conn.execute(
+                self._stmts.add_quota,
+                [{"_token": token, "_delta": delta, "_now_ts": now_ts} for token, delta in quota_deltas.items()],
+            )
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        # 一条条件UPDATE, 并发时也不会扣成负数
+        now = time.time()
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                self._stmts.consume_quota,
+                {"_token": token, "_cost": cost, "_now": datetime.fromtimestamp(now), "_now_ts": int(now)},
+            )
+        return result.rowcount == 1
+
+    def consume_quotas(self, costs: Dict[str, int]) -> Optional[Dict[str, bool]]:
+        # 每个token一条条件UPDATE, 在同一个事务中执行
+        now = time.time()
+        params = {"_now": datetime.fromtimestamp(now), "_now_ts": int(now)}
+        result = {}
+        with self.engine.begin() as conn:
+            for token, cost in costs.items():
+                rows = conn.execute(self._stmts.consume_quota, {"_token": token, "_cost": cost, **params})
+                result[token] = rows.rowcount == 1
+        return result
+
+    def iter_tokens(self) -> Iterator[str]:
+        with self.engine.connect() as conn:
+            # 流式读取, 不一次性加载全部token
+            result = conn.execution_options(stream_results=True, yield_per=self.BATCH_SIZE)
+            for token in result.execute(self._stmts.select_tokens).scalars():
+                yield token
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        with self.engine.begin() as conn:
+            ids = conn.execute(
+                self._stmts.purge_select,
+                {"_cutoff": datetime.fromtimestamp(cutoff), "_limit": limit},
+            ).scalars().all()
+            if ids:
+                conn.execute(self._stmts.purge_delete, {"_ids": ids})
+        return len(ids)
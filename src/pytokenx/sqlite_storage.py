@@ -0,0 +1,226 @@
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+import json
+import sqlite3
+import threading
+import time
+
+from .base import TokenConflictError, TokenData, TokenStorage
+
+_COLUMNS = "token, token_type, ext, created_at, expires_at, deleted_at, quota, r_quota, quota_period, quota_window"
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS tokens (
+        token TEXT PRIMARY KEY,
+        token_type TEXT NOT NULL,
+        ext TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        expires_at REAL,
+        deleted_at REAL,
+        quota NUMERIC NOT NULL,
+        r_quota NUMERIC NOT NULL,
+        quota_period INTEGER,
+        quota_window INTEGER
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_tokens_expires_at ON tokens (expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_tokens_deleted_at ON tokens (deleted_at)",
+)
+
+# 旧版本创建的表没有的列
+_NEW_COLUMNS = (("quota_period", "INTEGER"), ("quota_window", "INTEGER"))
+
+_INSERT = f"INSERT INTO tokens ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+_SELECT_ONE = f"SELECT {_COLUMNS} FROM tokens WHERE token = ?"
+_UPDATE = (
+    "UPDATE tokens SET token_type = ?, ext = ?, created_at = ?, expires_at = ?, deleted_at = ?, "
+    "quota = ?, r_quota = ?, quota_period = ?, quota_window = ? WHERE token = ?"
+)
+_DELETE = "UPDATE tokens SET deleted_at = ? WHERE token = ?"
+# 进入新的quota周期时先把 r_quota 恢复为 quota, 参数 :now_ts 为整数秒
+_WINDOW_EXPIRED = "(quota_period IS NOT NULL AND quota_window + quota_period <= :now_ts)"
+_CURRENT_R_QUOTA = f"(CASE WHEN {_WINDOW_EXPIRED} THEN quota ELSE r_quota END)"
+_SET_WINDOW = (
+    f"quota_window = CASE WHEN {_WINDOW_EXPIRED} THEN :now_ts - :now_ts % quota_period ELSE quota_window END"
+)
+_ADD_QUOTA = f"UPDATE tokens SET r_quota = {_CURRENT_R_QUOTA} + :delta, {_SET_WINDOW} WHERE token = :token"
+# 条件扣减quota, 未删除、未过期且剩余quota足够时才扣减
+_CONSUME = (
+    f"UPDATE tokens SET r_quota = {_CURRENT_R_QUOTA} - :cost, {_SET_WINDOW} "
+    f"WHERE token = :token AND {_CURRENT_R_QUOTA} >= :cost "
+    "AND (deleted_at IS NULL OR deleted_at > :now) AND (expires_at IS NULL OR expires_at > :now)"
+)
+_PURGE = (
+    "DELETE FROM tokens WHERE token IN "
+    "(SELECT token FROM tokens WHERE expires_at <= ? UNION SELECT token FROM tokens WHERE deleted_at <= ? LIMIT ?)"
+)
+
+# UPDATE ... RETURNING 需要 sqlite 3.35+
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+class SQLiteTokenStorage(TokenStorage):
+    """
+    基于标准库sqlite3的单机存储, 不依赖SQLAlchemy
+
+    - WAL模式, 读写互不阻塞, synchronous 默认NORMAL(WAL模式下只在checkpoint时fsync)
+    - 每个线程一个连接, 连接内缓存预编译语句
+    - 批量操作使用 executemany, 在一个事务中完成
+    - consume_quota 使用一条 UPDATE ... RETURNING 原子地检查并扣减
+
+    path 需要是文件路径, ":memory:" 数据库无法在线程之间共享。
+    """
+    BATCH_SIZE = 500 # 批量查询时每条SQL的最大token数
+
+    def __init__(
+        self,
+        path: str,
+        synchronous: str = "NORMAL", # OFF/NORMAL/FULL
+        busy_timeout: float = 5.0, # 等待写锁的秒数
+    ):
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Unknown synchronous: {synchronous}")
+        self.path = path
+        self.synchronous = synchronous.upper()
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._conn().execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as conn:
+            for sql in _SCHEMA:
+                conn.execute(sql)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(tokens)")}
+            for name, column_type in _NEW_COLUMNS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE tokens ADD COLUMN {name} {column_type}")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: 单条语句自动提交, 多条语句显式BEGIN
+            conn = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None,
+                check_same_thread=False, cached_statements=64,
+            )
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        # 直接获取写锁, 避免读事务升级为写事务时出现 SQLITE_BUSY
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _row(token_data: TokenData) -> tuple:
+        return (
+            token_data.token,
+            token_data.token_type,
+            json.dumps(token_data.ext),
+            token_data.created_ts,
+            token_data.expires_ts,
+            token_data.deleted_ts,
+            token_data.quota,
+            token_data.r_quota,
+            token_data.quota_period,
+            token_data.quota_window,
+        )
+
+    @staticmethod
+    def _to_token_data(row) -> TokenData:
+        token, token_type, ext, created_at, expires_at, deleted_at, quota, r_quota, quota_period, quota_window = row
+        return TokenData(
+            token=token,
+            token_type=token_type,
+            ext=json.loads(ext),
+            created_at=datetime.fromtimestamp(created_at),
+            expires_at=datetime.fromtimestamp(expires_at) if expires_at is not None else None,
+            deleted_at=datetime.fromtimestamp(deleted_at) if deleted_at is not None else None,
+            quota=quota,
+            r_quota=r_quota,
+            quota_period=quota_period,
+            quota_window=quota_window,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def save_token(self, token_data: TokenData) -> None:
+        try:
+            self._conn().execute(_INSERT, self._row(token_data))
+        except sqlite3.IntegrityError:
+            raise TokenConflictError(f"Token already exists: {token_data.token}")
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        if not token_data_list:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.executemany(_INSERT, [self._row(t) for t in token_data_list])
+        except sqlite3.IntegrityError:
+            raise TokenConflictError("Token already exists")
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        row = self._conn().execute(_SELECT_ONE, (token,)).fetchone()
+        return self._to_token_data(row) if row else None
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        result = {}
+        conn = self._conn()
+        for i in range(0, len(tokens), self.BATCH_SIZE):
+            chunk = tokens[i:i + self.BATCH_SIZE]
+            sql = f"SELECT {_COLUMNS} FROM tokens WHERE token IN ({','.join('?' * len(chunk))})"
+            for row in conn.execute(sql, chunk):
+                result[row[0]] = self._to_token_data(row)
+        return result
+
+    def delete_token(self, token: str) -> None:
+        self._conn().execute(_DELETE, (datetime.now().timestamp(), token))
+
+    def update_token(self, token_data: TokenData) -> None:
+        row = self._row(token_data)
+        self._conn().execute(_UPDATE, row[1:] + row[:1])
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        self._conn().execute(_ADD_QUOTA, {"delta": quota_delta, "token": token, "now_ts": int(time.time())})
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        if not quota_deltas:
+            return
+        with self._transaction() as conn:
+            now_ts = int(time.time())
+            conn.executemany(
+                _ADD_QUOTA, [{"delta": delta, "token": token, "now_ts": now_ts} for token, delta in quota_deltas.items()]
+            )
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        now = time.time()
+        params = {"cost": cost, "token": token, "now": now, "now_ts": int(now)}
+        conn = self._conn()
+        if _HAS_RETURNING:
+            # 取完结果语句才会结束, 自动提交才会释放写锁
+            return len(conn.execute(_CONSUME + " RETURNING r_quota", params).fetchall()) == 1
+        return conn.execute(_CONSUME, params).rowcount == 1
+
+    def iter_tokens(self) -> Iterator[str]:
+        for (token,) in self._conn().execute("SELECT token FROM tokens"):
+            yield token
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        return self._conn().execute(_PURGE, (cutoff, cutoff, limit)).rowcount
@@ -0,0 +1,185 @@
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+import base64
+import hashlib
+import hmac
+import os
+import string
+import threading
+import zlib
+
+BASE62 = string.ascii_letters + string.digits
+URLSAFE_BASE64 = string.ascii_letters + string.digits + "-_"
+
+
+class TokenGenerator(ABC):
+    """
+    token生成器基类, 子类实现 _random_strings
+
+    - prefix: 加在每个token前面的固定前缀, 不计入 length
+    - pool_size: 大于0时一次批量生成 pool_size 个token缓存起来, generate 直接从中取
+    """
+
+    def __init__(self, prefix: str = "", pool_size: int = 0):
+        self.prefix = prefix
+        self.pool_size = pool_size
+        self._pool: Dict[Tuple[int, str], List[str]] = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _random_strings(self, n: int, length: int) -> List[str]:
+        """
+        生成n个长度为length的随机字符串
+        """
+        pass
+
+    def _format(self, random_strings: List[str], token_type: str) -> List[str]:
+        prefix = self.prefix
+        if not prefix:
+            return random_strings
+        return [prefix + s for s in random_strings]
+
+    def generate(self, length: int, token_type: str = "default") -> str:
+        if self.pool_size <= 0:
+            return self._format(self._random_strings(1, length), token_type)[0]
+        key = (length, token_type)
+        with self._lock:
+            pool = self._pool.get(key)
+            if not pool:
+                pool = self._pool[key] = self._format(self._random_strings(self.pool_size, length), token_type)
+            return pool.pop()
+
+    def generate_many(self, n: int, length: int, token_type: str = "default") -> List[str]:
+        """
+        批量生成n个token, 随机数一次取出
+        """
+        return self._format(self._random_strings(n, length), token_type)
+
+    def check(self, token: str, token_type: str) -> bool:
+        """
+        不查询存储, 只根据token本身判断格式是否正确、是否属于token_type
+        返回False的token一定无效, 默认格式无法判断, 总是返回True
+        """
+        return True
+
+
+class AlphabetTokenGenerator(TokenGenerator):
+    """
+    从字母表中随机取字符, 默认base62
+
+    随机字节一次批量读取, 通过 bytes.translate 映射到字母表:
+    只接受小于 256 - 256 % len(alphabet) 的字节(拒绝采样), 每个字符等概率, 没有取模偏差。
+    """
+
+    def __init__(self, alphabet: str = BASE62, prefix: str = "", pool_size: int = 0):
+        if not 2 <= len(alphabet) <= 256 or len(set(alphabet)) != len(alphabet):
+            raise ValueError("alphabet must contain 2-256 distinct characters")
+        if not alphabet.isascii():
+            raise ValueError("alphabet must be ascii")
+        super().__init__(prefix, pool_size)
+        self.alphabet = alphabet
+        size = len(alphabet)
+        limit = 256 - 256 % size
+        self._accept_ratio = limit / 256
+        self._table = bytes(ord(alphabet[b % size]) for b in range(256))
+        self._reject = bytes(range(limit, 256))
+
+    def _random_strings(self, n: int, length: int) -> List[str]:
+        total = n * length
+        chars = b""
+        while len(chars) < total:
+            need = total - len(chars)
+            # 多取一些, 通常一次就够
+            raw = os.urandom(int(need / self._accept_ratio) + 16)
+            chars += raw.translate(self._table, self._reject)
+        text = chars[:total].decode("ascii")
+        return [text[i:i + length] for i in range(0, total, length)]
+
+
+class Base64TokenGenerator(TokenGenerator):
+    """
+    url安全的base64字符(A-Z a-z 0-9 - _), 每个字符正好对应6位随机数, 不需要拒绝采样
+    """
+
+    def _random_strings(self, n: int, length: int) -> List[str]:
+        # 每3字节编码为4个字符, 每个token取3的倍数个字节, 编码后互不跨越, 也没有填充
+        step = (length + 3) // 4 * 4
+        raw = base64.urlsafe_b64encode(os.urandom(n * step // 4 * 3)).decode("ascii")
+        return [raw[i:i + length] for i in range(0, n * step, step)]
+
+
+class ChecksumTokenGenerator(TokenGenerator):
+    """
+    带类型前缀和校验码的token: <前缀>_<随机部分><6位校验码>, 例如 sk_3fJx...Qa81Zc
+
+    - type_prefixes: token_type -> 前缀, 前缀中不能有 "_"
+    - secret: 为空时校验码为CRC32, 只能拦截拼写错误和随机构造的token;
+      设置后为截断的HMAC-SHA256, 不知道secret无法构造出格式正确的token
+    - generator: 生成随机部分, 默认base62
+
+    check 只做字符串运算, 格式不对、校验码不对或前缀与token_type不符的token不需要查询存储。
+    """
+    CHECKSUM_LENGTH = 6 # 32位校验值的base62编码
+
+    def __init__(
+        self,
+        type_prefixes: Optional[Dict[str, str]] = None,
+        secret: Optional[bytes] = None,
+        generator: Optional[TokenGenerator] = None,
+        pool_size: int = 0,
+    ):
+        super().__init__("", pool_size)
+        self.type_prefixes = type_prefixes or {"default": "tk"}
+        for prefix in self.type_prefixes.values():
+            if not prefix or "_" in prefix:
+                raise ValueError(f"Invalid token prefix: {prefix!r}")
+        self._prefix_types = {prefix: token_type for token_type, prefix in self.type_prefixes.items()}
+        if len(self._prefix_types) != len(self.type_prefixes):
+            raise ValueError("token prefixes must be distinct")
+        self.secret = secret
+        self.generator = generator or AlphabetTokenGenerator()
+
+    def _checksum(self, payload: str) -> str:
+        if self.secret is None:
+            value = zlib.crc32(payload.encode())
+        else:
+            digest = hmac.new(self.secret, payload.encode(), hashlib.sha256).digest()
+            value = int.from_bytes(digest[:4], "big")
+        chars = []
+        for _ in range(self.CHECKSUM_LENGTH):
+            value, i = divmod(value, 62)
+            chars.append(BASE62[i])
+        return "".join(chars)
+
+    def _random_strings(self, n: int, length: int) -> List[str]:
+        return self.generator._random_strings(n, length)
+
+    def _format(self, random_strings: List[str], token_type: str) -> List[str]:
+        prefix = self.type_prefixes.get(token_type)
+        if prefix is None:
+            raise ValueError(f"No token prefix for token_type {token_type!r}")
+        result = []
+        for s in random_strings:
+            payload = prefix + "_" + s
+            result.append(payload + self._checksum(payload))
+        return result
+
+    def token_type_of(self, token: str) -> Optional[str]:
+        """
+        校验通过时返回前缀对应的token_type, 否则返回None
+        """
+        if not token.isascii():
+            # 生成的token只含ASCII字符, compare_digest 也不接受非ASCII字符串
+            return None
+        prefix, sep, rest = token.partition("_")
+        token_type = self._prefix_types.get(prefix)
+        if token_type is None or len(rest) <= self.CHECKSUM_LENGTH:
+            return None
+        payload = token[:-self.CHECKSUM_LENGTH]
+        # 常数时间比较
+        if not hmac.compare_digest(self._checksum(payload), token[-self.CHECKSUM_LENGTH:]):
+            return None
+        return token_type
+
+    def check(self, token: str, token_type: str) -> bool:
+        return self.token_type_of(token) == token_type
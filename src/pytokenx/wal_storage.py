@@ -0,0 +1,297 @@
+from typing import Dict, Iterator, List, Optional, Tuple
+from .base import TokenData, TokenStorage
+from .reaper import ExpiryHeap
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+
+class WALFileTokenStorage(TokenStorage):
+    """
+    快照 + 追加写日志(write-ahead log)的文件存储
+
+    每次修改只向日志追加一条记录, 单次写入的开销与token总数无关;
+    日志超过 compact_threshold 字节后切换到新日志, 并在后台线程中把旧快照和旧日志合并成新快照。
+
+    文件布局:
+        <file_path>            快照 {"seq": n, "tokens": {...}}
+        <file_path>.wal.<seq>  日志, 每行一条记录
+    启动时加载快照, 再按顺序重放 seq 大于快照 seq 的日志。
+    """
+
+    # 日志记录类型
+    OP_CREATE = "c"
+    OP_UPDATE = "u"
+    OP_DELETE = "d"
+    OP_QUOTA = "q"
+    OP_PURGE = "p"
+    OP_REFILL = "r"
+
+    def __init__(
+        self,
+        file_path: str,
+        compact_threshold: int = 4 * 1024 * 1024,  # 日志超过该字节数后触发压缩
+        background_compact: bool = True,  # 是否在后台线程中压缩
+    ):
+        self.file_path = os.path.abspath(file_path)
+        self.compact_threshold = compact_threshold
+        self.background_compact = background_compact
+        self._lock = threading.RLock()
+        self._compact_thread: Optional[threading.Thread] = None
+
+        dir_path = os.path.dirname(self.file_path)
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+
+        self._load()
+
+    # ---------- 文件与重放 ----------
+
+    def _log_path(self, seq: int) -> str:
+        return f"{self.file_path}.wal.{seq}"
+
+    def _log_seqs(self) -> List[int]:
+        dir_path, base = os.path.split(self.file_path)
+        pattern = re.compile(re.escape(base) + r"\.wal\.(\d+)$")
+        seqs = []
+        for name in os.listdir(dir_path):
+            m = pattern.match(name)
+            if m:
+                seqs.append(int(m.group(1)))
+        return sorted(seqs)
+
+    def _read_snapshot(self) -> Tuple[int, Dict[str, TokenData]]:
+        if not os.path.exists(self.file_path):
+            return 0, {}
+        with open(self.file_path, "r") as f:
+            data = json.load(f)
+        if isinstance(data.get("seq"), int) and isinstance(data.get("tokens"), dict):
+            seq, raw = data["seq"], data["tokens"]
+        else:
+            # 兼容 FileTokenStorage 的json文件
+            seq, raw = 0, data
+        return seq, {k: TokenData.from_dict(v) for k, v in raw.items()}
+
+    @classmethod
+    def _apply(cls, tokens: Dict[str, TokenData], record: list) -> None:
+        op = record[0]
+        if op == cls.OP_CREATE or op == cls.OP_UPDATE:
+            token_data = TokenData.from_dict(record[1])
+            tokens[token_data.token] = token_data
+        elif op == cls.OP_DELETE:
+            token_data = tokens.get(record[1])
+            if token_data:
+                token_data.deleted_at = datetime.fromisoformat(record[2])
+        elif op == cls.OP_QUOTA:
+            token_data = tokens.get(record[1])
+            if token_data:
+                token_data.r_quota += record[2]
+        elif op == cls.OP_PURGE:
+            for token in record[1]:
+                tokens.pop(token, None)
+        elif op == cls.OP_REFILL:
+            token_data = tokens.get(record[1])
+            if token_data:
+                token_data.r_quota = token_data.quota
+                token_data.quota_window = record[2]
+
+    @classmethod
+    def _replay(cls, tokens: Dict[str, TokenData], log_path: str) -> int:
+        """
+        重放日志, 返回完整记录的字节数
+        """
+        size = 0
+        with open(log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # 崩溃时最后一行可能只写了一半, 丢弃
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                cls._apply(tokens, record)
+                size += len(line)
+        return size
+
+    def _load(self) -> None:
+        seq, self.tokens = self._read_snapshot()
+        self._snapshot_seq = seq
+        log_seqs = [s for s in self._log_seqs() if s > seq]
+        for s in log_seqs:
+            size = self._replay(self.tokens, self._log_path(s))
+            if s == log_seqs[-1] and size < os.path.getsize(self._log_path(s)):
+                # 最新的日志会继续追加, 截掉写了一半的记录, 否则之后的记录会接在坏行后面
+                os.truncate(self._log_path(s), size)
+        # 清理已经合并进快照的旧日志
+        for s in self._log_seqs():
+            if s <= seq:
+                os.remove(self._log_path(s))
+        self._seq = log_seqs[-1] if log_seqs else seq + 1
+        self._expiry = ExpiryHeap()
+        self._expiry.build(self.tokens)
+        self._open_log()
+
+    def _open_log(self) -> None:
+        path = self._log_path(self._seq)
+        self._log = open(path, "a")
+        self._log_size = self._log.tell()
+
+    # ---------- 日志追加 ----------
+
+    def _append(self, *records: list) -> None:
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        self._log.write(data)
+        self._log.flush()
+        self._log_size += len(data)
+        if self._log_size >= self.compact_threshold:
+            self._start_compact()
+
+    # ---------- 压缩 ----------
+
+    def _start_compact(self) -> None:
+        if self._compact_thread and self._compact_thread.is_alive():
+            return
+        # 切换到新日志, 旧日志交给压缩线程处理
+        self._log.close()
+        upto = self._seq
+        self._seq += 1
+        self._open_log()
+        if self.background_compact:
+            self._compact_thread = threading.Thread(
+                target=self._compact, args=(upto,), daemon=True
+            )
+            self._compact_thread.start()
+        else:
+            self._compact(upto)
+
+    def _compact(self, upto: int) -> None:
+        """
+        把快照和 seq <= upto 的日志合并成新快照, 只读写文件, 不占用内存中的token表
+        """
+        seq, tokens = self._read_snapshot()
+        for s in self._log_seqs():
+            if seq < s <= upto:
+                self._replay(tokens, self._log_path(s))
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"seq": upto, "tokens": {k: v.to_dict() for k, v in tokens.items()}}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+        self._snapshot_seq = upto
+        for s in self._log_seqs():
+            if s <= upto:
+                os.remove(self._log_path(s))
+
+    def compact(self) -> None:
+        """
+        立即压缩日志, 等待压缩完成
+        """
+        with self._lock:
+            self.wait_compact()
+            self._start_compact()
+        self.wait_compact()
+
+    def wait_compact(self) -> None:
+        thread = self._compact_thread
+        if thread:
+            thread.join()
+
+    # ---------- TokenStorage ----------
+
+    def save_token(self, token_data: TokenData) -> None:
+        with self._lock:
+            op = self.OP_UPDATE if token_data.token in self.tokens else self.OP_CREATE
+            self.tokens[token_data.token] = token_data
+            self._expiry.push(token_data)
+            self._append([op, token_data.to_dict()])
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        with self._lock:
+            records = []
+            for token_data in token_data_list:
+                op = self.OP_UPDATE if token_data.token in self.tokens else self.OP_CREATE
+                self.tokens[token_data.token] = token_data
+                self._expiry.push(token_data)
+                records.append([op, token_data.to_dict()])
+            self._append(*records)
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        return self.tokens.get(token)
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        return {token: self.tokens[token] for token in tokens if token in self.tokens}
+
+    def delete_token(self, token: str) -> None:
+        with self._lock:
+            token_data = self.tokens.get(token)
+            if token_data:
+                token_data.deleted_at = datetime.now()
+                self._expiry.push(token_data)
+                self._append([self.OP_DELETE, token, token_data.deleted_at.isoformat()])
+
+    def update_token(self, token_data: TokenData) -> None:
+        return self.save_token(token_data)
+
+    def _refill(self, token_data: TokenData) -> List[list]:
+        # 进入新的quota周期时记录重置, 重放日志时不依赖当前时间
+        if token_data.refill():
+            return [[self.OP_REFILL, token_data.token, token_data.quota_window]]
+        return []
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        with self._lock:
+            token_data = self.tokens.get(token)
+            if token_data:
+                records = self._refill(token_data)
+                token_data.r_quota += quota_delta
+                self._append(*records, [self.OP_QUOTA, token, quota_delta])
+
+    def consume_quota(self, token: str, cost: int) -> Optional[bool]:
+        with self._lock:
+            token_data = self.tokens.get(token)
+            if not token_data or not token_data.is_active():
+                return False
+            records = self._refill(token_data)
+            if token_data.r_quota < cost:
+                if records:
+                    self._append(*records)
+                return False
+            token_data.r_quota -= cost
+            self._append(*records, [self.OP_QUOTA, token, -cost])
+            return True
+
+    def add_quotas(self, quota_deltas: Dict[str, int]) -> None:
+        with self._lock:
+            records = []
+            for token, quota_delta in quota_deltas.items():
+                token_data = self.tokens.get(token)
+                if token_data:
+                    records += self._refill(token_data)
+                    token_data.r_quota += quota_delta
+                    records.append([self.OP_QUOTA, token, quota_delta])
+            if records:
+                self._append(*records)
+
+    def iter_tokens(self) -> Iterator[str]:
+        with self._lock:
+            tokens = list(self.tokens)
+        return iter(tokens)
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        with self._lock:
+            due = self._expiry.pop_due(self.tokens, cutoff, limit)
+            for token in due:
+                del self.tokens[token]
+            if due:
+                self._append([self.OP_PURGE, due])
+            return len(due)
+
+    def close(self) -> None:
+        self.wait_compact()
+        with self._lock:
+            if not self._log.closed:
+                self._log.close()
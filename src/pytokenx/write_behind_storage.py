@@ -0,0 +1,159 @@
+from typing import Dict, Iterator, List, Optional
+from .base import TokenData, TokenStorage
+import copy
+import threading
+
+
+class WriteBehindTokenStorage(TokenStorage):
+    """
+    quota写回缓冲, 包装任意 TokenStorage
+
+    add_quota 只累加到内存中每个token的计数器, 由后台线程每 flush_interval 秒,
+    或累计 flush_threshold 次修改后, 把合并后的增量批量写入底层存储; close() 时写入全部剩余增量。
+    get_token 返回的数据已经包含尚未写入的增量, 因此同一进程内的校验是准确的。
+
+    多进程/多实例共享同一存储时, 每个实例最多有 max_pending 的扣减尚未写入,
+    超出时立即写入该token, 因此超额放行的上限为 max_pending * 实例数。
+    """
+
+    def __init__(
+        self,
+        storage: TokenStorage,
+        flush_interval: float = 1.0, # 定时写入间隔(秒)
+        flush_threshold: int = 1000, # 累计修改次数达到后立即写入
+        max_pending: int = 100, # 单个token未写入增量的上限
+    ):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_pending = max_pending
+        self._pending: Dict[str, int] = {}
+        self._inflight: Dict[str, int] = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                # 失败的增量已放回缓冲, 下个周期重试
+                pass
+
+    def _write(self, deltas: Dict[str, int]) -> None:
+        """
+        写入增量, 写入期间增量记在 _inflight 中, 保证 get_token 看到的值不会多放行
+        """
+        with self._flush_lock:
+            try:
+                self.storage.add_quotas(deltas)
+            except Exception:
+                # 写入失败的增量放回缓冲, 下次重试
+                with self._lock:
+                    for token, delta in deltas.items():
+                        self._inflight_done(token, delta)
+                        self._pending[token] = self._pending.get(token, 0) + delta
+                raise
+            with self._lock:
+                for token, delta in deltas.items():
+                    self._inflight_done(token, delta)
+
+    def _inflight_done(self, token: str, delta: int) -> None:
+        left = self._inflight[token] - delta
+        if left:
+            self._inflight[token] = left
+        else:
+            del self._inflight[token]
+
+    def _take(self, deltas: Dict[str, int]) -> None:
+        for token, delta in deltas.items():
+            self._inflight[token] = self._inflight.get(token, 0) + delta
+
+    def flush(self) -> None:
+        """
+        把所有未写入的增量写入底层存储
+        """
+        with self._lock:
+            deltas = {k: v for k, v in self._pending.items() if v}
+            self._pending = {}
+            self._pending_count = 0
+            self._take(deltas)
+        if deltas:
+            self._write(deltas)
+
+    def pending_quota(self, token: str) -> int:
+        """
+        token尚未写入底层存储的quota增量
+        """
+        with self._lock:
+            return self._pending.get(token, 0) + self._inflight.get(token, 0)
+
+    def save_token(self, token_data: TokenData) -> None:
+        self.storage.save_token(token_data)
+
+    def save_tokens(self, token_data_list: List[TokenData]) -> None:
+        self.storage.save_tokens(token_data_list)
+
+    def _apply_pending(self, token_data: TokenData, delta: int) -> TokenData:
+        # 不修改底层存储返回的对象
+        token_data = copy.copy(token_data)
+        token_data.r_quota += delta
+        return token_data
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        # 先读增量再读存储: 两次读取之间发生写入时只会少放行, 不会多放行
+        delta = self.pending_quota(token)
+        token_data = self.storage.get_token(token)
+        if token_data is None or not delta:
+            return token_data
+        return self._apply_pending(token_data, delta)
+
+    def get_tokens(self, tokens: List[str]) -> Dict[str, TokenData]:
+        with self._lock:
+            deltas = {token: self._pending.get(token, 0) + self._inflight.get(token, 0) for token in tokens}
+        result = self.storage.get_tokens(tokens)
+        for token, token_data in result.items():
+            if deltas.get(token):
+                result[token] = self._apply_pending(token_data, deltas[token])
+        return result
+
+    def delete_token(self, token: str) -> None:
+        self.storage.delete_token(token)
+
+    def update_token(self, token_data: TokenData) -> None:
+        # 写入的是完整的 r_quota, 已经包含了未写入的增量; 写入底层存储时不持有 _lock, 与增量写入串行
+        with self._lock:
+            self._pending.pop(token_data.token, None)
+        with self._flush_lock:
+            self.storage.update_token(token_data)
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        with self._lock:
+            delta = self._pending.get(token, 0) + quota_delta
+            self._pending[token] = delta
+            self._pending_count += 1
+            flush_all = self._pending_count >= self.flush_threshold
+            flush_token = not flush_all and abs(delta) >= self.max_pending
+            if flush_token:
+                del self._pending[token]
+                self._take({token: delta})
+        if flush_all:
+            self.flush()
+        elif flush_token:
+            self._write({token: delta})
+
+    def iter_tokens(self) -> Iterator[str]:
+        return self.storage.iter_tokens()
+
+    def purge_expired(self, cutoff: float, limit: int) -> int:
+        return self.storage.purge_expired(cutoff, limit)
+
+    def close(self) -> None:
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+        self.storage.close()
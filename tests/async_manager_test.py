@@ -0,0 +1,103 @@
+import asyncio
+import pytest
+import os
+import sys
+from datetime import timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import (
+    AsyncTokenManager,
+    AsyncTokenStorage,
+    FileTokenStorage,
+    SyncStorageAdapter,
+    TokenData,
+    TokenInvalidError,
+    async_token_validator,
+)
+
+
+class MockAsyncTokenStorage(AsyncTokenStorage):
+    def __init__(self):
+        self.tokens = {}
+
+    async def save_token(self, token_data: TokenData) -> None:
+        self.tokens[token_data.token] = token_data
+
+    async def get_token(self, token: str) -> TokenData:
+        await asyncio.sleep(0)
+        return self.tokens.get(token)
+
+    async def delete_token(self, token: str) -> None:
+        self.tokens.pop(token, None)
+
+    async def update_token(self, token_data: TokenData) -> None:
+        self.tokens[token_data.token] = token_data
+
+    async def add_quota(self, token: str, quota_delta: int) -> None:
+        if token in self.tokens:
+            self.tokens[token].r_quota += quota_delta
+
+
+class TestAsyncTokenManager:
+    def setup_method(self):
+        self.manager = AsyncTokenManager(MockAsyncTokenStorage(), default_expiry=timedelta(hours=1))
+
+    def test_generate_and_validate(self):
+        async def run():
+            token = await self.manager.generate_token(token_type="test", quota=2, user_id="u1")
+            token_data = await self.manager.validate_token(token, "test")
+            assert token_data.ext == {"user_id": "u1"}
+            assert token_data.r_quota == 1
+            await self.manager.validate_token(token, "test")
+            with pytest.raises(TokenInvalidError):
+                await self.manager.validate_token(token, "test")
+
+        asyncio.run(run())
+
+    def test_validate_tokens(self):
+        async def run():
+            tokens = await self.manager.generate_tokens(3, quota=1)
+            results = await self.manager.validate_tokens(tokens + [tokens[0], "missing"])
+            assert [isinstance(r, TokenInvalidError) for r in results] == [False, False, False, True, True]
+
+        asyncio.run(run())
+
+    def test_current_token_per_task(self):
+        async def handle(token):
+            await self.manager.validate_token(token)
+            await asyncio.sleep(0.01)
+            return self.manager.get_current_token()
+
+        async def run():
+            tokens = [await self.manager.generate_token() for _ in range(5)]
+            assert await asyncio.gather(*(handle(t) for t in tokens)) == tokens
+
+        asyncio.run(run())
+
+    def test_async_token_validator(self):
+        @async_token_validator(self.manager)
+        async def handler(token):
+            return self.manager.get_current_token()
+
+        async def run():
+            token = await self.manager.generate_token()
+            assert await handler(token=token) == token
+            with pytest.raises(TokenInvalidError):
+                await handler(token="missing")
+
+        asyncio.run(run())
+
+    def test_sync_storage_adapter(self):
+        test_file = "test_async_tokens.json"
+        manager = AsyncTokenManager(SyncStorageAdapter(FileTokenStorage(test_file)))
+
+        async def run():
+            token = await manager.generate_token(quota=5)
+            token_data = await manager.validate_token(token, cost_quota=2)
+            assert token_data.r_quota == 3
+            await manager.close()
+
+        try:
+            asyncio.run(run())
+        finally:
+            os.remove(test_file)
@@ -0,0 +1,75 @@
+# 使用aiosqlite测试
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+import os
+import sys
+
+pytest.importorskip("aiosqlite")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import AsyncSQLAlchemyTokenStorage, AsyncTokenManager, TokenData, TokenInvalidError
+
+
+class TestAsyncSQLAlchemyTokenStorage:
+
+    def setup_method(self):
+        self.path = "test_async_tokens.db"
+        self.storage = AsyncSQLAlchemyTokenStorage(f"sqlite+aiosqlite:///{self.path}")
+
+    def teardown_method(self):
+        asyncio.run(self.storage.close())
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_save_get_delete(self):
+        async def run():
+            await self.storage.save_token(TokenData(
+                token="test_token",
+                token_type="test",
+                expires_at=datetime.now() + timedelta(hours=1),
+                ext={"user_id": "u1"},
+            ))
+            token_data = await self.storage.get_token("test_token")
+            assert token_data.token_type == "test"
+            assert token_data.ext == {"user_id": "u1"}
+            assert await self.storage.get_token("missing") is None
+
+            await self.storage.delete_token("test_token")
+            assert (await self.storage.get_token("test_token")).deleted_at is not None
+            await self.storage.close()
+
+        asyncio.run(run())
+
+    def test_quota_and_batch(self):
+        async def run():
+            manager = AsyncTokenManager(self.storage)
+            tokens = await manager.generate_tokens(5, quota=3)
+            results = await manager.validate_tokens(tokens, cost_quota=2)
+            assert all(r.r_quota == 1 for r in results)
+            found = await self.storage.get_tokens(tokens)
+            assert all(t.r_quota == 1 for t in found.values())
+
+            token_data = await manager.validate_token(tokens[0], cost_quota=1)
+            assert token_data.r_quota == 0
+            with pytest.raises(TokenInvalidError):
+                await manager.validate_token(tokens[0])
+
+            token_data.token_type = "other"
+            await manager.update_token(token_data)
+            assert (await self.storage.get_token(tokens[0])).token_type == "other"
+            await self.storage.close()
+
+        asyncio.run(run())
+
+    def test_purge_expired(self):
+        async def run():
+            manager = AsyncTokenManager(self.storage)
+            await self.storage.save_tokens([
+                TokenData(token=f"e{i}", expires_at=datetime.now() - timedelta(minutes=1)) for i in range(3)
+            ])
+            token = await manager.generate_token(expiry=timedelta(hours=1))
+            assert await manager.purge_expired(batch_size=2) == 3
+            assert list(await self.storage.get_tokens(["e0", token])) == [token]
+            await self.storage.close()
+
+        asyncio.run(run())
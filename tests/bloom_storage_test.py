@@ -0,0 +1,88 @@
+import pytest
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import BloomFilterTokenStorage, FileTokenStorage, MemoryTokenStorage, TokenData, TokenManager
+from src.pytokenx.bloom_storage import BloomFilter
+
+
+class CountingStorage(MemoryTokenStorage):
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def get_token(self, token):
+        self.lookups += 1
+        return super().get_token(token)
+
+
+class TestBloomFilter:
+
+    def test_error_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add(f"t{i}")
+        assert all(f"t{i}" in bloom for i in range(10000))
+        false_positives = sum(f"x{i}" in bloom for i in range(10000))
+        assert false_positives < 200
+
+    def test_bytes_round_trip(self):
+        bloom = BloomFilter(100)
+        bloom.add("t1")
+        loaded = BloomFilter.from_bytes(bloom.to_bytes())
+        assert "t1" in loaded and loaded.count == 1
+        with pytest.raises(ValueError):
+            BloomFilter.from_bytes(b"XXXX" + bloom.to_bytes()[4:])
+
+
+class TestBloomFilterTokenStorage:
+
+    def test_skip_missing(self):
+        inner = CountingStorage()
+        inner.save_token(TokenData(token="existing"))
+        storage = BloomFilterTokenStorage(inner, capacity=100)
+        manager = TokenManager(storage)
+
+        assert storage.get_token("existing") is not None
+        assert storage.get_token("missing") is None
+        assert storage.get_tokens(["existing", "missing"]).keys() == {"existing"}
+        assert storage.consume_quota("missing", 1) is False
+        assert inner.lookups == 1
+
+        token = manager.generate_token(quota=1)
+        manager.validate_token(token)
+        assert inner.get_token(token).r_quota == 0
+
+    def test_grow(self):
+        storage = BloomFilterTokenStorage(MemoryTokenStorage(), capacity=10)
+        storage.save_tokens([TokenData(token=f"t{i}") for i in range(25)])
+        assert storage.bloom.capacity >= 25
+        assert all(storage.get_token(f"t{i}") for i in range(25))
+
+    def test_persist(self):
+        test_dir = "test_bloom_tokens"
+        os.makedirs(test_dir, exist_ok=True)
+        try:
+            path = os.path.join(test_dir, "tokens.json")
+            storage = BloomFilterTokenStorage(FileTokenStorage(path), capacity=100, path=path + ".bloom")
+            storage.save_token(TokenData(token="t1"))
+            storage.close()
+            assert os.path.exists(path + ".bloom")
+
+            storage = BloomFilterTokenStorage(FileTokenStorage(path), capacity=100, path=path + ".bloom")
+            assert storage.bloom.count == 1
+            assert storage.get_token("t1") is not None
+            storage.close()
+
+            # 没有close就退出, 下次启动重新构建过滤器
+            storage = BloomFilterTokenStorage(FileTokenStorage(path), capacity=100, path=path + ".bloom")
+            storage.save_token(TokenData(token="t2"))
+            storage = BloomFilterTokenStorage(FileTokenStorage(path), capacity=100, path=path + ".bloom")
+            manager = TokenManager(storage)
+            manager.validate_token("t2")
+            storage.close()
+        finally:
+            shutil.rmtree(test_dir)
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import TokenManager, TokenData, TokenStorage, CachingTokenStorage
+
+
+class CountingTokenStorage(TokenStorage):
+    def __init__(self):
+        self.tokens = {}
+        self.get_calls = 0
+
+    def save_token(self, token_data: TokenData) -> None:
+        self.tokens[token_data.token] = token_data
+
+    def get_token(self, token: str) -> TokenData:
+        self.get_calls += 1
+        return self.tokens.get(token)
+
+    def delete_token(self, token: str) -> None:
+        if token in self.tokens:
+            self.tokens[token].deleted_at = datetime.now()
+
+    def update_token(self, token_data: TokenData) -> None:
+        self.tokens[token_data.token] = token_data
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        if token in self.tokens:
+            self.tokens[token].r_quota += quota_delta
+
+
+class TestCachingTokenStorage:
+    def setup_method(self):
+        self.backend = CountingTokenStorage()
+        self.storage = CachingTokenStorage(self.backend, max_size=2, ttl=60, negative_ttl=60)
+
+    def test_hit_and_miss(self):
+        self.storage.save_token(TokenData(token="t1"))
+        assert self.storage.get_token("t1").token == "t1"
+        assert self.storage.get_token("t1").token == "t1"
+        assert self.backend.get_calls == 1
+        assert (self.storage.hits, self.storage.misses) == (1, 1)
+
+    def test_negative_cache(self):
+        assert self.storage.get_token("missing") is None
+        assert self.storage.get_token("missing") is None
+        assert self.backend.get_calls == 1
+
+        self.storage.save_token(TokenData(token="missing"))
+        assert self.storage.get_token("missing") is not None
+
+    def test_lru_eviction(self):
+        for token in ("t1", "t2"):
+            self.storage.save_token(TokenData(token=token))
+            self.storage.get_token(token)
+        self.storage.get_token("t1")
+        self.storage.save_token(TokenData(token="t3"))
+        self.storage.get_token("t3")
+        calls = self.backend.get_calls
+
+        self.storage.get_token("t1")
+        assert self.backend.get_calls == calls
+        self.storage.get_token("t2")
+        assert self.backend.get_calls == calls + 1
+
+    def test_ttl_bounded_by_expires_at(self):
+        self.storage.save_token(
+            TokenData(token="t1", expires_at=datetime.now() + timedelta(seconds=0.1))
+        )
+        self.storage.get_token("t1")
+        time.sleep(0.2)
+        self.storage.get_token("t1")
+        assert self.backend.get_calls == 2
+
+    def test_invalidation(self):
+        manager = TokenManager(self.storage)
+        token = manager.generate_token(quota=10)
+        manager.validate_token(token)
+        assert self.storage.get_token(token).r_quota == 9
+
+        manager.delete_token(token)
+        assert self.storage.get_token(token).deleted_at is not None
+
+        token_data = TokenData(token=token, token_type="other")
+        manager.update_token(token_data)
+        assert self.storage.get_token(token).token_type == "other"
+
+    def test_get_tokens(self):
+        self.storage = CachingTokenStorage(self.backend, max_size=10, ttl=60, negative_ttl=60)
+        self.storage.save_tokens([TokenData(token="t1"), TokenData(token="t2")])
+        self.storage.get_token("t1")
+        calls = self.backend.get_calls
+
+        result = self.storage.get_tokens(["t1", "t2", "missing"])
+        assert sorted(result) == ["t1", "t2"]
+        assert self.backend.get_calls == calls + 2
+        self.storage.get_tokens(["t1", "t2", "missing"])
+        assert self.backend.get_calls == calls + 2
+
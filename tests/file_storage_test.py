@@ -1,11 +1,19 @@
 import pytest
+import time
 from datetime import datetime, timedelta
 import os
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.pytokenx import FileTokenStorage, TokenData
+from src.pytokenx import (
+    BinaryTokenSerializer,
+    FileTokenStorage,
+    JSONTokenSerializer,
+    TokenData,
+    TokenInvalidError,
+    TokenManager,
+)
 
 
 class TestFileTokenStorage:
@@ -55,4 +63,105 @@ class TestFileTokenStorage:
         self.storage.save_token(token_data)
         self.storage.add_quota("test_add_quota", 10)
 
-        assert self.storage.get_token("test_add_quota").r_quota == 20
\ No newline at end of file
+        assert self.storage.get_token("test_add_quota").r_quota == 20
+
+
+class TestFileTokenStorageTimezone:
+
+    @pytest.mark.skipif(not hasattr(time, "tzset"), reason="time.tzset is not available")
+    def test_delete_in_non_utc_timezone(self, tmp_path):
+        old_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+        try:
+            manager = TokenManager(FileTokenStorage(str(tmp_path / "tokens.json")))
+            token = manager.generate_token(quota=10)
+            manager.delete_token(token)
+            with pytest.raises(TokenInvalidError):
+                manager.validate_token(token)
+        finally:
+            if old_tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = old_tz
+            time.tzset()
+
+
+class TestFileTokenStorageDurability:
+    def setup_method(self):
+        self.test_file = "test_durable_tokens.json"
+
+    def teardown_method(self):
+        for path in (self.test_file, self.test_file + ".tmp"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_fsync_write(self):
+        storage = FileTokenStorage(self.test_file, durability="fsync")
+        storage.save_token(TokenData(token="t1", quota=10))
+        storage.add_quota("t1", -1)
+
+        assert not os.path.exists(self.test_file + ".tmp")
+        assert FileTokenStorage(self.test_file).get_token("t1").r_quota == 9
+
+    def test_group_commit_batch(self):
+        storage = FileTokenStorage(self.test_file, flush_interval=60, flush_batch=3)
+        storage.save_token(TokenData(token="t1", quota=10))
+        storage.add_quota("t1", -1)
+        # 未达到批量大小, 还没有写入文件
+        assert FileTokenStorage(self.test_file).get_token("t1") is None
+
+        storage.add_quota("t1", -1)
+        assert FileTokenStorage(self.test_file).get_token("t1").r_quota == 8
+
+        storage.add_quota("t1", -1)
+        storage.close()
+        assert FileTokenStorage(self.test_file).get_token("t1").r_quota == 7
+
+    def test_group_commit_interval(self):
+        storage = FileTokenStorage(self.test_file, flush_interval=0.05, flush_batch=1000)
+        storage.save_token(TokenData(token="t1"))
+        time.sleep(0.3)
+        assert FileTokenStorage(self.test_file).get_token("t1") is not None
+
+    def test_save_tokens_single_write(self):
+        storage = FileTokenStorage(self.test_file)
+        writes = []
+        write_tokens = storage._write_tokens
+        storage._write_tokens = lambda tokens: (writes.append(1), write_tokens(tokens))
+        storage.save_tokens([TokenData(token=f"t{i}") for i in range(10)])
+
+        assert len(writes) == 1
+        assert len(FileTokenStorage(self.test_file).get_tokens([f"t{i}" for i in range(20)])) == 10
+
+    def test_consume_quota(self):
+        storage = FileTokenStorage(self.test_file)
+        storage.save_token(TokenData(token="t1", quota=3))
+        storage.save_token(TokenData(token="t2", quota=3, expires_at=datetime.now() - timedelta(seconds=1)))
+
+        assert storage.consume_quota("t1", 2) is True
+        assert storage.consume_quota("t1", 2) is False
+        assert storage.consume_quota("t2", 1) is False
+        assert FileTokenStorage(self.test_file).get_token("t1").r_quota == 1
+
+    def test_invalid_durability(self):
+        with pytest.raises(ValueError):
+            FileTokenStorage(self.test_file, durability="unknown")
+
+    def test_binary_format_and_migration(self):
+        storage = FileTokenStorage(self.test_file)
+        storage.save_token(TokenData(token="json_token", quota=5, ext={"a": 1}))
+        # 已有的json文件转换为二进制格式
+        storage = FileTokenStorage(self.test_file, serializer=BinaryTokenSerializer())
+        with open(self.test_file, "rb") as f:
+            assert f.read(4) == b"PTXB"
+        assert storage.get_token("json_token").ext == {"a": 1}
+        storage.add_quota("json_token", -1)
+        # 不指定格式时沿用文件的格式
+        storage = FileTokenStorage(self.test_file)
+        assert isinstance(storage.serializer, BinaryTokenSerializer)
+        assert storage.get_token("json_token").r_quota == 4
+        # 转换回json
+        FileTokenStorage(self.test_file, serializer=JSONTokenSerializer())
+        with open(self.test_file, "rb") as f:
+            assert f.read(1) == b"{"
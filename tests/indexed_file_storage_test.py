@@ -0,0 +1,156 @@
+import pytest
+from datetime import datetime, timedelta
+import json
+import os
+import shutil
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import IndexedFileTokenStorage, TokenData, TokenInvalidError, TokenManager
+from src.pytokenx.indexed_file_storage import _BaseFile
+
+TEST_DIR = "test_indexed_tokens"
+TEST_FILE = os.path.join(TEST_DIR, "tokens.idx")
+
+
+class TestIndexedFileTokenStorage:
+
+    def setup_method(self):
+        self.storage = IndexedFileTokenStorage(TEST_FILE)
+
+    def teardown_method(self):
+        self.storage.close()
+        shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+    def reopen(self, **kwargs):
+        self.storage.close()
+        self.storage = IndexedFileTokenStorage(TEST_FILE, **kwargs)
+
+    def log_records(self):
+        with open(self.storage.log_path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_save_and_get_token(self):
+        token_data = TokenData(token="test_token", token_type="test", ext={"user_id": 1}, quota=10)
+        self.storage.save_token(token_data)
+        assert self.storage.get_token("test_token").ext == {"user_id": 1}
+        assert self.storage.get_token("missing") is None
+
+    def test_reload_from_log_and_index(self):
+        self.storage.save_tokens([TokenData(token=f"t{i}", quota=10) for i in range(20)])
+        self.storage.add_quota("t1", -3)
+        self.storage.delete_token("t2")
+        self.reopen()
+        assert self.storage.get_token("t1").r_quota == 7
+        assert self.storage.get_token("t2").deleted_at is not None
+
+        self.storage.compact()
+        # 合并后日志只剩代数
+        assert self.log_records() == [["g", 1]]
+        self.reopen()
+        assert self.storage.get_token("t1").r_quota == 7
+        assert self.storage.get_token("t2").deleted_at is not None
+        assert self.storage.get_token("t19").quota == 10
+        assert sorted(self.storage.iter_tokens()) == sorted(f"t{i}" for i in range(20))
+
+    def test_crash_after_compact_write(self):
+        self.storage.save_token(TokenData(token="t1", quota=10))
+        self.storage.add_quota("t1", -3)
+        # 新索引文件已替换, 日志还没清空时崩溃
+        _BaseFile.write(TEST_FILE, self.storage._merged(), self.storage._base.generation + 1)
+        self.reopen()
+        assert self.storage.get_token("t1").r_quota == 7
+        self.storage.add_quota("t1", -1)
+        self.reopen()
+        assert self.storage.get_token("t1").r_quota == 6
+
+    def test_writes_after_truncated_tail(self):
+        self.storage.save_token(TokenData(token="t1", quota=10))
+        self.storage.close()
+        with open(self.storage.log_path, "a") as f:
+            f.write('["q","t1",')
+        self.storage = IndexedFileTokenStorage(TEST_FILE)
+        self.storage.add_quota("t1", -3)
+        self.storage.save_token(TokenData(token="t2"))
+        self.reopen()
+        assert self.storage.get_token("t1").r_quota == 7
+        assert self.storage.get_token("t2") is not None
+
+    def test_lazy_decode(self):
+        self.storage.save_tokens([TokenData(token=f"t{i}") for i in range(100)])
+        self.storage.compact()
+        self.reopen()
+        # 打开时不解析记录
+        assert len(self.storage._cache) == 0
+        self.storage.get_token("t5")
+        assert list(self.storage._cache) == ["t5"]
+
+    def test_auto_compact(self):
+        self.reopen(compact_threshold=1024)
+        self.storage.save_tokens([TokenData(token=f"t{i}") for i in range(50)])
+        assert len(self.log_records()) < 50
+        assert self.storage._base.count == 50
+
+    def test_consume_quota(self):
+        self.storage.save_token(TokenData(token="t", quota=2))
+        self.storage.compact()
+        assert self.storage.consume_quota("t", 1)
+        assert self.storage.consume_quota("t", 1)
+        assert not self.storage.consume_quota("t", 1)
+        self.reopen()
+        assert self.storage.get_token("t").r_quota == 0
+
+    def test_purge_expired(self):
+        past = datetime.now() - timedelta(seconds=10)
+        self.storage.save_tokens([
+            TokenData(token="old", expires_at=past),
+            TokenData(token="live"),
+        ])
+        self.storage.compact()
+        self.storage.save_token(TokenData(token="old2", expires_at=past))
+        self.storage.delete_token("live")
+        cutoff = time.time() - 5
+        assert self.storage.purge_expired(cutoff, 100) == 2
+        assert self.storage.get_token("old") is None
+        assert self.storage.get_token("old2") is None
+        self.reopen()
+        assert sorted(self.storage.iter_tokens()) == ["live"]
+        self.storage.compact()
+        assert self.storage._base.count == 1
+
+    def test_purge_expired_in_batches(self):
+        past = datetime.now() - timedelta(seconds=10)
+        self.storage.save_tokens([TokenData(token=f"old{i}", expires_at=past) for i in range(10)])
+        self.storage.save_token(TokenData(token="live"))
+        self.storage.compact()
+        self.storage.save_tokens([TokenData(token=f"new{i}", expires_at=past) for i in range(5)])
+        cutoff = time.time() - 5
+        assert self.storage.purge_expired(cutoff, 4) == 4
+        # 已经进入堆的token改为不过期, 不应被清理
+        self.storage.save_token(TokenData(token="old0"))
+        purged = [self.storage.purge_expired(cutoff, 4) for _ in range(4)]
+        assert purged == [4, 4, 2, 0]
+        # 清理之后删除的token
+        self.storage.delete_token("live")
+        assert self.storage.purge_expired(time.time() + 1, 100) == 1
+        self.reopen()
+        assert sorted(self.storage.iter_tokens()) == ["old0"]
+
+    def test_migrate_json_file(self):
+        self.storage.close()
+        shutil.rmtree(TEST_DIR)
+        os.makedirs(TEST_DIR)
+        token_data = TokenData(token="legacy", quota=5)
+        with open(TEST_FILE, "w") as f:
+            json.dump({"legacy": token_data.to_dict()}, f)
+        self.storage = IndexedFileTokenStorage(TEST_FILE)
+        assert self.storage.get_token("legacy").r_quota == 5
+
+    def test_token_manager(self):
+        manager = TokenManager(self.storage)
+        token = manager.generate_token(token_type="test", quota=1)
+        manager.validate_token(token, token_type="test")
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token(token, token_type="test")
@@ -1,10 +1,13 @@
 import pytest
+import copy
+import json
 import os
+import pickle
 import sys
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from datetime import datetime, timedelta
-from src.pytokenx import TokenManager, TokenData, TokenStorage, TokenInvalidError
+from datetime import datetime, timedelta, timezone
+from src.pytokenx import MemoryTokenStorage, TokenManager, TokenData, TokenStorage, TokenInvalidError
 
 class MockTokenStorage(TokenStorage):
     def __init__(self):
@@ -38,7 +41,47 @@ class MockTokenStorage(TokenStorage):
     
     def add_quota(self, token: str, quota_delta: int) -> None:
         if token in self.tokens:
-            self.tokens[token].quota += quota_delta
+            self.tokens[token].r_quota += quota_delta
+
+class TestTokenData:
+    def test_dict_round_trip(self):
+        token_data = TokenData(
+            token="t1",
+            token_type="test",
+            ext={"user_id": "u1"},
+            expires_at=datetime.now() + timedelta(hours=1),
+            quota=10,
+        )
+        restored = TokenData.from_dict(json.loads(json.dumps(token_data.to_dict())))
+        assert restored == token_data
+        assert restored.expires_at == token_data.expires_at
+        assert restored["r_quota"] == 10
+
+    def test_copy_and_pickle(self):
+        token_data = TokenData(token="t1", ext={"a": [1]}, deleted_at=datetime.now())
+        assert copy.copy(token_data) == token_data
+        assert pickle.loads(pickle.dumps(token_data)) == token_data
+        cloned = copy.deepcopy(token_data)
+        cloned.ext["a"].append(2)
+        assert token_data.ext == {"a": [1]}
+
+    def test_empty_ext_is_shared(self):
+        t1, t2 = TokenData(token="t1"), TokenData(token="t2", ext={})
+        assert t1.ext is t2.ext
+        with pytest.raises(TypeError):
+            t1.ext["a"] = 1
+        t1.ext = {"a": 1}
+        assert t2.ext == {}
+
+    def test_aware_datetime(self):
+        expires_at = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        token_data = TokenData(token="t1", created_at=expires_at, expires_at=expires_at)
+        assert token_data.expires_at == expires_at
+        assert token_data.expires_at.tzinfo is not None
+
+    def test_no_instance_dict(self):
+        assert not hasattr(TokenData(token="t1"), "__dict__")
+
 
 class TestTokenManager:
     def setup_method(self):
@@ -113,8 +156,84 @@ class TestTokenManager:
         
         data = self.manager.validate_token(token, cost_quota=5)
         assert data.r_quota == 0
-        
-    
-    
 
+    def test_validate_token_isolation(self):
+        token = self.manager.generate_token(
+            token_type="test",
+            profile={"roles": ["admin"]},
+        )
+        token_data = self.manager.validate_token(token, "test")
+        token_data.r_quota = 100
+        with pytest.raises(TypeError):
+            token_data.ext["user_id"] = "other"
+        with pytest.raises(TypeError):
+            token_data.ext["profile"]["roles"].append("root")
+
+        ext = copy.deepcopy(token_data.ext)
+        ext["profile"]["roles"].append("root")
+        # copy() 和 | 得到完全独立的dict
+        ext = token_data.ext.copy()
+        ext["profile"]["roles"].append("root")
+        ext = token_data.ext | {"user_id": "u1"}
+        ext["profile"]["roles"].append("root")
+        # dict()、{**ext} 的浅拷贝中嵌套的容器仍然只读
+        for shallow in (dict(token_data.ext), {**token_data.ext}):
+            with pytest.raises(TypeError):
+                shallow["profile"]["roles"].append("root")
+        stored = self.storage.get_token(token)
+        assert stored.r_quota != 100
+        assert stored.ext == {"profile": {"roles": ["admin"]}}
+        assert json.loads(json.dumps(token_data.to_dict()))["ext"] == stored.ext
+
+    def test_generate_tokens(self):
+        tokens = self.manager.generate_tokens(100, token_type="batch", quota=5, user_id="u1")
+        assert len(set(tokens)) == 100
+        for token in tokens:
+            token_data = self.manager.validate_token(token, "batch")
+            assert token_data.ext == {"user_id": "u1"}
+            assert token_data.r_quota == 4
+            assert token_data.expires_at is not None
+
+    def test_validate_tokens(self):
+        valid = self.manager.generate_token(token_type="test", user_id="u1")
+        limited = self.manager.generate_token(token_type="test", quota=3)
+        expired = self.manager.generate_token(token_type="test", expiry=timedelta(seconds=-1))
+        other = self.manager.generate_token(token_type="other")
+
+        results = self.manager.validate_tokens(
+            [valid, limited, expired, other, "missing", limited], "test", cost_quota=2
+        )
+        assert results[0].ext == {"user_id": "u1"}
+        assert results[1].r_quota == 1
+        assert str(results[2]) == "Token expired"
+        assert isinstance(results[3], TokenInvalidError)
+        assert isinstance(results[4], TokenInvalidError)
+        assert str(results[5]) == "Token quota exceeded"
+        assert self.storage.get_token(limited).r_quota == 1
+
+    def test_validate_tokens_duplicates_accumulate(self):
+        token = self.manager.generate_token(quota=5)
+        results = self.manager.validate_tokens([token, token, token], cost_quota=2)
+        assert [r.r_quota for r in results[:2]] == [3, 1]
+        assert isinstance(results[2], TokenInvalidError)
+        assert self.storage.get_token(token).r_quota == 1
+
+    def test_validate_tokens_conditional_consume(self):
+        class RacingStorage(MemoryTokenStorage):
+            # 读取之后、扣除之前, 其他进程用完了quota
+            def get_tokens(self, tokens):
+                found = {token: copy.copy(t) for token, t in super().get_tokens(tokens).items()}
+                for token in found:
+                    self.consume_quota(token, self.get_token(token).r_quota)
+                return found
+
+        storage = RacingStorage()
+        manager = TokenManager(storage)
+        token = manager.generate_token(quota=2)
+        unlimited = manager.generate_token()
+        results = manager.validate_tokens([token, unlimited, token])
+        assert str(results[0]) == "Token quota exceeded"
+        assert str(results[2]) == "Token quota exceeded"
+        assert isinstance(results[1], TokenData)
+        assert storage.get_token(token).r_quota == 0
 
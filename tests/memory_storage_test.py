@@ -0,0 +1,79 @@
+import pytest
+from datetime import datetime, timedelta
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import MemoryTokenStorage, TokenData, TokenManager, TokenInvalidError
+
+
+class TestMemoryTokenStorage:
+    def setup_method(self):
+        self.storage = MemoryTokenStorage(shards=4)
+
+    def test_save_get_delete(self):
+        self.storage.save_tokens([TokenData(token=f"t{i}") for i in range(20)])
+        assert len(self.storage) == 20
+        assert len(self.storage.get_tokens([f"t{i}" for i in range(30)])) == 20
+        self.storage.delete_token("t1")
+        assert self.storage.get_token("t1").deleted_at is not None
+        assert self.storage.get_token("missing") is None
+
+    @pytest.mark.skipif(not hasattr(time, "tzset"), reason="time.tzset is not available")
+    def test_delete_in_non_utc_timezone(self):
+        old_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "America/New_York"
+        time.tzset()
+        try:
+            manager = TokenManager(self.storage)
+            token = manager.generate_token()
+            manager.delete_token(token)
+            with pytest.raises(TokenInvalidError):
+                manager.validate_token(token)
+        finally:
+            if old_tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = old_tz
+            time.tzset()
+
+    def test_quota(self):
+        manager = TokenManager(self.storage)
+        token = manager.generate_token(quota=2)
+        manager.validate_token(token)
+        manager.validate_token(token)
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token(token)
+        self.storage.add_quotas({token: 5, "missing": 1})
+        assert self.storage.get_token(token).r_quota == 5
+
+    def test_consume_quota_concurrent(self):
+        tokens = [f"t{i}" for i in range(8)]
+        self.storage.save_tokens([TokenData(token=t, quota=1000) for t in tokens])
+
+        def worker(token):
+            for _ in range(500):
+                self.storage.consume_quota(token, 1)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in tokens * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(self.storage.get_token(t).r_quota == 0 for t in tokens)
+
+    def test_snapshot_restore(self):
+        self.storage.save_token(TokenData(token="t1", quota=3, ext={"user_id": "u1"},
+                                          expires_at=datetime.now() - timedelta(minutes=1)))
+        self.storage.save_token(TokenData(token="t2"))
+        data = json.loads(json.dumps(self.storage.snapshot()))
+
+        restored = MemoryTokenStorage(shards=2)
+        restored.restore(data)
+        assert restored.get_token("t1") == self.storage.get_token("t1")
+        assert restored.purge_expired(datetime.now().timestamp(), 10) == 1
+        assert len(restored) == 1
@@ -0,0 +1,246 @@
+import pytest
+import copy
+from datetime import datetime, timedelta
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import (
+    BinaryTokenSerializer,
+    CachingTokenStorage,
+    FileTokenStorage,
+    IndexedFileTokenStorage,
+    JSONTokenSerializer,
+    MemoryTokenStorage,
+    MmapTokenStorage,
+    RedisTokenStorage,
+    SQLAlchemyTokenStorage,
+    SQLiteTokenStorage,
+    TokenData,
+    TokenInvalidError,
+    TokenManager,
+    TokenStorage,
+    WALFileTokenStorage,
+)
+from src.pytokenx.base import quota_window_start
+
+PERIOD = 3600
+
+
+def make_storages(tmp_path):
+    storages = {
+        "memory": lambda: MemoryTokenStorage(),
+        "file": lambda: FileTokenStorage(str(tmp_path / "tokens.json")),
+        "wal": lambda: WALFileTokenStorage(str(tmp_path / "tokens.wal")),
+        "indexed": lambda: IndexedFileTokenStorage(str(tmp_path / "tokens.idx")),
+        "sqlite": lambda: SQLiteTokenStorage(str(tmp_path / "tokens.db")),
+        "sqlalchemy": lambda: SQLAlchemyTokenStorage(f"sqlite:///{tmp_path / 'sa.db'}"),
+        "shm": lambda: MmapTokenStorage(str(tmp_path / "tokens.shm"), capacity=64),
+        "cache": lambda: CachingTokenStorage(MemoryTokenStorage()),
+    }
+    try:
+        import fakeredis
+        import lupa  # noqa: F401
+        storages["redis"] = lambda: RedisTokenStorage(client=fakeredis.FakeRedis())
+    except ImportError:
+        pass
+    return storages
+
+
+STORAGE_NAMES = ["memory", "file", "wal", "indexed", "sqlite", "sqlalchemy", "shm", "cache", "redis"]
+
+
+@pytest.fixture(params=STORAGE_NAMES)
+def storage_factory(request, tmp_path):
+    storages = make_storages(tmp_path)
+    if request.param not in storages:
+        pytest.skip(f"{request.param} is not available")
+    return storages[request.param]
+
+
+def last_window_token(token="t1", quota=5, r_quota=0):
+    """
+    上一个周期的token, 剩余quota已用完
+    """
+    window = quota_window_start(time.time(), PERIOD)
+    return TokenData(token=token, quota=quota, r_quota=r_quota, quota_period=PERIOD, quota_window=window - PERIOD)
+
+
+class TestTokenData:
+
+    def test_window_defaults_to_created_at(self):
+        token_data = TokenData(token="t1", quota=5, quota_period=timedelta(days=1))
+        assert token_data.quota_period == 86400
+        assert token_data.quota_window == quota_window_start(token_data.created_ts, 86400)
+        assert token_data.quota_window % 86400 == 0
+
+    def test_invalid_period(self):
+        with pytest.raises(ValueError):
+            TokenData(token="t1", quota=5, quota_period=0)
+
+    def test_refill(self):
+        token_data = last_window_token()
+        assert token_data.refill()
+        assert token_data.r_quota == 5
+        assert token_data.quota_window == quota_window_start(time.time(), PERIOD)
+        token_data.r_quota = 1
+        assert not token_data.refill()
+        assert token_data.r_quota == 1
+
+    def test_dict_round_trip(self):
+        token_data = last_window_token()
+        restored = TokenData.from_dict(token_data.to_dict())
+        assert restored.quota_period == PERIOD
+        assert restored.quota_window == token_data.quota_window
+        # 旧数据没有周期字段
+        data = TokenData(token="t2", quota=5).to_dict()
+        del data["quota_period"], data["quota_window"]
+        assert TokenData.from_dict(data).quota_period is None
+
+    @pytest.mark.parametrize("serializer", [JSONTokenSerializer(), BinaryTokenSerializer(ext_codec="json")])
+    def test_serializer_round_trip(self, serializer):
+        tokens = [last_window_token(), TokenData(token="t2", quota=3)]
+        restored = serializer.loads(serializer.dumps(tokens))
+        assert restored["t1"].quota_period == PERIOD
+        assert restored["t1"].quota_window == tokens[0].quota_window
+        assert restored["t2"].quota_period is None
+        assert restored["t2"].quota_window is None
+
+
+class TestStorage:
+
+    def test_save_and_get(self, storage_factory):
+        storage = storage_factory()
+        storage.save_token(last_window_token())
+        token_data = storage.get_token("t1")
+        assert token_data.quota_period == PERIOD
+        assert token_data.quota_window == quota_window_start(time.time(), PERIOD) - PERIOD
+        storage.save_token(TokenData(token="t2", quota=5))
+        assert storage.get_token("t2").quota_period is None
+        storage.close()
+
+    def test_consume_refills(self, storage_factory):
+        storage = storage_factory()
+        storage.save_token(last_window_token())
+        if storage.consume_quota("t1", 2) is None:
+            pytest.skip("storage does not consume atomically")
+        token_data = storage.get_token("t1")
+        assert token_data.r_quota == 3
+        assert token_data.quota_window == quota_window_start(time.time(), PERIOD)
+        # 同一周期内不再恢复
+        assert storage.consume_quota("t1", 3)
+        assert not storage.consume_quota("t1", 1)
+        storage.close()
+
+    def test_add_quota_refills(self, storage_factory):
+        storage = storage_factory()
+        storage.save_token(last_window_token())
+        storage.add_quota("t1", -1)
+        token_data = storage.get_token("t1")
+        assert token_data.r_quota == 4
+        assert token_data.quota_window == quota_window_start(time.time(), PERIOD)
+        storage.close()
+
+    def test_reopen(self, storage_factory):
+        storage = storage_factory()
+        if isinstance(storage, (MemoryTokenStorage, CachingTokenStorage, RedisTokenStorage)):
+            pytest.skip("storage is not persistent")
+        storage.save_token(last_window_token())
+        storage.add_quota("t1", -1)
+        storage.close()
+        storage = storage_factory()
+        token_data = storage.get_token("t1")
+        assert token_data.r_quota == 4
+        assert token_data.quota_window == quota_window_start(time.time(), PERIOD)
+        storage.close()
+
+
+class PlainStorage(TokenStorage):
+    """
+    只实现必需方法的存储, add_quota不处理quota周期
+    """
+
+    def __init__(self):
+        self.tokens = {}
+
+    def save_token(self, token_data):
+        self.tokens[token_data.token] = copy.copy(token_data)
+
+    def get_token(self, token):
+        token_data = self.tokens.get(token)
+        return copy.copy(token_data) if token_data else None
+
+    def delete_token(self, token):
+        self.tokens.pop(token, None)
+
+    def update_token(self, token_data):
+        self.save_token(token_data)
+
+    def add_quota(self, token, quota_delta):
+        self.tokens[token].r_quota += quota_delta
+
+
+class TestTokenManager:
+
+    def test_generate_and_validate(self, storage_factory):
+        manager = TokenManager(storage_factory())
+        token = manager.generate_token(quota=2, quota_period=timedelta(hours=1))
+        token_data = manager.get_token_data(token)
+        assert token_data.quota_period == PERIOD
+        manager.validate_token(token)
+        manager.validate_token(token)
+        with pytest.raises(TokenInvalidError, match="quota"):
+            manager.validate_token(token)
+
+    def test_validate_refills(self, storage_factory):
+        storage = storage_factory()
+        manager = TokenManager(storage)
+        storage.save_token(last_window_token())
+        manager.validate_token("t1")
+        token_data = manager.get_token_data("t1")
+        assert token_data.r_quota == 4
+        assert token_data.quota_window == quota_window_start(time.time(), PERIOD)
+
+    @pytest.mark.parametrize("storage_cls", [PlainStorage, MemoryTokenStorage])
+    def test_validate_tokens_refills(self, storage_cls):
+        storage = storage_cls()
+        manager = TokenManager(storage)
+        storage.save_token(last_window_token())
+        results = manager.validate_tokens(["t1", "t1"])
+        assert all(isinstance(r, TokenData) for r in results)
+        token_data = storage.get_token("t1")
+        assert token_data.r_quota == 3
+        assert token_data.quota_window == quota_window_start(time.time(), PERIOD)
+        # 同一周期内不再恢复
+        manager.validate_tokens(["t1", "t1", "t1"])
+        assert storage.get_token("t1").r_quota == 0
+        assert isinstance(manager.validate_tokens(["t1"])[0], TokenInvalidError)
+
+    @pytest.mark.parametrize("batch", [False, True])
+    def test_refilled_ext_stays_writable(self, batch):
+        storage = PlainStorage()
+        manager = TokenManager(storage)
+        token_data = last_window_token()
+        token_data.ext = {"user": {"roles": ["a"]}}
+        storage.save_token(token_data)
+        if batch:
+            manager.validate_tokens(["t1"])
+        else:
+            manager.validate_token("t1")
+        # 写回的是普通dict, 不是快照中只读的ext
+        stored = storage.get_token("t1")
+        assert stored.r_quota == 4
+        assert type(stored.ext) is dict
+        assert type(stored.ext["user"]) is dict and type(stored.ext["user"]["roles"]) is list
+        stored.ext["user"]["roles"].append("b")
+
+    def test_expired_token_is_not_refilled(self):
+        storage = MemoryTokenStorage()
+        manager = TokenManager(storage)
+        token_data = last_window_token()
+        token_data.expires_at = datetime.now() - timedelta(seconds=1)
+        storage.save_token(token_data)
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token("t1")
@@ -0,0 +1,175 @@
+import pytest
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import (
+    AsyncTokenManager,
+    MemoryRateLimiter,
+    MemoryTokenStorage,
+    RateLimit,
+    RedisRateLimiter,
+    SyncStorageAdapter,
+    TokenInvalidError,
+    TokenManager,
+    TokenRateLimitError,
+    TokenSigner,
+)
+
+
+def limiters():
+    result = [MemoryRateLimiter()]
+    try:
+        import fakeredis
+        import lupa  # noqa: F401
+        result.append(RedisRateLimiter(client=fakeredis.FakeRedis()))
+    except ImportError:
+        pass
+    return result
+
+
+@pytest.mark.parametrize("limiter", limiters())
+def test_gcra_burst_and_refill(limiter):
+    limit = RateLimit(10, burst=5)
+    # Redis按真实时间过期, 使用当前时间
+    now = time.time()
+    assert all(limiter.acquire("t", limit, now) == 0 for _ in range(5))
+    wait = limiter.acquire("t", limit, now)
+    assert wait == pytest.approx(0.1, abs=1e-3)
+    # 每0.1秒恢复一次
+    assert limiter.acquire("t", limit, now + 0.1) == 0
+    assert limiter.acquire("t", limit, now + 0.1) > 0
+    # 空闲足够久后恢复全部突发
+    assert all(limiter.acquire("t", limit, now + 10) == 0 for _ in range(5))
+    # 不同key互不影响
+    assert limiter.acquire("other", limit, now) == 0
+
+
+def test_memory_limiter_expires_idle_keys():
+    limiter = MemoryRateLimiter(sweep_interval=1)
+    limit = RateLimit(1)
+    for i in range(100):
+        limiter.acquire(f"t{i}", limit, 1000.0)
+    assert len(limiter) == 100
+    limiter.acquire("t0", limit, 1002.0)
+    assert len(limiter) == 1
+
+
+def test_invalid_rate_limit():
+    with pytest.raises(ValueError):
+        RateLimit(0)
+
+
+class TestTokenManagerRateLimit:
+
+    def test_rate_limit_by_token_type(self):
+        manager = TokenManager(MemoryTokenStorage(), rate_limits={"api": RateLimit(2, period=60)})
+        token = manager.generate_token(token_type="api", quota=10)
+        manager.validate_token(token, token_type="api")
+        manager.validate_token(token, token_type="api")
+        with pytest.raises(TokenRateLimitError) as e:
+            manager.validate_token(token, token_type="api")
+        assert e.value.retry_after > 0
+        # 被限速的请求不扣除quota
+        assert manager.get_token_data(token).r_quota == 8
+        # 其他token和其他类型不受影响
+        manager.validate_token(manager.generate_token(token_type="api"), token_type="api")
+        other = manager.generate_token()
+        for _ in range(10):
+            manager.validate_token(other)
+
+    def test_rate_limit_by_token(self):
+        manager = TokenManager(MemoryTokenStorage(), rate_limits={"default": RateLimit(100)})
+        token = manager.generate_token(rate_limit=RateLimit(1, period=60))
+        assert manager.get_token_data(token).ext["rate_limit"] == {"rate": 1, "period": 60, "burst": 1}
+        manager.validate_token(token)
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token(token)
+
+    def test_quota_exceeded_is_not_rate_limited(self):
+        manager = TokenManager(MemoryTokenStorage(), rate_limits={"default": RateLimit(1, period=60)})
+        token = manager.generate_token(quota=0)
+        with pytest.raises(TokenInvalidError, match="quota"):
+            manager.validate_token(token)
+
+    def test_failed_consume_is_not_rate_limited(self):
+        class RacingStorage(MemoryTokenStorage):
+            # 模拟校验之后quota被其他请求用完
+            def consume_quota(self, token, cost):
+                return False
+
+            def consume_quotas(self, costs):
+                return {token: False for token in costs}
+
+        limiter = MemoryRateLimiter()
+        manager = TokenManager(
+            RacingStorage(), rate_limits={"default": RateLimit(1, period=60)}, rate_limiter=limiter
+        )
+        token = manager.generate_token(quota=10)
+        with pytest.raises(TokenInvalidError, match="quota"):
+            manager.validate_token(token)
+        assert isinstance(manager.validate_tokens([token])[0], TokenInvalidError)
+        assert len(limiter) == 0
+
+    def test_rate_limited_refunds_quota(self):
+        manager = TokenManager(MemoryTokenStorage(), rate_limits={"default": RateLimit(1, period=60)})
+        token = manager.generate_token(quota=10)
+        results = manager.validate_tokens([token, token, token])
+        assert [type(r) for r in results[1:]] == [TokenRateLimitError, TokenRateLimitError]
+        assert manager.get_token_data(token).r_quota == 9
+
+    def test_validate_tokens(self):
+        manager = TokenManager(MemoryTokenStorage(), rate_limits={"default": RateLimit(2, period=60)})
+        token = manager.generate_token()
+        results = manager.validate_tokens([token, token, token])
+        assert isinstance(results[2], TokenRateLimitError)
+        assert not isinstance(results[1], TokenInvalidError)
+
+    def test_signed_token(self):
+        manager = TokenManager(
+            MemoryTokenStorage(),
+            signer=TokenSigner({"k1": b"secret"}),
+            rate_limits={"default": RateLimit(1, period=60)},
+        )
+        token = manager.generate_token()
+        manager.validate_token(token)
+        with pytest.raises(TokenRateLimitError):
+            manager.validate_token(token)
+
+    def test_revoked_signed_token_is_not_rate_limited(self):
+        limiter = MemoryRateLimiter()
+        manager = TokenManager(
+            MemoryTokenStorage(),
+            signer=TokenSigner({"k1": b"secret"}),
+            rate_limits={"default": RateLimit(1, period=60)},
+            rate_limiter=limiter,
+        )
+        token = manager.generate_token()
+        manager.delete_token(token)
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token(token)
+        assert len(limiter) == 0
+
+    def test_async_manager(self):
+        async def run():
+            manager = AsyncTokenManager(
+                SyncStorageAdapter(MemoryTokenStorage()), rate_limits={"default": RateLimit(1, period=60)}
+            )
+            token = await manager.generate_token()
+            await manager.validate_token(token)
+            with pytest.raises(TokenRateLimitError):
+                await manager.validate_token(token)
+
+        asyncio.run(run())
+
+    def test_refill(self):
+        manager = TokenManager(MemoryTokenStorage(), rate_limits={"default": RateLimit(20, burst=1)})
+        token = manager.generate_token()
+        manager.validate_token(token)
+        with pytest.raises(TokenRateLimitError):
+            manager.validate_token(token)
+        time.sleep(0.06)
+        manager.validate_token(token)
@@ -0,0 +1,92 @@
+import pytest
+from datetime import datetime, timedelta
+import os
+import shutil
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import FileTokenStorage, MemoryTokenStorage, TokenData, TokenManager, TokenReaper, WALFileTokenStorage
+from src.pytokenx.reaper import ExpiryHeap
+
+
+def fill(storage):
+    now = datetime.now()
+    storage.save_tokens([TokenData(token=f"e{i}", expires_at=now - timedelta(minutes=i + 1)) for i in range(5)])
+    storage.save_tokens([TokenData(token=f"a{i}", expires_at=now + timedelta(hours=1)) for i in range(5)])
+    storage.save_token(TokenData(token="forever"))
+    storage.save_token(TokenData(token="old", expires_at=now - timedelta(days=2)))
+
+
+class TestExpiryHeap:
+
+    def test_pop_due(self):
+        tokens = {
+            "t1": TokenData(token="t1", expires_at=datetime.fromtimestamp(100)),
+            "t2": TokenData(token="t2", expires_at=datetime.fromtimestamp(200)),
+            "t3": TokenData(token="t3"),
+        }
+        heap = ExpiryHeap()
+        heap.build(tokens)
+        # 修改过期时间后旧元素失效
+        tokens["t1"].expires_at = datetime.fromtimestamp(300)
+        heap.push(tokens["t1"])
+        assert heap.pop_due(tokens, 250, 10) == ["t2"]
+        assert heap.pop_due(tokens, 1000, 10) == ["t1"]
+        assert heap.pop_due(tokens, 1000, 10) == []
+
+
+class TestPurgeExpired:
+
+    def setup_method(self):
+        self.test_dir = "test_reaper_tokens"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def teardown_method(self):
+        shutil.rmtree(self.test_dir)
+
+    @pytest.mark.parametrize("storage_cls", [FileTokenStorage, WALFileTokenStorage])
+    def test_purge_expired(self, storage_cls):
+        path = os.path.join(self.test_dir, "tokens.json")
+        storage = storage_cls(path)
+        fill(storage)
+        storage.delete_token("a0")
+        manager = TokenManager(storage)
+
+        assert manager.purge_expired(grace=timedelta(days=1)) == 1
+        assert manager.purge_expired(batch_size=2) == 6
+        storage.close()
+
+        storage = storage_cls(path)
+        assert sorted(storage.tokens) == ["a1", "a2", "a3", "a4", "forever"]
+        storage.close()
+
+    def test_reaper_thread(self):
+        storage = FileTokenStorage(os.path.join(self.test_dir, "tokens.json"))
+        fill(storage)
+        reaper = TokenReaper(TokenManager(storage), interval=0.05).start()
+        time.sleep(0.3)
+        reaper.stop()
+        assert reaper.purged == 6
+        assert len(storage.tokens) == 6
+
+    def test_reaper_unsupported_storage(self):
+        class NoPurgeStorage(MemoryTokenStorage):
+            def purge_expired(self, cutoff, limit):
+                raise NotImplementedError("purge_expired is not supported by this storage")
+
+        with pytest.raises(NotImplementedError):
+            TokenReaper(TokenManager(NoPurgeStorage())).start()
+
+    def test_reaper_logs_failures(self, caplog):
+        class FailingStorage(MemoryTokenStorage):
+            def purge_expired(self, cutoff, limit):
+                if limit:
+                    raise RuntimeError("database is down")
+                return 0
+
+        reaper = TokenReaper(TokenManager(FailingStorage()), interval=0.05).start()
+        time.sleep(0.2)
+        reaper.stop()
+        assert "Failed to purge expired tokens" in caplog.text
@@ -0,0 +1,92 @@
+# 使用fakeredis测试, Lua脚本需要lupa
+import pytest
+from datetime import datetime, timedelta
+import os
+import sys
+import threading
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from src.pytokenx import RedisTokenStorage, TokenData, TokenManager, TokenInvalidError
+from src.pytokenx.base import TokenConflictError
+
+
+class TestRedisTokenStorage:
+
+    def setup_method(self):
+        self.client = fakeredis.FakeRedis()
+        self.storage = RedisTokenStorage(client=self.client, expire_grace=60)
+
+    def test_save_and_get_token(self):
+        token_data = TokenData(
+            token="test_token",
+            token_type="test",
+            ext={"user_id": "u1"},
+            expires_at=datetime.now() + timedelta(hours=1),
+            quota=10,
+        )
+        self.storage.save_token(token_data)
+        assert self.storage.get_token("test_token") == token_data
+        assert self.storage.get_token("missing") is None
+        # 使用Redis原生过期
+        assert 3600 < self.client.ttl("pytokenx:token:test_token") <= 3660
+        with pytest.raises(TokenConflictError):
+            self.storage.save_token(token_data)
+
+    def test_batch(self):
+        self.storage.save_tokens([TokenData(token=f"t{i}", quota=5) for i in range(10)])
+        assert len(self.storage.get_tokens([f"t{i}" for i in range(20)])) == 10
+        self.storage.add_quotas({"t0": -2, "t1": 3, "missing": 1})
+        assert self.storage.get_token("t0").r_quota == 3
+        assert self.storage.get_token("t1").r_quota == 8
+        assert not self.client.exists("pytokenx:token:missing")
+        assert sorted(self.storage.iter_tokens()) == sorted(f"t{i}" for i in range(10))
+
+    def test_delete_and_update(self):
+        self.storage.save_token(TokenData(token="t1"))
+        self.storage.delete_token("t1")
+        self.storage.delete_token("missing")
+        assert self.storage.get_token("t1").deleted_at is not None
+        assert 0 < self.client.ttl("pytokenx:token:t1") <= 60
+        assert not self.client.exists("pytokenx:token:missing")
+
+        token_data = TokenData(token="t2", token_type="a")
+        self.storage.save_token(token_data)
+        token_data.token_type = "b"
+        self.storage.update_token(token_data)
+        assert self.storage.get_token("t2").token_type == "b"
+        assert self.client.ttl("pytokenx:token:t2") == -1
+
+    def test_consume_quota(self):
+        self.storage.save_token(TokenData(token="t1", quota=2))
+        self.storage.save_token(TokenData(token="unlimited"))
+        self.storage.save_token(TokenData(token="expired", quota=2, expires_at=datetime.now() - timedelta(seconds=1)))
+        assert self.storage.consume_quota("t1", 2) is True
+        assert self.storage.consume_quota("t1", 1) is False
+        assert self.storage.consume_quota("unlimited", 1) is True
+        assert self.storage.consume_quota("expired", 1) is False
+        assert self.storage.consume_quota("missing", 1) is False
+        self.storage.add_quota("unlimited", -1)
+        assert self.storage.get_token("unlimited").r_quota == float("-inf")
+
+    def test_consume_quota_concurrent(self):
+        manager = TokenManager(self.storage)
+        token = manager.generate_token(quota=100)
+        passed = []
+
+        def worker():
+            for _ in range(50):
+                try:
+                    manager.validate_token(token)
+                    passed.append(1)
+                except TokenInvalidError:
+                    pass
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(passed) == 100
+        assert self.storage.get_token(token).r_quota == 0
@@ -0,0 +1,64 @@
+import pytest
+from datetime import datetime, timedelta, timezone
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import BinaryTokenSerializer, JSONTokenSerializer, TokenData
+from src.pytokenx.base import QUOTA_UNLIMITED
+from src.pytokenx.serializer import detect_serializer
+
+
+def make_tokens():
+    now = datetime.now()
+    return [
+        TokenData(token="plain"),
+        TokenData(
+            token="full",
+            token_type="api",
+            ext={"user_id": 1, "tags": ["a", "b"], "nested": {"x": None}},
+            created_at=now,
+            expires_at=now + timedelta(hours=1),
+            deleted_at=now + timedelta(minutes=1),
+            quota=10,
+            r_quota=3,
+        ),
+        TokenData(
+            token="utc",
+            created_at=datetime(2024, 1, 1, tzinfo=timezone(timedelta(hours=8))),
+            quota=QUOTA_UNLIMITED,
+        ),
+        TokenData(token="中文", token_type="类型"),
+    ]
+
+
+@pytest.mark.parametrize("serializer", [
+    JSONTokenSerializer(),
+    BinaryTokenSerializer(ext_codec="json"),
+    BinaryTokenSerializer(),
+])
+def test_roundtrip(serializer):
+    tokens = make_tokens()
+    loaded = serializer.loads(serializer.dumps(tokens))
+    assert list(loaded) == [t.token for t in tokens]
+    for t in tokens:
+        assert loaded[t.token].to_dict() == t.to_dict()
+    assert loaded["utc"].created_at.utcoffset() == timedelta(hours=8)
+    assert loaded["utc"].r_quota == QUOTA_UNLIMITED
+
+
+def test_detect_serializer():
+    tokens = make_tokens()
+    assert detect_serializer(BinaryTokenSerializer().dumps(tokens)).name == "binary"
+    assert detect_serializer(JSONTokenSerializer().dumps(tokens)).name == "json"
+
+
+def test_binary_is_smaller():
+    tokens = [TokenData(token=f"token_{i}", quota=100, ext={"user_id": i}) for i in range(100)]
+    assert len(BinaryTokenSerializer().dumps(tokens)) < len(JSONTokenSerializer().dumps(tokens)) / 2
+
+
+def test_unknown_ext_codec():
+    with pytest.raises(ValueError):
+        BinaryTokenSerializer(ext_codec="pickle")
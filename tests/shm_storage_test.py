@@ -0,0 +1,138 @@
+import pytest
+from datetime import datetime, timedelta
+import multiprocessing
+import os
+import shutil
+import sys
+
+pytest.importorskip("fcntl")
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import MmapTokenStorage, TokenData, TokenInvalidError, TokenManager
+from src.pytokenx.base import TokenConflictError
+from src.pytokenx.shm_storage import _EMPTY, _REMOVED
+
+TEST_DIR = "test_mmap_tokens"
+TEST_FILE = os.path.join(TEST_DIR, "tokens.shm")
+
+
+def consume_worker(token, n, results):
+    # 每个进程单独打开同一个文件
+    storage = MmapTokenStorage(TEST_FILE)
+    passed = sum(1 for _ in range(n) if storage.consume_quota(token, 1))
+    storage.close()
+    results.put(passed)
+
+
+class TestMmapTokenStorage:
+
+    def setup_method(self):
+        os.makedirs(TEST_DIR, exist_ok=True)
+        self.storage = MmapTokenStorage(TEST_FILE, capacity=64)
+
+    def teardown_method(self):
+        self.storage.close()
+        shutil.rmtree(TEST_DIR)
+
+    def test_save_and_get_token(self):
+        token_data = TokenData(
+            token="test_token",
+            token_type="test",
+            ext={"user_id": "u1"},
+            expires_at=datetime.now() + timedelta(hours=1),
+            quota=10,
+        )
+        self.storage.save_token(token_data)
+        assert self.storage.get_token("test_token") == token_data
+        assert self.storage.get_token("missing") is None
+        with pytest.raises(TokenConflictError):
+            self.storage.save_token(token_data)
+        with pytest.raises(ValueError):
+            self.storage.save_token(TokenData(token="big", ext={"data": "x" * 300}))
+
+        # 重新打开时使用文件中的参数
+        other = MmapTokenStorage(TEST_FILE, capacity=1)
+        assert other.capacity == 64
+        assert other.get_token("test_token") == token_data
+        other.close()
+
+    def test_update_delete_quota(self):
+        self.storage.save_tokens([TokenData(token=f"t{i}", quota=5) for i in range(10)])
+        assert len(self.storage.get_tokens([f"t{i}" for i in range(20)])) == 10
+        self.storage.add_quotas({"t0": -2, "missing": 1})
+        assert self.storage.get_token("t0").r_quota == 3
+
+        token_data = self.storage.get_token("t1")
+        token_data.token_type = "other"
+        token_data.ext = {"a": 1}
+        self.storage.update_token(token_data)
+        assert self.storage.get_token("t1") == token_data
+
+        self.storage.delete_token("t2")
+        assert self.storage.get_token("t2").deleted_at is not None
+        assert self.storage.consume_quota("t2", 1) is False
+        self.storage.save_token(TokenData(token="unlimited"))
+        assert self.storage.consume_quota("unlimited", 1) is True
+        assert self.storage.get_token("unlimited").r_quota == float("-inf")
+
+    def test_full_and_purge(self):
+        now = datetime.now()
+        self.storage.save_tokens([
+            TokenData(token=f"t{i}", expires_at=now - timedelta(minutes=1)) for i in range(64)
+        ])
+        with pytest.raises(RuntimeError):
+            self.storage.save_token(TokenData(token="extra"))
+        assert TokenManager(self.storage).purge_expired(batch_size=10) == 64
+        assert list(self.storage.iter_tokens()) == []
+        # 清理后的槽位可以复用
+        self.storage.save_tokens([TokenData(token=f"n{i}") for i in range(64)])
+        assert len(list(self.storage.iter_tokens())) == 64
+
+    def test_purge_leaves_no_tombstones(self):
+        now = datetime.now()
+        # 填满整个表, 一半过期
+        self.storage.save_tokens([
+            TokenData(token=f"t{i}", expires_at=now + timedelta(minutes=1 if i % 2 else -1)) for i in range(64)
+        ])
+        assert self.storage.purge_expired(now.timestamp(), 64) == 32
+        mm = self.storage._mm
+        assert all(mm[self.storage._offset(i)] != _REMOVED for i in range(64))
+        # 移动后的记录仍然可以查到和修改
+        assert len(self.storage.get_tokens([f"t{i}" for i in range(64)])) == 32
+        assert self.storage.consume_quota("t1", 1) is True
+        assert self.storage.get_token("missing") is None
+        # 未命中的查询遇到空槽位就结束
+        _, free = self.storage._find(b"missing")
+        assert mm[self.storage._offset(free)] == _EMPTY
+
+    def test_purge_in_batches_resumes(self):
+        now = datetime.now()
+        self.storage.save_tokens([
+            TokenData(token=f"t{i}", expires_at=now + timedelta(minutes=1 if i % 3 else -1)) for i in range(48)
+        ])
+        purged = [self.storage.purge_expired(now.timestamp(), 5) for _ in range(4)]
+        assert purged == [5, 5, 5, 1]
+        # 每批从上次停下的槽位继续
+        assert self.storage._purge_cursor != 0
+        mm = self.storage._mm
+        assert all(mm[self.storage._offset(i)] != _REMOVED for i in range(64))
+        assert len(self.storage.get_tokens([f"t{i}" for i in range(48)])) == 32
+        # 之后删除的token在下一轮被清理
+        self.storage.delete_token("t1")
+        assert self.storage.purge_expired(datetime.now().timestamp() + 1, 100) == 1
+        assert self.storage.get_token("t1") is None
+
+    def test_multiprocess_consume(self):
+        manager = TokenManager(self.storage)
+        token = manager.generate_token(quota=200)
+        ctx = multiprocessing.get_context("fork")
+        results = ctx.Queue()
+        processes = [ctx.Process(target=consume_worker, args=(token, 100, results)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        assert sum(results.get() for _ in processes) == 200
+        assert self.storage.get_token(token).r_quota == 0
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token(token)
@@ -0,0 +1,119 @@
+import pytest
+import asyncio
+from datetime import timedelta
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import (
+    AsyncTokenManager,
+    MemoryTokenStorage,
+    SyncStorageAdapter,
+    TokenInvalidError,
+    TokenManager,
+    TokenSigner,
+)
+
+
+class CountingStorage(MemoryTokenStorage):
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def get_token(self, token):
+        self.lookups += 1
+        return super().get_token(token)
+
+
+class TestTokenSigner:
+
+    def test_sign_and_verify(self):
+        signer = TokenSigner({"k1": b"secret1"})
+        manager = TokenManager(MemoryTokenStorage(), signer=signer)
+        token = manager.generate_token(token_type="api", user_id="u1")
+        claims = signer.verify(token)
+        assert claims["t"] == "api" and claims["x"] == {"user_id": "u1"}
+        assert token.startswith("k1.")
+        # 篡改payload或签名
+        kid, payload, sig = token.split(".")
+        assert signer.verify(f"{kid}.{payload}x.{sig}") is None
+        assert signer.verify(f"{kid}.{payload}.{sig[:-2]}") is None
+        assert signer.verify("garbage") is None
+        # 非ASCII字符
+        assert signer.verify(f"{kid}.{payload}é.{sig}") is None
+        assert signer.verify(f"{kid}.{payload}.{sig[:-1]}é") is None
+        for bad in (f"{kid}.é.{sig}", f"{kid}.{payload}.é"):
+            with pytest.raises(TokenInvalidError):
+                manager.validate_token(bad, token_type="api")
+
+    def test_rotation(self):
+        signer = TokenSigner({"k1": b"secret1"})
+        manager = TokenManager(MemoryTokenStorage(), signer=signer)
+        old_token = manager.generate_token()
+        signer.rotate("k2", b"secret2")
+        new_token = manager.generate_token()
+        assert new_token.startswith("k2.")
+        manager.validate_token(old_token)
+        manager.validate_token(new_token)
+
+        signer.retire("k1")
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token(old_token)
+        with pytest.raises(ValueError):
+            signer.retire("k2")
+
+
+class TestSignedTokenManager:
+
+    def setup_method(self):
+        self.storage = CountingStorage()
+        self.manager = TokenManager(self.storage, signer=TokenSigner({"k1": b"secret"}), revocation_ttl=None)
+
+    def test_validate_without_storage(self):
+        token = self.manager.generate_token(token_type="api", expiry=timedelta(hours=1), user_id="u1")
+        token_data = self.manager.validate_token(token, token_type="api")
+        assert token_data.ext == {"user_id": "u1"}
+        assert token_data.expires_ts == pytest.approx(time.time() + 3600, abs=5)
+        with pytest.raises(TokenInvalidError):
+            self.manager.validate_token(token, token_type="default")
+        assert self.storage.lookups == 0
+        assert self.manager.get_current_token() == token
+
+    def test_expired(self):
+        token = self.manager.generate_token(expiry=timedelta(seconds=-1))
+        with pytest.raises(TokenInvalidError, match="expired"):
+            self.manager.validate_token(token)
+        assert self.storage.lookups == 0
+
+    def test_quota_uses_storage(self):
+        tokens = self.manager.generate_tokens(2, quota=1)
+        self.manager.validate_token(tokens[0])
+        with pytest.raises(TokenInvalidError):
+            self.manager.validate_token(tokens[0])
+        assert self.storage.lookups == 2
+        results = self.manager.validate_tokens(tokens + ["garbage"])
+        assert [isinstance(r, TokenInvalidError) for r in results] == [True, False, True]
+
+    def test_revocation(self):
+        manager = TokenManager(self.storage, signer=TokenSigner({"k1": b"secret"}), revocation_ttl=60)
+        token = manager.generate_token()
+        manager.validate_token(token)
+        manager.validate_token(token)
+        # 吊销状态被缓存
+        assert self.storage.lookups == 1
+        manager.delete_token(token)
+        with pytest.raises(TokenInvalidError):
+            manager.validate_token(token)
+
+    def test_async(self):
+        async def run():
+            manager = AsyncTokenManager(SyncStorageAdapter(self.storage), signer=TokenSigner({"k1": b"secret"}))
+            token = await manager.generate_token(user_id="u1")
+            assert (await manager.validate_token(token)).ext == {"user_id": "u1"}
+            await manager.delete_token(token)
+            with pytest.raises(TokenInvalidError):
+                await manager.validate_token(token)
+
+        asyncio.run(run())
@@ -67,3 +67,183 @@ class TestSQLAlchemyTokenStorage:
 
         assert self.storage.get_token("test_add_quota").r_quota == 20
 
+    def test_save_and_get_tokens(self):
+        token_data_list = [
+            TokenData(token=f"test_batch_{i}", token_type="test", ext={"i": i}, quota=i)
+            for i in range(10)
+        ]
+        self.storage.save_tokens(token_data_list)
+        result = self.storage.get_tokens([f"test_batch_{i}" for i in range(12)])
+
+        assert len(result) == 10
+        assert result["test_batch_3"].ext == {"i": 3}
+        assert result["test_batch_3"].r_quota == 3
+
+    def test_add_quotas(self):
+        self.storage.save_tokens([
+            TokenData(token="test_add_quotas_1", quota=10),
+            TokenData(token="test_add_quotas_2", quota=10),
+        ])
+        self.storage.add_quotas({"test_add_quotas_1": -3, "test_add_quotas_2": 5})
+
+        assert self.storage.get_token("test_add_quotas_1").r_quota == 7
+        assert self.storage.get_token("test_add_quotas_2").r_quota == 15
+
+    def test_consume_quota(self):
+        self.storage.save_tokens([
+            TokenData(token="test_consume_1", quota=3),
+            TokenData(token="test_consume_2", quota=3, expires_at=datetime.now() - timedelta(seconds=1)),
+            TokenData(token="test_consume_3", quota=3, deleted_at=datetime.now()),
+        ])
+        assert self.storage.consume_quota("test_consume_1", 2) is True
+        assert self.storage.consume_quota("test_consume_1", 2) is False
+        assert self.storage.get_token("test_consume_1").r_quota == 1
+        assert self.storage.consume_quota("test_consume_2", 1) is False
+        assert self.storage.consume_quota("test_consume_3", 1) is False
+        assert self.storage.consume_quota("missing", 1) is False
+
+    def test_consume_quotas(self):
+        self.storage.save_tokens([
+            TokenData(token="test_consumes_1", quota=3),
+            TokenData(token="test_consumes_2", quota=1),
+        ])
+        result = self.storage.consume_quotas({"test_consumes_1": 2, "test_consumes_2": 2, "missing": 1})
+        assert result == {"test_consumes_1": True, "test_consumes_2": False, "missing": False}
+        assert self.storage.get_token("test_consumes_1").r_quota == 1
+        assert self.storage.get_token("test_consumes_2").r_quota == 1
+
+    def test_consume_quota_concurrent(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from src.pytokenx import TokenManager, TokenInvalidError
+
+        manager = TokenManager(self.storage)
+        token = manager.generate_token(quota=10)
+
+        def validate(_):
+            try:
+                manager.validate_token(token)
+                return True
+            except TokenInvalidError:
+                return False
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(validate, range(40)))
+        assert sum(results) == 10
+        assert self.storage.get_token(token).r_quota == 0
+
+    def test_update_token(self):
+        self.storage.save_token(TokenData(token="test_update", token_type="test", quota=10))
+        token_data = self.storage.get_token("test_update")
+        token_data.token_type = "other"
+        token_data.ext = {"user_id": "u1"}
+        token_data.r_quota = 3
+        self.storage.update_token(token_data)
+
+        retrieved_data = self.storage.get_token("test_update")
+        assert retrieved_data.token_type == "other"
+        assert retrieved_data.ext == {"user_id": "u1"}
+        assert retrieved_data.r_quota == 3
+
+
+class TestSQLAlchemyTokenStorageEngine:
+
+    def test_existing_engine(self):
+        from sqlalchemy import create_engine
+
+        engine = create_engine("sqlite://")
+        storage = SQLAlchemyTokenStorage(engine=engine)
+        storage.save_token(TokenData(token="t1"))
+        storage.close()
+        # 外部传入的Engine不会被dispose
+        assert SQLAlchemyTokenStorage(engine=engine).get_token("t1") is not None
+        engine.dispose()
+
+    def test_pool_options(self):
+        path = "test_pool_tokens.db"
+        storage = SQLAlchemyTokenStorage(
+            f"sqlite:///{path}", pool_size=2, max_overflow=1, pool_pre_ping=True, pool_recycle=60
+        )
+        try:
+            assert storage.engine.pool.size() == 2
+            storage.save_token(TokenData(token="t1"))
+            assert storage.get_token("t1") is not None
+        finally:
+            storage.close()
+            os.remove(path)
+
+    def test_purge_expired(self):
+        storage = SQLAlchemyTokenStorage("sqlite://")
+        now = datetime.now()
+        storage.save_tokens([TokenData(token=f"e{i}", expires_at=now - timedelta(minutes=1)) for i in range(5)])
+        storage.save_tokens([TokenData(token="active", expires_at=now + timedelta(hours=1)), TokenData(token="d")])
+        storage.delete_token("d")
+
+        assert storage.purge_expired(time.time(), 4) == 4
+        assert storage.purge_expired(time.time(), 4) == 2
+        assert list(storage.get_tokens(["e4", "d", "active"])) == ["active"]
+        storage.close()
+
+    def test_iter_tokens(self):
+        storage = SQLAlchemyTokenStorage("sqlite://")
+        storage.save_tokens([TokenData(token=f"t{i}") for i in range(1200)])
+        assert sorted(storage.iter_tokens()) == sorted(f"t{i}" for i in range(1200))
+        storage.close()
+
+    def test_indexes_added_to_existing_table(self):
+        from sqlalchemy import create_engine, inspect, text
+
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE tokens (id INTEGER PRIMARY KEY, token VARCHAR(100) NOT NULL UNIQUE, "
+                "token_type VARCHAR(20) NOT NULL, ext JSON, created_at DATETIME NOT NULL, "
+                "expires_at DATETIME, deleted_at DATETIME, quota INTEGER NOT NULL, r_quota INTEGER NOT NULL)"
+            ))
+        SQLAlchemyTokenStorage(engine=engine)
+        indexed = {tuple(i["column_names"]) for i in inspect(engine).get_indexes("tokens")}
+        assert ("expires_at",) in indexed and ("deleted_at",) in indexed
+        engine.dispose()
+
+    def test_requires_connection(self):
+        with pytest.raises(ValueError):
+            SQLAlchemyTokenStorage()
+
+
+class TestTokenFieldMapping:
+
+    def test_model_round_trip(self):
+        from src.pytokenx.sqlalchemy_storage import TokenModel
+
+        token_data = TokenData(
+            token="t1", token_type="test", ext={"a": 1}, expires_at=datetime.now(), quota=5, r_quota=3
+        )
+        assert TokenModel.from_token_data(token_data).to_token_data() == token_data
+
+    def test_missing_columns_use_ext(self):
+        from sqlalchemy import Column, DateTime, Integer, JSON, MetaData, String, Table
+        from src.pytokenx.sqlalchemy_storage import TokenFieldMapping
+
+        table = Table(
+            "partial_tokens", MetaData(),
+            Column("token", String(100)),
+            Column("token_type", String(20)),
+            Column("ext", JSON),
+            Column("created_at", DateTime),
+            Column("quota", Integer),
+            Column("r_quota", Integer),
+        )
+        mapping = TokenFieldMapping(table)
+        assert mapping.ext_fields == ("expires_at", "deleted_at", "quota_period", "quota_window")
+
+        expires_at = datetime.now() + timedelta(hours=1)
+        token_data = TokenData(token="t1", ext={"a": 1}, expires_at=expires_at)
+        row = mapping.to_row(token_data)
+        assert row["ext"] == {
+            "a": 1, "expires_at": expires_at.isoformat(), "deleted_at": None, "quota_period": None, "quota_window": None,
+        }
+        assert token_data.ext == {"a": 1}
+
+        restored = mapping.from_values([row[name] for name in mapping.column_fields])
+        assert restored.token == "t1"
+        assert restored.expires_at == expires_at
+
@@ -0,0 +1,87 @@
+import pytest
+from datetime import datetime, timedelta
+import os
+import shutil
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import SQLiteTokenStorage, TokenData, TokenInvalidError, TokenManager
+from src.pytokenx.base import TokenConflictError
+
+
+class TestSQLiteTokenStorage:
+
+    def setup_method(self):
+        self.test_dir = "test_sqlite_tokens"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.path = os.path.join(self.test_dir, "tokens.db")
+        self.storage = SQLiteTokenStorage(self.path)
+
+    def teardown_method(self):
+        self.storage.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_wal_mode(self):
+        assert self.storage._conn().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert self.storage._conn().execute("PRAGMA synchronous").fetchone()[0] == 1
+
+    def test_save_and_get_token(self):
+        token_data = TokenData(
+            token="test_token",
+            token_type="test",
+            ext={"user_id": "u1"},
+            expires_at=datetime.now() + timedelta(hours=1),
+        )
+        self.storage.save_token(token_data)
+        assert self.storage.get_token("test_token") == token_data
+        assert self.storage.get_token("test_token").quota == float("-inf")
+        assert self.storage.get_token("missing") is None
+        with pytest.raises(TokenConflictError):
+            self.storage.save_token(token_data)
+
+    def test_batch(self):
+        self.storage.save_tokens([TokenData(token=f"t{i}", quota=5) for i in range(1200)])
+        assert len(self.storage.get_tokens([f"t{i}" for i in range(1500)])) == 1200
+        self.storage.add_quotas({"t0": -2, "t1": 3})
+        assert self.storage.get_token("t0").r_quota == 3
+        assert self.storage.get_token("t1").r_quota == 8
+        assert len(list(self.storage.iter_tokens())) == 1200
+
+    def test_delete_update_purge(self):
+        self.storage.save_token(TokenData(token="t1"))
+        self.storage.save_token(TokenData(token="t2", expires_at=datetime.now() - timedelta(minutes=1)))
+        self.storage.delete_token("t1")
+        assert self.storage.get_token("t1").deleted_at is not None
+
+        token_data = self.storage.get_token("t2")
+        token_data.token_type = "other"
+        self.storage.update_token(token_data)
+        assert self.storage.get_token("t2").token_type == "other"
+
+        assert self.storage.purge_expired(time.time(), 1) == 1
+        assert self.storage.purge_expired(time.time(), 10) == 1
+        assert self.storage.get_tokens(["t1", "t2"]) == {}
+
+    def test_consume_quota_concurrent(self):
+        manager = TokenManager(self.storage)
+        token = manager.generate_token(quota=100)
+        passed = []
+
+        def worker():
+            for _ in range(50):
+                try:
+                    manager.validate_token(token)
+                    passed.append(1)
+                except TokenInvalidError:
+                    pass
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(passed) == 100
+        assert self.storage.get_token(token).r_quota == 0
@@ -0,0 +1,116 @@
+import pytest
+from collections import Counter
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import (
+    AlphabetTokenGenerator,
+    Base64TokenGenerator,
+    ChecksumTokenGenerator,
+    MemoryTokenStorage,
+    TokenInvalidError,
+    TokenManager,
+)
+from src.pytokenx.token_generator import BASE62, URLSAFE_BASE64
+
+
+class TestTokenGenerator:
+
+    def test_alphabet(self):
+        tokens = AlphabetTokenGenerator().generate_many(100, 64)
+        assert len(set(tokens)) == 100
+        assert all(len(t) == 64 and set(t) <= set(BASE62) for t in tokens)
+
+    def test_uniform(self):
+        # 字母表大小不能整除256时, 拒绝采样保证每个字符等概率
+        counts = Counter(AlphabetTokenGenerator("abc").generate(90000))
+        assert all(abs(c - 30000) < 1000 for c in counts.values())
+
+    def test_base64(self):
+        generator = Base64TokenGenerator()
+        for length in (1, 10, 16, 17, 43):
+            tokens = generator.generate_many(20, length)
+            assert all(len(t) == length and set(t) <= set(URLSAFE_BASE64) for t in tokens)
+
+    def test_prefix_and_pool(self):
+        generator = AlphabetTokenGenerator(prefix="tk_", pool_size=10)
+        tokens = {generator.generate(16) for _ in range(25)}
+        assert len(tokens) == 25
+        assert all(t.startswith("tk_") and len(t) == 19 for t in tokens)
+        assert len(generator._pool[(16, "default")]) == 5
+
+    def test_invalid_alphabet(self):
+        with pytest.raises(ValueError):
+            AlphabetTokenGenerator("aa")
+
+    def test_manager_generator(self):
+        manager = TokenManager(MemoryTokenStorage(), token_length=32,
+                               token_generator=Base64TokenGenerator(prefix="sk-"))
+        token = manager.generate_token()
+        tokens = manager.generate_tokens(10)
+        assert token.startswith("sk-") and len(token) == 35
+        assert all(t.startswith("sk-") for t in tokens)
+        manager.validate_token(tokens[0])
+
+
+class CountingStorage(MemoryTokenStorage):
+    def __init__(self):
+        super().__init__()
+        self.lookups = 0
+
+    def get_token(self, token):
+        self.lookups += 1
+        return super().get_token(token)
+
+    def get_tokens(self, tokens):
+        self.lookups += len(tokens)
+        return super().get_tokens(tokens)
+
+
+class TestChecksumTokenGenerator:
+
+    @pytest.mark.parametrize("secret", [None, b"secret"])
+    def test_check(self, secret):
+        generator = ChecksumTokenGenerator({"default": "tk", "api": "sk"}, secret=secret)
+        token = generator.generate(32, "api")
+        assert token.startswith("sk_") and len(token) == 3 + 32 + 6
+        assert generator.token_type_of(token) == "api"
+        assert generator.check(token, "api")
+        assert not generator.check(token, "default")
+        # 修改任意一个字符都无法通过校验
+        corrupted = token[:10] + ("a" if token[10] != "a" else "b") + token[11:]
+        assert generator.token_type_of(corrupted) is None
+        assert generator.token_type_of("garbage") is None
+        assert generator.token_type_of("sk_") is None
+        assert generator.token_type_of("tk_" + "a" * 16 + "é" * 6) is None
+
+    def test_hmac_secret(self):
+        token = ChecksumTokenGenerator(secret=b"k1").generate(16)
+        assert ChecksumTokenGenerator(secret=b"k1").check(token, "default")
+        assert not ChecksumTokenGenerator(secret=b"k2").check(token, "default")
+
+    def test_invalid_prefix(self):
+        with pytest.raises(ValueError):
+            ChecksumTokenGenerator({"default": "t_k"})
+        with pytest.raises(ValueError):
+            ChecksumTokenGenerator().generate(16, "unknown")
+
+    def test_reject_before_storage(self):
+        storage = CountingStorage()
+        manager = TokenManager(storage, token_generator=ChecksumTokenGenerator({"default": "tk", "api": "sk"}))
+        token = manager.generate_token(token_type="api")
+        tokens = manager.generate_tokens(3)
+        storage.lookups = 0
+
+        assert manager.validate_token(token, token_type="api").token == token
+        assert storage.lookups == 1
+        for bad in ("garbage", token[:-1] + "x", token, "tk_" + "a" * 16 + "é" * 6):
+            with pytest.raises(TokenInvalidError):
+                manager.validate_token(bad)
+        assert storage.lookups == 1
+
+        results = manager.validate_tokens(tokens + ["garbage", token])
+        assert [isinstance(r, TokenInvalidError) for r in results] == [False, False, False, True, True]
+        assert storage.lookups == 4
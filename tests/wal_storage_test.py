@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import WALFileTokenStorage, TokenData
+
+
+class TestWALFileTokenStorage:
+    def setup_method(self):
+        self.test_dir = "test_wal_tokens"
+        self.test_file = os.path.join(self.test_dir, "tokens.json")
+        self.storage = WALFileTokenStorage(self.test_file)
+
+    def teardown_method(self):
+        self.storage.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def reopen(self, **kwargs):
+        self.storage.close()
+        self.storage = WALFileTokenStorage(self.test_file, **kwargs)
+
+    def test_save_and_get_token(self):
+        token_data = TokenData(
+            token="test_token",
+            token_type="test",
+            created_at=datetime.utcnow(),
+            expires_at=datetime.utcnow() + timedelta(hours=1),
+        )
+        self.storage.save_token(token_data)
+        self.reopen()
+
+        retrieved_data = self.storage.get_token("test_token")
+        assert retrieved_data is not None
+        assert retrieved_data.token_type == "test"
+        assert retrieved_data.expires_at == token_data.expires_at
+
+    def test_replay_delete_and_quota(self):
+        self.storage.save_token(TokenData(token="t1", quota=10))
+        self.storage.save_token(TokenData(token="t2"))
+        self.storage.add_quota("t1", -3)
+        self.storage.add_quota("t1", -2)
+        self.storage.delete_token("t2")
+        self.reopen()
+
+        assert self.storage.get_token("t1").r_quota == 5
+        assert self.storage.get_token("t2").deleted_at is not None
+
+    def test_save_tokens(self):
+        self.storage.save_tokens([TokenData(token=f"t{i}") for i in range(10)])
+        self.reopen()
+        assert len(self.storage.get_tokens([f"t{i}" for i in range(20)])) == 10
+
+    def test_truncated_tail_is_ignored(self):
+        self.storage.save_token(TokenData(token="t1", quota=10))
+        self.storage.add_quota("t1", -1)
+        log_path = self.storage._log.name
+        self.storage.close()
+        with open(log_path, "a") as f:
+            f.write('["q","t1",')
+
+        self.storage = WALFileTokenStorage(self.test_file)
+        assert self.storage.get_token("t1").r_quota == 9
+
+    def test_writes_after_truncated_tail(self):
+        self.storage.save_token(TokenData(token="t1", quota=10))
+        log_path = self.storage._log.name
+        self.storage.close()
+        with open(log_path, "a") as f:
+            f.write('["q","t1",')
+
+        # 坏行之后追加的记录在下次启动时仍然能重放
+        self.storage = WALFileTokenStorage(self.test_file)
+        self.storage.add_quota("t1", -3)
+        self.storage.save_token(TokenData(token="t2"))
+        self.reopen()
+        assert self.storage.get_token("t1").r_quota == 7
+        assert self.storage.get_token("t2") is not None
+
+    def test_compact(self):
+        self.reopen(compact_threshold=256)
+        for i in range(20):
+            self.storage.save_token(TokenData(token=f"t{i}", quota=10))
+            self.storage.add_quota(f"t{i}", -i)
+        self.storage.compact()
+        self.storage.add_quota("t0", -1)
+        self.reopen()
+
+        assert len(self.storage.tokens) == 20
+        assert self.storage.get_token("t0").r_quota == 9
+        assert self.storage.get_token("t19").r_quota == -9
+        # 压缩后只剩下当前日志
+        assert len(self.storage._log_seqs()) == 1
@@ -0,0 +1,115 @@
+import pytest
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.pytokenx import TokenManager, TokenData, TokenStorage, TokenInvalidError, WriteBehindTokenStorage
+
+
+class CountingTokenStorage(TokenStorage):
+    def __init__(self):
+        self.tokens = {}
+        self.add_quota_calls = 0
+
+    def save_token(self, token_data: TokenData) -> None:
+        self.tokens[token_data.token] = token_data
+
+    def get_token(self, token: str) -> TokenData:
+        return self.tokens.get(token)
+
+    def delete_token(self, token: str) -> None:
+        self.tokens.pop(token, None)
+
+    def update_token(self, token_data: TokenData) -> None:
+        self.tokens[token_data.token] = token_data
+
+    def add_quota(self, token: str, quota_delta: int) -> None:
+        self.add_quota_calls += 1
+        if token in self.tokens:
+            self.tokens[token].r_quota += quota_delta
+
+
+class TestWriteBehindTokenStorage:
+    def setup_method(self):
+        self.backend = CountingTokenStorage()
+        self.storage = WriteBehindTokenStorage(
+            self.backend, flush_interval=60, flush_threshold=1000, max_pending=1000
+        )
+        self.manager = TokenManager(self.storage)
+
+    def teardown_method(self):
+        self.manager.close()
+
+    def test_coalesce_deductions(self):
+        token = self.manager.generate_token(quota=100)
+        for _ in range(10):
+            self.manager.validate_token(token)
+
+        assert self.backend.add_quota_calls == 0
+        assert self.backend.get_token(token).r_quota == 100
+        assert self.manager.get_token_data(token).r_quota == 90
+
+        self.storage.flush()
+        assert self.backend.add_quota_calls == 1
+        assert self.backend.get_token(token).r_quota == 90
+
+    def test_quota_exceeded_counts_pending(self):
+        token = self.manager.generate_token(quota=3)
+        for _ in range(3):
+            self.manager.validate_token(token)
+        with pytest.raises(TokenInvalidError):
+            self.manager.validate_token(token)
+
+    def test_max_pending_bounds_unflushed(self):
+        self.storage.max_pending = 5
+        token = self.manager.generate_token(quota=100)
+        for _ in range(12):
+            self.manager.validate_token(token)
+
+        assert self.backend.add_quota_calls == 2
+        assert self.storage.pending_quota(token) == -2
+        assert self.backend.get_token(token).r_quota == 90
+
+    def test_flush_threshold(self):
+        self.storage.flush_threshold = 4
+        tokens = [self.manager.generate_token(quota=10) for _ in range(2)]
+        for token in tokens * 2:
+            self.manager.validate_token(token)
+
+        assert self.backend.add_quota_calls == 2
+        assert all(self.backend.get_token(t).r_quota == 8 for t in tokens)
+
+    def test_flush_interval(self):
+        storage = WriteBehindTokenStorage(CountingTokenStorage(), flush_interval=0.05)
+        storage.save_token(TokenData(token="t1", quota=10))
+        storage.add_quota("t1", -1)
+        time.sleep(0.3)
+        assert storage.storage.get_token("t1").r_quota == 9
+        storage.close()
+
+    def test_update_token_releases_lock(self):
+        storage = self.storage
+        token = self.manager.generate_token(quota=10)
+        self.manager.validate_token(token)
+        locked = []
+
+        def update_token(token_data):
+            # 写入底层存储期间其他线程可以读写缓冲
+            locked.append(storage._lock.locked())
+            self.backend.tokens[token_data.token] = token_data
+
+        self.backend.update_token = update_token
+        token_data = self.manager.get_token_data(token)
+        token_data.ext = {"k": "v"}
+        self.manager.update_token(token_data)
+        assert locked == [False]
+        assert storage.pending_quota(token) == 0
+        assert self.manager.get_token_data(token).r_quota == 9
+
+    def test_close_drains(self):
+        token = self.manager.generate_token(quota=10)
+        self.manager.validate_token(token, cost_quota=4)
+        self.manager.close()
+        assert self.backend.get_token(token).r_quota == 6